@@ -0,0 +1,203 @@
+import os
+import json
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# ----------------------- IVF (inverted file) index -----------------------
+
+def _spherical_kmeans(x: np.ndarray, k: int, iters: int, seed: int = 0, block: int = 65536) -> np.ndarray:
+    """
+    k-means on unit vectors with cosine similarity (centroids re-normalized each step).
+    x: (n, dim) float32, rows L2-normalized. Returns (k, dim) float32 centroids.
+    """
+    rng = np.random.default_rng(seed)
+    n = x.shape[0]
+    k = min(k, n)
+    centroids = x[rng.choice(n, size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.empty(n, dtype=np.int64)
+        for i in range(0, n, block):
+            assign[i:i + block] = np.argmax(x[i:i + block] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # reseed empty clusters on random points
+            sums[empty] = x[rng.choice(n, size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Coarse quantizer over a _LocalNamespace's row space.
+      centroids.npy - (nlist, dim) trained with spherical k-means
+      ivf_assign.i32 - row -> list id (-1 = unassigned), memory-mapped like vectors.f32
+      ivf.json      - training state
+    Search scans only the rows of the `nprobe` lists closest to the query.
+    Until `train_size` vectors exist the namespace keeps using exact search.
+    Training is split so the owner can run the k-means outside its lock:
+    begin_training() under the lock, fit() without it, install() under it again.
+    """
+    def __init__(self, path: str, dim: int, capacity: int):
+        self.path = path
+        self.dim = dim
+        self.nlist = int(os.getenv("IVF_NLIST", 1024))
+        self.nprobe = int(os.getenv("IVF_NPROBE", 16))
+        self.train_size = int(os.getenv("IVF_TRAIN_SIZE", 20000))
+        self.kmeans_iters = int(os.getenv("IVF_KMEANS_ITERS", 20))
+        # retrain once the namespace has grown this many times past the training set
+        self.retrain_factor = float(os.getenv("IVF_RETRAIN_FACTOR", 4))
+
+        self.state_path = os.path.join(path, "ivf.json")
+        self.centroids_path = os.path.join(path, "centroids.npy")
+        self.assign_path = os.path.join(path, "ivf_assign.i32")
+
+        self.trained_on = 0
+        self.centroids: Optional[np.ndarray] = None
+        if os.path.exists(self.state_path) and os.path.exists(self.centroids_path):
+            with open(self.state_path) as f:
+                self.trained_on = json.load(f).get("trained_on", 0)
+            self.centroids = np.load(self.centroids_path)
+
+        # a fit() in progress: rows added meanwhile are routed again by install()
+        self.training = False
+        self._touched: set = set()
+        self._epoch = 0  # bumped by reset(): an older fit() is discarded
+
+        self.capacity = 0
+        self.assign = None
+        self.resize(capacity)
+        self._lists: List[List[int]] = []
+        self._arrays: List[Optional[np.ndarray]] = []
+        self._rebuild_lists()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def resize(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        if self.assign is not None:
+            self.assign.flush()
+            self.assign = None
+        on_disk = os.path.getsize(self.assign_path) // 4 if os.path.exists(self.assign_path) else 0
+        if on_disk < capacity:
+            with open(self.assign_path, "ab") as f:
+                f.truncate(capacity * 4)
+        self.capacity = os.path.getsize(self.assign_path) // 4
+        self.assign = np.memmap(self.assign_path, dtype=np.int32, mode="r+", shape=(self.capacity,))
+        # truncate() zero-fills; mark the new tail as unassigned
+        self.assign[on_disk:] = -1
+
+    def _rebuild_lists(self):
+        n_lists = len(self.centroids) if self.trained else 0
+        self._lists = [[] for _ in range(n_lists)]
+        self._arrays = [None] * n_lists
+        if not n_lists:
+            return
+        rows = np.flatnonzero(self.assign >= 0)
+        order = np.argsort(self.assign[rows], kind="stable")
+        rows = rows[order]
+        bounds = np.searchsorted(self.assign[rows], np.arange(n_lists + 1))
+        for l in range(n_lists):
+            self._lists[l] = rows[bounds[l]:bounds[l + 1]].tolist()
+
+    def _nearest(self, mat: np.ndarray) -> np.ndarray:
+        return np.argmax(mat @ self.centroids.T, axis=1)
+
+    @staticmethod
+    def _route(centroids: np.ndarray, vectors: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        out = np.empty(len(rows), dtype=np.int32)
+        for i in range(0, len(rows), 65536):
+            out[i:i + 65536] = np.argmax(np.asarray(vectors[rows[i:i + 65536]]) @ centroids.T, axis=1)
+        return out
+
+    def begin_training(self, live: np.ndarray) -> Optional[Tuple[int, np.ndarray]]:
+        """(epoch, live rows) to fit() on when the namespace is due for (re)training, else None."""
+        if self.training:
+            return None
+        n_live = int(live.sum())
+        if self.trained:
+            due = self.retrain_factor > 0 and n_live >= self.trained_on * self.retrain_factor
+        else:
+            due = n_live >= self.train_size
+        if not due:
+            return None
+        self.training = True
+        self._touched = set()
+        return self._epoch, np.flatnonzero(live)
+
+    def fit(self, vectors: np.ndarray, live_rows: np.ndarray, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Centroids from a sample of live rows and the list of every one of them; touches no state."""
+        rng = np.random.default_rng(seed)
+        nlist = min(self.nlist, len(live_rows))
+        sample_size = min(len(live_rows), nlist * 256)
+        sample = np.sort(rng.choice(live_rows, size=sample_size, replace=False))
+        centroids = _spherical_kmeans(np.asarray(vectors[sample]), nlist, self.kmeans_iters, seed)
+        return centroids, self._route(centroids, vectors, live_rows)
+
+    def install(self, epoch: int, centroids: np.ndarray, live_rows: np.ndarray, lists: np.ndarray,
+                vectors: np.ndarray, live: np.ndarray):
+        """Swap in a fit(): rows added or updated since begin_training() are routed again."""
+        self.training = False
+        if epoch != self._epoch:
+            return
+        keep = live[live_rows]
+        self.centroids = centroids
+        self.assign[:] = -1
+        self.assign[live_rows[keep]] = lists[keep]
+        touched = np.asarray(sorted(r for r in self._touched if r < len(live) and live[r]), dtype=np.int64)
+        if len(touched):
+            self.assign[touched] = self._route(centroids, vectors, touched)
+        self._touched = set()
+        self.trained_on = len(live_rows)
+        self.assign.flush()
+        np.save(self.centroids_path, self.centroids)
+        with open(self.state_path, "w") as f:
+            json.dump({"trained_on": self.trained_on, "nlist": len(self.centroids)}, f)
+        self._rebuild_lists()
+
+    def abort_training(self):
+        self.training = False
+        self._touched = set()
+
+    def add(self, rows: List[int], mat: np.ndarray):
+        """Incremental insert: route new/updated rows to their nearest list."""
+        if self.training:
+            self._touched.update(rows)
+        if not self.trained:
+            return
+        lists = self._nearest(mat)
+        self.assign[rows] = lists
+        self.assign.flush()
+        for row, l in zip(rows, lists.tolist()):
+            self._lists[l].append(row)
+            self._arrays[l] = None
+
+    def reset(self):
+        self._epoch += 1
+        self.assign[:] = -1
+        self.assign.flush()
+        self._rebuild_lists()
+
+    def _list_array(self, l: int) -> np.ndarray:
+        arr = self._arrays[l]
+        if arr is None:
+            arr = np.asarray(self._lists[l], dtype=np.int64)
+            # drop rows that were reassigned to another list, and duplicates left by row reuse
+            arr = np.unique(arr[self.assign[arr] == l])
+            self._lists[l] = arr.tolist()
+            self._arrays[l] = arr
+        return arr
+
+    def candidates(self, q: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        sims = self.centroids @ q
+        probes = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        arrays = [self._list_array(int(l)) for l in probes]
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
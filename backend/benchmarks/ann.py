@@ -0,0 +1,57 @@
+"""
+Recall@k vs latency of the IVF index against exact search on the local vector store.
+
+    python benchmarks/ann.py --n 200000 --dim 384 --nlist 1024 --nprobe 4 8 16 32 64
+    python benchmarks/ann.py --vectors data/index/upfund-rag/default/vectors.f32 --dim 3072
+
+Prints a table and writes the same numbers as JSON (--out).
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import vectors  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    vectors.add_arguments(ap, dim=384)
+    ap.add_argument("--nlist", type=int, default=1024)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    args = ap.parse_args()
+
+    x, queries = vectors.dataset(args)
+    os.environ["IVF_NLIST"] = str(args.nlist)
+    os.environ["IVF_TRAIN_SIZE"] = str(len(x))
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        flat = vectors.build(os.path.join(tmp, "flat"), x, LOCAL_INDEX_TYPE="flat")
+        flat_build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        ivf = vectors.build(os.path.join(tmp, "ivf"), x, LOCAL_INDEX_TYPE="ivf")
+        ivf_build = time.perf_counter() - t0
+
+        truth, flat_lat = vectors.run(flat, queries, args.k)
+        report = {
+            "n": len(x), "dim": x.shape[1], "k": args.k, "nlist": len(ivf.ann.centroids),
+            "build_s": {"flat": round(flat_build, 3), "ivf": round(ivf_build, 3)},
+            "exact": vectors.latency(flat_lat),
+            "ivf": [],
+        }
+        print(f"n={len(x)} dim={x.shape[1]} k={args.k} nlist={report['nlist']}")
+        print(f"exact            p50 {report['exact']['p50_ms']:8.3f} ms  p95 {report['exact']['p95_ms']:8.3f} ms")
+        for nprobe in args.nprobe:
+            got, lat = vectors.run(ivf, queries, args.k, nprobe=nprobe)
+            row = {"nprobe": nprobe, "recall": vectors.recall(got, truth), **vectors.latency(lat)}
+            report["ivf"].append(row)
+            print(f"ivf nprobe={nprobe:<4} p50 {row['p50_ms']:8.3f} ms  p95 {row['p95_ms']:8.3f} ms  "
+                  f"recall@{args.k} {row['recall']:.3f}")
+
+    vectors.write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Word chunker vs token chunker: throughput and chunk size in real tokens.
+
+    python benchmarks/chunking.py --words 1000000 --chunk-size 500 --overlap 50
+    python benchmarks/chunking.py --file ../data/docs/rapport.txt --tokens-per-word 1.3
+
+Word chunks are what CHUNKER=words produces; their token counts drift with the
+vocabulary, which is what CHUNKER=tokens avoids. Prints a table and writes the
+same numbers as JSON (--out).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunking import get_tokenizer, iter_token_chunks  # noqa: E402
+from rag_engine import chunk_words, iter_chunks, iter_words  # noqa: E402
+
+VOCAB = ("le la les des une dans pour avec investissement fonds capital rendement "
+         "risque société financement startup croissance valorisation actionnaires "
+         "trimestre 2023 2024 12,5% EUR. analyse, marché; évaluation: due-diligence").split()
+
+
+def synthetic(n_words: int, seed: int) -> str:
+    rng = random.Random(seed)
+    words = [rng.choice(VOCAB) for _ in range(n_words)]
+    for i in range(12, n_words, 17):
+        words[i] += "."
+    return " ".join(words)
+
+
+def blocks(text: str, size: int = 1 << 20):
+    # mimic iter_text_from_file: pieces cut on whitespace
+    start = 0
+    while start < len(text):
+        end = text.rfind(" ", start, start + size) if start + size < len(text) else len(text)
+        end = end if end > start else len(text)
+        yield text[start:end]
+        start = end
+
+
+def run(name: str, fn, text: str, repeat: int):
+    best, chunks = float("inf"), []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chunks = fn(text)
+        best = min(best, time.perf_counter() - t0)
+    enc = get_tokenizer()
+    sizes = [len(enc.encode(c, disallowed_special=())) for c in chunks]
+    return {
+        "chunker": name,
+        "seconds": round(best, 4),
+        "mb_per_s": round(len(text.encode("utf-8")) / 1e6 / best, 2),
+        "chunks": len(chunks),
+        "tokens_mean": round(statistics.mean(sizes), 1) if sizes else 0,
+        "tokens_min": min(sizes, default=0),
+        "tokens_max": max(sizes, default=0),
+        "tokens_stdev": round(statistics.pstdev(sizes), 1) if sizes else 0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", help="text file to chunk instead of synthetic text")
+    ap.add_argument("--words", type=int, default=300_000)
+    ap.add_argument("--chunk-size", type=int, default=500)
+    ap.add_argument("--overlap", type=int, default=50)
+    ap.add_argument("--tokens-per-word", type=float, default=1.3,
+                    help="scales the token chunker's window so both chunkers target the same size")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="chunking_bench.json")
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    else:
+        text = synthetic(args.words, args.seed)
+
+    t0 = time.perf_counter()
+    get_tokenizer()
+    load_s = time.perf_counter() - t0
+
+    size, overlap = args.chunk_size, args.overlap
+    tsize, toverlap = int(size * args.tokens_per_word), int(overlap * args.tokens_per_word)
+    rows = [
+        run("chunk_words", lambda t: chunk_words(t, size, overlap), text, args.repeat),
+        run("iter_chunks (streaming words)", lambda t: list(iter_chunks(iter_words(blocks(t)), size, overlap)), text, args.repeat),
+        run(f"iter_token_chunks ({tsize} tok)", lambda t: list(iter_token_chunks(blocks(t), tsize, toverlap)), text, args.repeat),
+    ]
+
+    print(f"{len(text) / 1e6:.1f} MB of text, tokenizer load {load_s * 1000:.0f} ms (once per process)")
+    print(f"{'chunker':<32}{'s':>8}{'MB/s':>8}{'chunks':>8}{'tok mean':>10}{'min':>6}{'max':>6}{'stdev':>7}")
+    for r in rows:
+        print(f"{r['chunker']:<32}{r['seconds']:>8.3f}{r['mb_per_s']:>8.1f}{r['chunks']:>8}"
+              f"{r['tokens_mean']:>10.1f}{r['tokens_min']:>6}{r['tokens_max']:>6}{r['tokens_stdev']:>7.1f}")
+
+    with open(args.out, "w") as f:
+        json.dump({"bytes": len(text.encode("utf-8")), "tokenizer_load_s": round(load_s, 4),
+                   "chunk_size": size, "overlap": overlap, "results": rows}, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
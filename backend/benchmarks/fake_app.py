@@ -0,0 +1,11 @@
+"""
+gunicorn entry point for load.py: main.app over the fake services of fakes.py,
+configured by the FAKE_* variables (fakes.export_env).
+
+    FAKE_EMBED_MS=20 gunicorn -c gunicorn.conf.py --pythonpath benchmarks fake_app:app
+"""
+import fakes
+
+fakes.install_from_env()
+
+from main import app  # noqa: E402,F401
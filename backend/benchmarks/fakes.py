@@ -0,0 +1,279 @@
+"""
+Deterministic stand-ins for OpenAI and Pinecone with injected latency, plus a
+synthetic PDF/DOCX/TXT corpus generator, for offline benchmarks.
+
+    import fakes
+    fakes.install(embed_ms=40, chat_ms=300, store_ms=15)   # before RAGEngine() / import main
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rag_engine  # noqa: E402
+from rag_engine import EmbeddingProvider, LLMProvider  # noqa: E402
+from vector_store import LocalVectorStore, QueryResult, VectorStore  # noqa: E402
+from embed_scheduler import MicroBatcher  # noqa: E402
+from metrics import QUERY_BATCH  # noqa: E402
+
+
+def _sleep_ms(ms: float):
+    if ms > 0:
+        time.sleep(ms / 1000.0)
+
+# ----------------------- services -----------------------
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """
+    Vectors seeded by the text's hash; each call costs call_ms + item_ms per text.
+    serial=True runs one call at a time, like a local model saturating the CPU.
+    """
+    def __init__(self, dim: int = 384, call_ms: float = 0.0, item_ms: float = 0.0, serial: bool = False):
+        self.provider = "fake"
+        self._sbert = None
+        self._openai = None
+        self.cache = rag_engine.open_embedding_cache()
+        self._dim = dim
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+        self.calls = 0
+        self.serial = threading.Lock() if serial else None
+        # batched like the SBERT provider, so QUERY_BATCH_* can be benchmarked
+        self.query_batcher = None
+        if int(os.getenv("QUERY_BATCH_MAX_SIZE", 32)) > 1:
+            self.query_batcher = MicroBatcher(self.embed, on_batch=lambda n: QUERY_BATCH.observe(n))
+
+    @property
+    def model_name(self) -> str:
+        return f"fake-{self._dim}"
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def warmup(self, load_only: bool = False):
+        pass
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.serial is not None:
+            with self.serial:
+                _sleep_ms(self.call_ms + self.item_ms * len(texts))
+        else:
+            _sleep_ms(self.call_ms + self.item_ms * len(texts))
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha1(t.encode("utf-8")).digest()[:8], "little")
+            out[i] = np.random.default_rng(seed).standard_normal(self._dim)
+        out /= np.linalg.norm(out, axis=1, keepdims=True)
+        return out.tolist()
+
+
+class FakeLLMProvider(LLMProvider):
+    """Extractive answer of `answer_tokens` words: first_token_ms, then token_ms per word."""
+    def __init__(self, first_token_ms: float = 0.0, token_ms: float = 0.0, answer_tokens: int = 60):
+        super().__init__()
+        self.provider = "fake"
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.answer_tokens = answer_tokens
+
+    def _words(self, question: str, contexts: List[str]) -> List[str]:
+        words = " ".join(contexts).split()[:self.answer_tokens]
+        return words or ["?"]
+
+    def answer(self, question: str, contexts: List[str]) -> str:
+        words = self._words(question, contexts)
+        _sleep_ms(self.first_token_ms + self.token_ms * len(words))
+        return " ".join(words)
+
+    def answer_stream(self, question: str, contexts: List[str]) -> Iterator[str]:
+        _sleep_ms(self.first_token_ms)
+        for i, w in enumerate(self._words(question, contexts)):
+            _sleep_ms(self.token_ms)
+            yield w if i == 0 else " " + w
+
+
+class FakeVectorStore(VectorStore):
+    """LocalVectorStore in a temporary directory behind a fixed per-request latency (a remote index)."""
+    def __init__(self, dim: int, request_ms: float = 0.0, root: Optional[str] = None):
+        self.root = root or tempfile.mkdtemp(prefix="fake-store-")
+        os.environ["LOCAL_INDEX_DIR"] = self.root
+        self.store = LocalVectorStore(dim)
+        self.name = "fake-" + self.store.name
+        self.request_ms = request_ms
+        self.requests = 0
+
+    def _call(self):
+        self.requests += 1
+        _sleep_ms(self.request_ms)
+
+    def upsert(self, vectors: List[Dict], namespace: str = "default"):
+        self._call()
+        return self.store.upsert(vectors, namespace)
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool = True,
+              include_values: bool = False, namespace: str = "default") -> QueryResult:
+        self._call()
+        return self.store.query(vector, top_k, include_metadata, include_values, namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = "default"):
+        self._call()
+        return self.store.delete(ids=ids, delete_all=delete_all, namespace=namespace)
+
+    def fetch(self, ids: List[str], namespace: str = "default"):
+        self._call()
+        return self.store.fetch(ids, namespace)
+
+    def scan(self, namespace: str = "default", batch: int = 1000):
+        for matches in self.store.scan(namespace, batch):
+            self._call()
+            yield matches
+
+    def warmup(self, namespace: str = "default"):
+        self._call()
+        return self.store.warmup(namespace)
+
+    def refresh(self, namespace: str = "default"):
+        self.store.refresh(namespace)
+
+    def after_fork(self):
+        self.store.after_fork()
+
+
+def install(dim: int = 384, embed_ms: float = 0.0, embed_item_ms: float = 0.0,
+            chat_ms: float = 0.0, token_ms: float = 0.0, store_ms: float = 0.0, embed_serial: bool = False,
+            store_root: Optional[str] = None):
+    """
+    Make every RAGEngine created from now on use the fakes. store_root: where the
+    fake vector store keeps its data (default: a new temporary directory per
+    store), to share one index between processes.
+    """
+    rag_engine.EmbeddingProvider = lambda: FakeEmbeddingProvider(dim, embed_ms, embed_item_ms, embed_serial)
+    rag_engine.LLMProvider = lambda: FakeLLMProvider(chat_ms, token_ms)
+    rag_engine.make_vector_store = lambda d: FakeVectorStore(d, store_ms, store_root)
+
+
+def install_from_env():
+    """install() with the FAKE_* variables set by export_env(), in a server process."""
+    env = os.environ
+    install(int(env.get("FAKE_DIM", 384)), float(env.get("FAKE_EMBED_MS", 0)), float(env.get("FAKE_EMBED_ITEM_MS", 0)),
+            float(env.get("FAKE_CHAT_MS", 0)), float(env.get("FAKE_TOKEN_MS", 0)), float(env.get("FAKE_STORE_MS", 0)),
+            env.get("FAKE_EMBED_SERIAL") == "1", env.get("FAKE_STORE_ROOT") or None)
+
+
+def export_env(dim: int = 384, embed_ms: float = 0.0, embed_item_ms: float = 0.0, chat_ms: float = 0.0,
+               token_ms: float = 0.0, store_ms: float = 0.0, embed_serial: bool = False, store_root: str = ""):
+    """The install() arguments as FAKE_* variables, for install_from_env() in child processes."""
+    os.environ.update({
+        "FAKE_DIM": str(dim), "FAKE_EMBED_MS": str(embed_ms), "FAKE_EMBED_ITEM_MS": str(embed_item_ms),
+        "FAKE_CHAT_MS": str(chat_ms), "FAKE_TOKEN_MS": str(token_ms), "FAKE_STORE_MS": str(store_ms),
+        "FAKE_EMBED_SERIAL": "1" if embed_serial else "0", "FAKE_STORE_ROOT": store_root,
+    })
+
+# ----------------------- synthetic corpus -----------------------
+
+VOCAB = ("fonds capital investissement rendement risque société financement startup croissance "
+         "valorisation actionnaires trimestre bilan levée dette obligation portefeuille stratégie "
+         "marché analyse évaluation gouvernance liquidité dividende participation souscription "
+         "rapport annuel assemblée conseil gestion performance secteur innovation").split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCAB) for _ in range(rng.randint(8, 20))]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), f"FR-{rng.randint(2015, 2025)}-{rng.randint(1, 999):03d}")
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraphs(rng: random.Random, words: int) -> List[str]:
+    paras, n = [], 0
+    while n < words:
+        para = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+        paras.append(para)
+        n += len(para.split())
+    return paras
+
+
+def _pdf_escape(s: str) -> str:
+    s = s.encode("latin-1", "replace").decode("latin-1")
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, paragraphs: List[str], lines_per_page: int = 45, width: int = 90):
+    """Minimal text PDF (Helvetica, one Tj per line) that pypdf can extract."""
+    lines: List[str] = []
+    for para in paragraphs:
+        line = ""
+        for w in para.split():
+            if len(line) + len(w) + 1 > width:
+                lines.append(line)
+                line = w
+            else:
+                line = f"{line} {w}" if line else w
+        lines.append(line)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page in pages:
+        body = "BT /F1 10 Tf 14 TL 50 800 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in page) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{body}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path: str, paragraphs: List[str]):
+    import docx
+    d = docx.Document()
+    for para in paragraphs:
+        d.add_paragraph(para)
+    d.save(path)
+
+
+def make_corpus(root: str, files: int, words_per_file: int, kinds=("pdf", "docx", "txt"), seed: int = 0) -> Dict:
+    """files documents of ~words_per_file words, cycling through `kinds`. Returns counts per kind."""
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    counts: Dict[str, int] = {k: 0 for k in kinds}
+    for i in range(files):
+        kind = kinds[i % len(kinds)]
+        paras = _paragraphs(rng, words_per_file)
+        path = os.path.join(root, f"doc_{i:05d}.{kind}")
+        if kind == "pdf":
+            write_pdf(path, paras)
+        elif kind == "docx":
+            write_docx(path, paras)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(paras))
+        counts[kind] += 1
+    return counts
+
+
+def sample_questions(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCAB) for _ in range(rng.randint(3, 7))) + " ?" for _ in range(n)]
@@ -0,0 +1,196 @@
+"""
+Multi-worker load test: the API under gunicorn (gunicorn.conf.py, preloaded
+engine) with 1, 2, 4... worker processes, /ask requests over HTTP keep-alive
+from concurrent clients, fake services (fakes.py) so it runs offline.
+
+    python benchmarks/load.py --workers 1 2 4 --concurrency 32 --requests 800 --out load.json
+    python benchmarks/load.py --embed-serial --embed-ms 15 --chat-ms 0 --token-ms 0
+
+For each worker count it reports req/s, p50/p95/p99 latency and the memory of
+master + workers: RSS counts shared pages once per process, PSS splits them, so
+PSS well below RSS is the model weights shared copy-on-write.
+--embed-serial makes the fake embedder run one call at a time per process, like
+SBERT holding a CPU core: that is the load extra workers spread over more cores.
+Requests/s only scale with workers up to the cores of the machine.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import argparse
+import tempfile
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+from suite import percentiles  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS and PSS of the gunicorn master and its workers, summed."""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        return {}
+    rss = pss = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            pass
+    return {"processes": len(pids), "rss_mb": round(rss / 1024, 1), "pss_mb": round(pss / 1024, 1)}
+
+
+def wait_ready(port: int, workers: int, timeout: float):
+    """Until /readyz answered 200 enough times in a row to have hit every worker, most likely."""
+    deadline = time.monotonic() + timeout
+    ok = 0
+    while ok < 4 * workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"not ready after {timeout}s")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/readyz")
+            ok = ok + 1 if conn.getresponse().status == 200 else 0
+            conn.close()
+        except OSError:
+            ok = 0
+        if not ok:
+            time.sleep(0.2)
+
+
+def load(port: int, questions, concurrency: int, k: int) -> dict:
+    """POST every question to /ask from `concurrency` clients, one keep-alive connection each."""
+    chunks = [questions[i::concurrency] for i in range(concurrency)]
+
+    def client(qs):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        out = []
+        for q in qs:
+            t0 = time.perf_counter()
+            conn.request("POST", "/ask", body=json.dumps({"question": q, "k": k}),
+                         headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            out.append(((time.perf_counter() - t0) * 1000, resp.status))
+        conn.close()
+        return out
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [r for rs in pool.map(client, chunks) for r in rs]
+    wall = time.perf_counter() - t0
+    errors = sum(1 for _, code in results if code != 200)
+    return {"requests": len(results), "errors": errors, "concurrency": concurrency, "wall_s": round(wall, 3),
+            "req_per_s": round(len(results) / wall, 2), **percentiles([ms for ms, _ in results])}
+
+
+def run_workers(workers: int, args) -> dict:
+    port = free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(args.threads),
+               GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_PRELOAD="0" if args.no_preload else "1")
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--pythonpath", "benchmarks", "fake_app:app"]
+    log = open(os.path.join(args.tmp, f"gunicorn_{workers}.log"), "w")
+    server = subprocess.Popen(cmd, cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        t0 = time.perf_counter()
+        wait_ready(port, workers, args.timeout)
+        ready_s = time.perf_counter() - t0
+        load(port, fakes.sample_questions(args.concurrency * 2, args.seed + 1), args.concurrency, args.k)  # warm
+        result = load(port, fakes.sample_questions(args.requests, args.seed), args.concurrency, args.k)
+        result.update(workers=workers, ready_s=round(ready_s, 2), memory=memory_mb(server.pid))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        log.close()
+    print(f"[{workers} workers] {result['req_per_s']} req/s  p50 {result.get('p50_ms')} ms  "
+          f"p95 {result.get('p95_ms')} ms  errors {result['errors']}  "
+          f"RSS {result['memory'].get('rss_mb')} MB / PSS {result['memory'].get('pss_mb')} MB")
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="gunicorn worker counts to compare")
+    ap.add_argument("--threads", type=int, default=8, help="GUNICORN_THREADS")
+    ap.add_argument("--no-preload", action="store_true", help="GUNICORN_PRELOAD=0: every worker loads the engine")
+    ap.add_argument("--files", type=int, default=30)
+    ap.add_argument("--words", type=int, default=2000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--embed-ms", type=float, default=20.0)
+    ap.add_argument("--embed-item-ms", type=float, default=0.0)
+    ap.add_argument("--embed-serial", action="store_true", help="one embedding call at a time per process")
+    ap.add_argument("--chat-ms", type=float, default=100.0)
+    ap.add_argument("--token-ms", type=float, default=0.0)
+    ap.add_argument("--store-ms", type=float, default=10.0)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=120.0, help="max seconds for the workers to be ready")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=str, default="load.json")
+    args = ap.parse_args()
+
+    args.tmp = tempfile.mkdtemp(prefix="rag-load-")
+    os.environ.update({
+        "VECTOR_STORE": "local",
+        "MANIFEST_DIR": os.path.join(args.tmp, "manifests"),
+        "EMBED_CACHE_PATH": "",
+        "CHUNK_STORE_DIR": os.path.join(args.tmp, "chunks"),
+        "LEXICAL_INDEX_DIR": os.path.join(args.tmp, "lexical"),
+        "DEDUP_INDEX_DIR": os.path.join(args.tmp, "dedup"),
+        "JOBS_DB": os.path.join(args.tmp, "jobs.sqlite"),
+        "QUERY_CACHE_SIZE": "0",
+        "ANSWER_CACHE_SIZE": "0",
+    })
+    fakes.export_env(args.dim, args.embed_ms, args.embed_item_ms, args.chat_ms, args.token_ms, args.store_ms,
+                     args.embed_serial, os.path.join(args.tmp, "store"))
+    try:
+        # one index, built here and served by every gunicorn run
+        fakes.install_from_env()
+        import rag_engine
+        corpus = os.path.join(args.tmp, "corpus")
+        fakes.make_corpus(corpus, args.files, args.words, ("txt",), args.seed)
+        rag_engine.RAGEngine().build_index(corpus, clear=True)
+
+        runs = [run_workers(n, args) for n in args.workers]
+    finally:
+        shutil.rmtree(args.tmp, ignore_errors=True)
+
+    base = runs[0]["req_per_s"]
+    for r in runs:
+        r["speedup"] = round(r["req_per_s"] / base, 2) if base else None
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "tmp")},
+        "runs": runs,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
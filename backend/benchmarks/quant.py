@@ -0,0 +1,62 @@
+"""
+Memory per vector, recall@k and latency of quantized local namespaces against
+exact float32 search.
+
+    python benchmarks/quant.py --n 200000 --dim 3072 --oversample 2 4 8 16
+    python benchmarks/quant.py --vectors data/index/upfund-rag/default/vectors.f32 --dim 3072
+
+"first pass" is what a query scans (and what should fit in RAM); vectors.f32 is
+only read for the rescored candidates. Quantization trades latency for memory:
+expect int8/binary p50 above float32 when the float32 matrix fits in RAM.
+Prints a table and writes the same numbers as JSON (--out).
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import vectors  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    vectors.add_arguments(ap, dim=1536)
+    ap.add_argument("--modes", nargs="+", default=["int8", "binary"])
+    ap.add_argument("--oversample", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = ap.parse_args()
+
+    x, queries = vectors.dataset(args)
+    n, dim = x.shape
+    with tempfile.TemporaryDirectory() as tmp:
+        exact = vectors.build(os.path.join(tmp, "none"), x, LOCAL_INDEX_TYPE="flat", LOCAL_QUANTIZATION="none")
+        truth, lat = vectors.run(exact, queries, args.k)
+        report = {
+            "n": n, "dim": dim, "k": args.k,
+            "exact": {"bytes_per_vector": 4 * dim, "first_pass_mb": round(4 * dim * n / 2**20, 1),
+                      **vectors.latency(lat)},
+            "quantized": [],
+        }
+        print(f"n={n} dim={dim} k={args.k}")
+        print(f"{'mode':<8}{'oversample':>11}{'B/vector':>10}{'first pass MB':>15}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+        e = report["exact"]
+        print(f"{'float32':<8}{'-':>11}{e['bytes_per_vector']:>10}{e['first_pass_mb']:>15.1f}{1.0:>8.3f}"
+              f"{e['p50_ms']:>9.3f}{e['p95_ms']:>9.3f}")
+        for mode in args.modes:
+            ns = vectors.build(os.path.join(tmp, mode), x, LOCAL_INDEX_TYPE="flat", LOCAL_QUANTIZATION=mode)
+            bpv = ns.quant.bytes_per_vector
+            for oversample in args.oversample:
+                ns.quant.oversample = oversample
+                got, lat = vectors.run(ns, queries, args.k)
+                row = {"mode": mode, "oversample": oversample, "bytes_per_vector": bpv,
+                       "first_pass_mb": round(bpv * n / 2**20, 1), "recall": vectors.recall(got, truth),
+                       **vectors.latency(lat)}
+                report["quantized"].append(row)
+                print(f"{mode:<8}{oversample:>11}{bpv:>10}{row['first_pass_mb']:>15.1f}{row['recall']:>8.3f}"
+                      f"{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}")
+
+    vectors.write_report(report, args.out)
+
+
+if __name__ == "__main__":
+    main()
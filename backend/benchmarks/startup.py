@@ -0,0 +1,89 @@
+"""
+API startup: time to import main (what gunicorn waits for before serving
+/livez) and time until /readyz turns 200 (engine warmup), each in a fresh
+interpreter, plus the slowest imports from `python -X importtime`.
+
+    python benchmarks/startup.py --runs 5 --out startup.json
+
+Uses the environment as is (EMBEDDINGS_PROVIDER, VECTOR_STORE...): run it with
+the settings of the deployment being measured.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+client = main.app.test_client()
+live = client.get("/livez").status_code
+ready = main.engine.ready.wait(timeout=%(timeout)s)
+t_ready = time.perf_counter() - t0
+print("STARTUP " + json.dumps({"import_s": t_import, "ready_s": t_ready if ready else None,
+                               "livez": live, "readyz": client.get("/readyz").status_code,
+                               "warmup_error": main.engine.warmup_error}))
+"""
+
+
+def probe(timeout: float) -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE % {"timeout": timeout}], cwd=BACKEND,
+                         capture_output=True, text=True, check=True).stdout
+    line = next(l for l in out.splitlines() if l.startswith("STARTUP "))
+    return json.JSONDecoder().raw_decode(line[len("STARTUP "):])[0]
+
+
+def slowest_imports(n: int) -> list:
+    """Top-level modules by cumulative import time (microseconds) for `import main`."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND,
+                         capture_output=True, text=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nesting is shown by indentation; keep modules imported directly by main
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+    return sorted(rows, key=lambda r: -r["cumulative_ms"])[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=300.0, help="max seconds to wait for readiness")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--out", type=str, default="startup.json")
+    args = ap.parse_args()
+
+    runs = [probe(args.timeout) for _ in range(args.runs)]
+    imports = [r["import_s"] for r in runs]
+    readies = [r["ready_s"] for r in runs if r["ready_s"] is not None]
+    report = {
+        "runs": runs,
+        "import_s": {"median": statistics.median(imports), "min": min(imports), "max": max(imports)},
+        "ready_s": {"median": statistics.median(readies), "min": min(readies), "max": max(readies)} if readies else None,
+        "slowest_imports": slowest_imports(args.top),
+    }
+
+    print(f"import main : median {report['import_s']['median']:.3f}s (min {min(imports):.3f}, max {max(imports):.3f})")
+    if readies:
+        print(f"ready       : median {report['ready_s']['median']:.3f}s")
+    else:
+        print(f"ready       : not ready within {args.timeout}s ({runs[-1]['warmup_error']})")
+    print(f"{'module':<32}{'cumulative ms':>14}")
+    for r in report["slowest_imports"]:
+        print(f"{r['module']:<32}{r['cumulative_ms']:>14.1f}")
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
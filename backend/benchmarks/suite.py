@@ -0,0 +1,179 @@
+"""
+End-to-end offline benchmark: ingestion throughput and /ask latency under
+concurrent load, with fake embedding / chat / vector-store services (see
+fakes.py) so runs are deterministic and need no keys or network.
+
+    python benchmarks/suite.py --sizes 30 150 600 --words 3000 --out bench.json
+    python benchmarks/suite.py --embed-ms 80 --chat-ms 600 --token-ms 0 --store-ms 25 --concurrency 16
+
+For each corpus size (number of files, cycling PDF / DOCX / TXT) it reports
+ingestion chunks/s and files/s with per-stage stats, /ask p50/p95/p99 latency
+and throughput through the Flask app, and RSS. Answer and query-embedding
+caches are off unless --caches, so every request does the full work.
+Diff two JSON reports to compare changes.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def percentiles(lat_ms) -> dict:
+    a = np.asarray(lat_ms)
+    if not len(a):
+        return {}
+    return {"p50_ms": round(float(np.percentile(a, 50)), 2), "p95_ms": round(float(np.percentile(a, 95)), 2),
+            "p99_ms": round(float(np.percentile(a, 99)), 2), "max_ms": round(float(a.max()), 2)}
+
+
+def load(app, path: str, questions, concurrency: int, k: int) -> dict:
+    """POST every question to `path` from `concurrency` threads; latency per request."""
+    def one(q):
+        client = app.test_client()
+        t0 = time.perf_counter()
+        r = client.post(path, json={"question": q, "k": k})
+        r.get_data()  # drain streamed responses
+        return (time.perf_counter() - t0) * 1000, r.status_code
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, questions))
+    wall = time.perf_counter() - t0
+    lat = [ms for ms, _ in results]
+    errors = sum(1 for _, code in results if code != 200)
+    return {"requests": len(results), "errors": errors, "concurrency": concurrency,
+            "wall_s": round(wall, 3), "req_per_s": round(len(results) / wall, 2), **percentiles(lat)}
+
+
+def run_size(main, size: int, args, tmp: str) -> dict:
+    corpus = os.path.join(tmp, f"corpus_{size}")
+    kinds = fakes.make_corpus(corpus, size, args.words, tuple(args.kinds), args.seed)
+
+    # fresh engine (fresh fake store, manifest, caches) for every size
+    main.engine = main.RAGEngine()
+    engine = main.engine
+    rss0 = rss_mb()
+    t0 = time.perf_counter()
+    report = engine.build_index(corpus, clear=True, workers=args.workers)
+    wall = time.perf_counter() - t0
+    chunks = report["stages"]["upsert"]["items"]
+    ingest = {
+        "wall_s": round(wall, 3),
+        "chunks": chunks,
+        "chunks_per_s": round(chunks / wall, 1) if wall else 0.0,
+        "files_per_s": round(size / wall, 2) if wall else 0.0,
+        "files": report["files"],
+        "stages": report["stages"],
+        "rss_mb": {"before": rss0, "after": rss_mb(), "peak": peak_rss_mb()},
+    }
+    print(f"[{size} files] ingest: {chunks} chunks in {wall:.2f}s ({ingest['chunks_per_s']} chunks/s)")
+
+    questions = fakes.sample_questions(args.requests, args.seed)
+    ask = load(main.app, "/ask", questions, args.concurrency, args.k)
+    ask["rss_mb"] = {"after": rss_mb(), "peak": peak_rss_mb()}
+    print(f"[{size} files] /ask: p50 {ask.get('p50_ms')} ms  p95 {ask.get('p95_ms')} ms  "
+          f"p99 {ask.get('p99_ms')} ms  {ask['req_per_s']} req/s  errors {ask['errors']}")
+    result = {"files": size, "kinds": kinds, "ingest": ingest, "ask": ask}
+    if args.stream:
+        stream = load(main.app, "/ask_stream", questions, args.concurrency, args.k)
+        print(f"[{size} files] /ask_stream: p50 {stream.get('p50_ms')} ms  p95 {stream.get('p95_ms')} ms")
+        result["ask_stream"] = stream
+    shutil.rmtree(corpus, ignore_errors=True)
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[30, 150, 600], help="corpus sizes, in files")
+    ap.add_argument("--words", type=int, default=3000, help="words per file")
+    ap.add_argument("--kinds", nargs="+", default=["pdf", "docx", "txt"])
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--embed-ms", type=float, default=50.0, help="latency per embedding request")
+    ap.add_argument("--embed-item-ms", type=float, default=0.2, help="extra latency per embedded text")
+    ap.add_argument("--embed-serial", action="store_true",
+                    help="one embedding call at a time, like SBERT on CPU (see QUERY_BATCH_MAX_SIZE)")
+    ap.add_argument("--chat-ms", type=float, default=400.0, help="time to first token")
+    ap.add_argument("--token-ms", type=float, default=2.0, help="per generated token")
+    ap.add_argument("--store-ms", type=float, default=20.0, help="latency per vector store request")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=1, help="parse processes during ingestion")
+    ap.add_argument("--stream", action="store_true", help="also load /ask_stream")
+    ap.add_argument("--caches", action="store_true", help="keep the /ask caches on")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=str, default="bench.json")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="rag-bench-")
+    # everything the engine persists goes to the temporary directory
+    os.environ.update({
+        "VECTOR_STORE": "local",
+        "LOCAL_INDEX_DIR": os.path.join(tmp, "index"),
+        "MANIFEST_DIR": os.path.join(tmp, "manifests"),
+        "EMBED_CACHE_PATH": "",
+        "CHUNK_STORE_DIR": os.path.join(tmp, "chunks"),
+        "LEXICAL_INDEX_DIR": os.path.join(tmp, "lexical"),
+        "DEDUP_INDEX_DIR": os.path.join(tmp, "dedup"),
+        "JOBS_DB": os.path.join(tmp, "jobs.sqlite"),
+    })
+    if not args.caches:
+        os.environ["QUERY_CACHE_SIZE"] = "0"
+        os.environ["ANSWER_CACHE_SIZE"] = "0"
+    fakes.install(args.dim, args.embed_ms, args.embed_item_ms, args.chat_ms, args.token_ms, args.store_ms,
+                  args.embed_serial)
+    import main as app_module  # creates the app (and a first engine) with the fakes in place
+
+    config = {k: v for k, v in vars(args).items() if k != "out"}
+    env = {k: v for k, v in os.environ.items()
+           if k.startswith(("CHUNK", "EMBED_", "PIPELINE_", "RETRIEVAL_", "CONTEXT_", "LOCAL_", "IVF_", "INGEST_", "QUERY_BATCH_"))}
+    runs = []
+    try:
+        for size in args.sizes:
+            runs.append(run_size(app_module, size, args, tmp))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "env": env,
+        "runs": runs,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Shared pieces of the local vector store benchmarks (ann.py, quant.py): the data
+set (synthetic or a real vectors.f32), building a namespace from it and timing
+queries against it.
+
+    import vectors
+    x, queries = vectors.dataset(args)
+    ns = vectors.build(path, x, LOCAL_INDEX_TYPE="ivf")
+    ids, lat_ms = vectors.run(ns, queries, k)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_store import _LocalNamespace  # noqa: E402
+
+
+def add_arguments(ap: argparse.ArgumentParser, dim: int):
+    """Data set and query options common to every vector benchmark."""
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=dim)
+    ap.add_argument("--vectors", type=str, default=None, help="raw float32 file (e.g. a namespace's vectors.f32)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=str, default=None, help="write JSON report here")
+
+
+def synthetic(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    # clustered data looks more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def load(path: str, n: int, dim: int) -> np.ndarray:
+    x = np.fromfile(path, dtype=np.float32).reshape(-1, dim)
+    x = x[np.linalg.norm(x, axis=1) > 0][:n]
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def dataset(args) -> Tuple[np.ndarray, np.ndarray]:
+    """Indexed vectors and queries (indexed rows plus a little noise) from add_arguments' options."""
+    x = load(args.vectors, args.n, args.dim) if args.vectors else synthetic(args.n, args.dim, 2000, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = x[rng.choice(len(x), size=args.queries, replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    return x, queries
+
+
+def build(path: str, x: np.ndarray, **env: str) -> _LocalNamespace:
+    """A namespace at `path` holding `x`, with the given LOCAL_* settings."""
+    os.environ.update(env)
+    ns = _LocalNamespace(path, x.shape[1])
+    for i in range(0, len(x), 1000):
+        ns.upsert([{"id": str(j), "values": x[j]} for j in range(i, min(i + 1000, len(x)))])
+    return ns
+
+
+def run(ns: _LocalNamespace, queries: np.ndarray, k: int, **kwargs) -> Tuple[List[Set[str]], np.ndarray]:
+    """Ids returned for each query and per-query latency in ms."""
+    ids, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        matches = ns.query(q, k, include_metadata=False, include_values=False, **kwargs)
+        lat.append(time.perf_counter() - t0)
+        ids.append({m.id for m in matches})
+    return ids, np.asarray(lat) * 1000
+
+
+def recall(got: List[Set[str]], truth: List[Set[str]]) -> float:
+    return float(np.mean([len(g & t) / max(1, len(t)) for g, t in zip(got, truth)]))
+
+
+def latency(lat: np.ndarray) -> Dict[str, float]:
+    return {"p50_ms": float(np.percentile(lat, 50)), "p95_ms": float(np.percentile(lat, 95))}
+
+
+def write_report(report: Dict, path: Optional[str]):
+    if path:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,132 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# ----------------------- LRU + TTL -----------------------
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time-to-live (ttl <= 0: no expiry)."""
+    def __init__(self, maxsize: int, ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and self.ttl > 0 and time.monotonic() - item[0] > self.ttl:
+                del self.data[key]
+                item = None
+            if item is None:
+                if count:
+                    self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = (time.monotonic(), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+# ----------------------- query / answer caches -----------------------
+
+def normalize_question(q: str) -> str:
+    return re.sub(r"\s+", " ", q).strip().strip("?!.;: ").lower()
+
+
+class QueryEmbeddingCache(LRUCache):
+    """question -> query embedding, skips the embedding call for repeated questions."""
+    def __init__(self):
+        super().__init__(int(os.getenv("QUERY_CACHE_SIZE", 1024)), float(os.getenv("QUERY_CACHE_TTL", 3600)))
+
+    def get_embedding(self, question: str) -> Optional[List[float]]:
+        return self.get(normalize_question(question))
+
+    def put_embedding(self, question: str, emb: List[float]):
+        self.put(normalize_question(question), emb)
+
+
+class AnswerCache:
+    """
+    Answers keyed by (normalized question, retrieved chunk ids, k).
+    With ANSWER_CACHE_SIMILARITY > 0, a differently worded question that retrieved
+    the very same chunks is also a hit when its query embedding's cosine similarity
+    to a cached question reaches the threshold.
+    """
+    def __init__(self):
+        size = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+        ttl = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+        self.threshold = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0))
+        self.exact = LRUCache(size, ttl)
+        # (chunk ids, k) -> [(unit query embedding, answer)], bounded like the exact cache
+        self.similar = LRUCache(size, ttl)
+        self.similar_hits = 0
+
+    @staticmethod
+    def _unit(emb: List[float]) -> np.ndarray:
+        v = np.asarray(emb, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def get(self, question: str, q_emb: List[float], ids: Tuple[str, ...], k: int) -> Optional[str]:
+        answer = self.exact.get((normalize_question(question), ids, k))
+        if answer is not None or self.threshold <= 0:
+            return answer
+        entries = self.similar.get((ids, k), count=False)
+        if entries:
+            q = self._unit(q_emb)
+            sims = np.stack([e for e, _ in entries]) @ q
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                with self.exact.lock:
+                    # the exact lookup already counted a miss
+                    self.exact.misses -= 1
+                    self.exact.hits += 1
+                    self.similar_hits += 1
+                return entries[best][1]
+        return None
+
+    def put(self, question: str, q_emb: List[float], ids: Tuple[str, ...], k: int, answer: str):
+        self.exact.put((normalize_question(question), ids, k), answer)
+        if self.threshold > 0:
+            entries = self.similar.get((ids, k), count=False) or []
+            self.similar.put((ids, k), (entries + [(self._unit(q_emb), answer)])[-8:])
+
+    def clear(self):
+        self.exact.clear()
+        self.similar.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        st = self.exact.stats()
+        st["similar_hits"] = self.similar_hits
+        st["similarity_threshold"] = self.threshold
+        return st
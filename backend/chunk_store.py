@@ -0,0 +1,56 @@
+import os
+import zlib
+import sqlite3
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# ----------------------- chunk texts -----------------------
+
+class ChunkStore:
+    """
+    Chunk texts keyed by vector id, zlib-compressed in SQLite, so vectors only
+    carry {"file", "chunk_id"} as metadata: smaller upserts, smaller query
+    responses and no metadata size limit on long chunks.
+    """
+    def __init__(self, path: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, text BLOB NOT NULL) WITHOUT ROWID")
+        self.db.commit()
+
+    def put_many(self, items: Sequence[Tuple[str, str]]):
+        if not items:
+            return
+        rows = [(vid, zlib.compress(text.encode("utf-8"), 1)) for vid, text in items]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO chunks (id, text) VALUES (?, ?)", rows)
+            self.db.commit()
+
+    def get_many(self, ids: Sequence[str]) -> Dict[str, str]:
+        found = {}
+        uniq = list(dict.fromkeys(ids))
+        with self.lock:
+            for i in range(0, len(uniq), 500):
+                part = uniq[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for vid, blob in self.db.execute(f"SELECT id, text FROM chunks WHERE id IN ({marks})", part):
+                    found[vid] = zlib.decompress(blob).decode("utf-8")
+        return found
+
+    def delete(self, ids: List[str]):
+        with self.lock:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                self.db.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(part))})", part)
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM chunks")
+            self.db.commit()
@@ -0,0 +1,79 @@
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List
+
+from embed_scheduler import estimate_tokens
+
+# ----------------------- tokenizer -----------------------
+
+@lru_cache(maxsize=None)
+def get_tokenizer(name: str = None):
+    """
+    tiktoken encoding (TOKENIZER_ENCODING, default cl100k_base: the one used by
+    the OpenAI embedding and chat models). Loading the BPE ranks is the slow part,
+    so it happens once per process.
+    """
+    import tiktoken
+    return tiktoken.get_encoding(name or os.getenv("TOKENIZER_ENCODING", "cl100k_base"))
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer().encode(text, disallowed_special=()))
+
+@lru_cache(maxsize=1)
+def token_counter() -> Callable[[str], int]:
+    """count_tokens, or the length-based estimate when the tokenizer cannot be loaded (e.g. offline)."""
+    try:
+        get_tokenizer()
+        return count_tokens
+    except Exception as e:
+        print(f"[WARN] tokenizer unavailable ({e}), estimating token counts from text length")
+        return estimate_tokens
+
+_SENTENCE_END = (b".", b"!", b"?", b";", b":")
+
+@lru_cache(maxsize=1 << 17)
+def _ends_sentence(token: int) -> bool:
+    return get_tokenizer().decode_single_token_bytes(token).rstrip().endswith(_SENTENCE_END)
+
+# ----------------------- token chunker -----------------------
+
+def _cut(tokens: List[int], max_tokens: int, overlap: int, min_fill: float) -> int:
+    """End of the next window: the last sentence end in its tail, else max_tokens."""
+    lo = max(overlap + 1, int(max_tokens * min_fill))
+    for i in range(max_tokens - 1, lo - 2, -1):
+        if _ends_sentence(tokens[i]):
+            return i + 1
+    return max_tokens
+
+def iter_token_chunks(pieces: Iterable[str], max_tokens: int = 500, overlap: int = 50,
+                      min_fill: float = None) -> Iterator[str]:
+    """
+    Chunks of at most max_tokens tokens with `overlap` tokens shared between
+    neighbours. Each piece (page, paragraph, block) is encoded once and windows
+    are sliced from the token buffer, never re-encoded. A window ends on the last
+    sentence end found in its final (1 - min_fill) part, when there is one.
+    Whitespace is normalized like clean_text.
+    """
+    if max_tokens <= 0:
+        return
+    overlap = max(0, min(overlap, max_tokens - 1))
+    min_fill = float(os.getenv("CHUNK_MIN_FILL", 0.75)) if min_fill is None else min_fill
+    enc = get_tokenizer()
+    buf: List[int] = []
+    carried = 0  # tokens at the head of buf already emitted with the previous chunk
+    for piece in pieces:
+        piece = re.sub(r"\s+", " ", piece).strip()
+        if not piece:
+            continue
+        buf.extend(enc.encode(piece if not buf else " " + piece, disallowed_special=()))
+        while len(buf) > max_tokens:
+            end = _cut(buf, max_tokens, overlap, min_fill)
+            yield enc.decode(buf[:end]).strip()
+            del buf[:end - overlap]
+            carried = overlap
+    if len(buf) > carried:
+        yield enc.decode(buf).strip()
+
+def chunk_by_tokens(text: str, max_tokens: int = 500, overlap: int = 50) -> List[str]:
+    return list(iter_token_chunks([text], max_tokens, overlap))
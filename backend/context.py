@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+from typing import Dict, List, Tuple
+
+from chunking import token_counter
+
+# ----------------------- helpers -----------------------
+
+def _overlap(a: str, b: str, min_chars: int) -> int:
+    """Length of the longest suffix of a that is a prefix of b (0 if shorter than min_chars)."""
+    probe = b[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+def _shingles(text: str, n: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= n:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + n])) for i in range(len(words) - n + 1)}
+
+def _containment(a: set, b: set) -> float:
+    # share of a's shingles also found in b: catches a chunk repeated inside a longer span
+    return len(a & b) / len(a) if a and b else 0.0
+
+def _format(file: str, text: str) -> str:
+    return f"[File: {file}]\n{text}"
+
+# ----------------------- context builder -----------------------
+
+class ContextBuilder:
+    """
+    Turns retrieved matches into the contexts sent to the LLM:
+      1. chunks of the same file with consecutive chunk ids (or overlapping text)
+         are merged into one span, the CHUNK_OVERLAP part kept once
+      2. spans that near-duplicate a more relevant span are dropped (share of
+         their word 5-gram shingles found in it >= CONTEXT_DEDUP_THRESHOLD)
+      3. spans are packed by relevance into CONTEXT_TOKEN_BUDGET tokens (0: no
+         limit); the best span is truncated rather than dropped
+    build() also reports what this saved against sending every chunk as is.
+    """
+    def __init__(self):
+        self.budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 0))
+        self.dedup_threshold = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.9))
+        self.min_overlap = 20  # characters; shorter common text is a coincidence, not chunk overlap
+        self.lock = threading.Lock()
+        self.totals = {"requests": 0, "tokens_in": 0, "tokens_out": 0, "tokens_saved": 0}
+
+    def _spans(self, matches: List) -> Tuple[List[Dict], int]:
+        by_file: Dict[str, List[Tuple[int, float, str]]] = {}
+        for order, m in enumerate(matches):
+            meta = m.metadata or {}
+            try:
+                idx = int(meta.get("chunk_id", ""))
+            except ValueError:
+                idx = -1 - order  # unknown position: never adjacent to anything
+            file = meta.get("file", "unknown")
+            if meta.get("namespace"):
+                # multi-namespace retrieval: the same relpath may exist in two namespaces
+                file = f"{meta['namespace']}/{file}"
+            by_file.setdefault(file, []).append(
+                (idx, float(getattr(m, "score", 0.0) or 0.0), meta.get("text", "")))
+        spans, merged = [], 0
+        for file, items in by_file.items():
+            items.sort(key=lambda x: x[0])
+            cur = None
+            for idx, score, text in items:
+                ov = _overlap(cur["text"], text, self.min_overlap) if cur else 0
+                if cur and (ov or (idx >= 0 and idx == cur["last"] + 1)):
+                    cur["text"] = cur["text"] + text[ov:] if ov else cur["text"] + " " + text
+                    cur["last"] = idx
+                    cur["score"] = max(cur["score"], score)
+                    merged += 1
+                    continue
+                cur = {"file": file, "text": text, "last": idx, "score": score}
+                spans.append(cur)
+        spans.sort(key=lambda s: -s["score"])
+        return spans, merged
+
+    def _dedupe(self, spans: List[Dict]) -> Tuple[List[Dict], int]:
+        if self.dedup_threshold <= 0:
+            return spans, 0
+        kept, shingles = [], []
+        for span in spans:
+            sh = _shingles(span["text"])
+            if any(_containment(sh, other) >= self.dedup_threshold for other in shingles):
+                continue
+            kept.append(span)
+            shingles.append(sh)
+        return kept, len(spans) - len(kept)
+
+    def _truncate(self, file: str, text: str, budget: int, count) -> str:
+        full = count(_format(file, text))
+        cut = int(len(text) * budget / max(full, 1))
+        while cut > 0 and count(_format(file, text[:cut])) > budget:
+            cut = int(cut * 0.9)
+        cut = text.rfind(" ", 0, cut) if " " in text[:cut] else cut
+        return text[:max(cut, 0)]
+
+    def build(self, matches: List) -> Tuple[List[str], Dict]:
+        """(contexts, stats) for matches ordered best first."""
+        count = token_counter()
+        tokens_in = sum(count(_format((m.metadata or {}).get("file", "unknown"), (m.metadata or {}).get("text", "")))
+                        for m in matches)
+        spans, merged = self._spans(matches)
+        spans, duplicates = self._dedupe(spans)
+
+        contexts, used, over_budget = [], 0, 0
+        for span in spans:
+            ctx = _format(span["file"], span["text"])
+            t = count(ctx)
+            if self.budget > 0 and used + t > self.budget:
+                if contexts:
+                    over_budget += 1
+                    continue
+                ctx = _format(span["file"], self._truncate(span["file"], span["text"], self.budget, count))
+                t = count(ctx)
+            contexts.append(ctx)
+            used += t
+
+        stats = {
+            "chunks": len(matches), "spans": len(contexts), "merged": merged,
+            "duplicates": duplicates, "over_budget": over_budget,
+            "tokens_in": tokens_in, "tokens_out": used, "tokens_saved": max(0, tokens_in - used),
+        }
+        with self.lock:
+            self.totals["requests"] += 1
+            for key in ("tokens_in", "tokens_out", "tokens_saved"):
+                self.totals[key] += stats[key]
+        return contexts, stats
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.totals, budget=self.budget)
@@ -0,0 +1,205 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ----------------------- MinHash -----------------------
+
+_WORD = re.compile(r"\w+")
+_PRIME = (1 << 32) + 15  # smallest prime above 2**32
+
+class MinHasher:
+    """
+    MinHash signatures over word n-gram shingles. The permutations come from a
+    fixed seed and shingles are hashed with blake2b (hash() is salted per
+    process), so signatures can be stored and compared across runs.
+    """
+    def __init__(self, num_perm: int = 128, shingle: int = 5):
+        self.num_perm = num_perm
+        self.shingle = shingle
+        rng = np.random.default_rng(1)
+        # a < 2**31 and x < 2**32 keep a * x + b inside uint64
+        self.a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+
+    def words(self, text: str) -> List[str]:
+        return _WORD.findall(text.lower())
+
+    def signature(self, text: str) -> Tuple[str, np.ndarray]:
+        """(sha1 of the normalized words, uint32 signature of num_perm values)."""
+        words = self.words(text)
+        digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+        n = self.shingle
+        grams = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        x = np.fromiter((int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little")
+                         for g in grams), dtype=np.uint64, count=len(grams))
+        sig = ((np.outer(x, self.a) + self.b) % _PRIME).min(axis=0)
+        return digest, (sig & 0xFFFFFFFF).astype(np.uint32)
+
+# ----------------------- near-duplicate index -----------------------
+
+class DedupIndex:
+    """
+    Cross-file near-duplicate chunks, keyed by vector id, in one SQLite file:
+      canon    - canonical chunks (the ones with a vector): sha1 and MinHash signature
+      bands    - LSH buckets: one key per signature band, pointing at canonical ids
+      members  - every indexed chunk (canonical ones included) -> its canonical id and file
+    A chunk whose estimated Jaccard similarity with a canonical chunk of another
+    file reaches DEDUP_THRESHOLD (1.0: identical words only) gets no vector of its own; the
+    files of all its members are reported with the canonical vector's hits.
+    """
+    def __init__(self, path: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.threshold = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+        self.hasher = MinHasher(int(os.getenv("DEDUP_PERMUTATIONS", 128)), int(os.getenv("DEDUP_SHINGLE", 5)))
+        # bands x rows = permutations; 16 x 8 finds pairs above ~0.7 similarity as candidates
+        self.bands = int(os.getenv("DEDUP_BANDS", 16))
+        if self.hasher.num_perm % self.bands:
+            raise ValueError("DEDUP_PERMUTATIONS must be a multiple of DEDUP_BANDS")
+        # held by the engine across the steps of one update (lookup, promotion, deletes)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS canon (id TEXT PRIMARY KEY, sha1 TEXT NOT NULL, sig BLOB NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS canon_sha1 ON canon (sha1)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER, id TEXT, PRIMARY KEY (key, id)) WITHOUT ROWID")
+        self.db.execute("CREATE INDEX IF NOT EXISTS bands_id ON bands (id)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS members (id TEXT PRIMARY KEY, canon TEXT NOT NULL, "
+                        "file TEXT NOT NULL, chunk INTEGER NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS members_canon ON members (canon)")
+        # signatures made with other settings cannot be compared: start over (the engine re-chunks)
+        params = f"{self.hasher.num_perm}/{self.hasher.shingle}/{self.bands}"
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'params'").fetchone()
+        if row is not None and row[0] != params:
+            print(f"[WARN] dedup settings changed ({row[0]} -> {params}), rebuilding the dedup index")
+            self.clear()
+        self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('params', ?)", (params,))
+        self.db.commit()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM canon").fetchone()[0]
+
+    def signature(self, text: str) -> Tuple[str, np.ndarray]:
+        return self.hasher.signature(text)
+
+    def _band_keys(self, sig: np.ndarray) -> List[int]:
+        rows = self.hasher.num_perm // self.bands
+        keys = []
+        for b in range(self.bands):
+            h = hashlib.blake2b(b.to_bytes(2, "little") + sig[b * rows:(b + 1) * rows].tobytes(), digest_size=8).digest()
+            keys.append(int.from_bytes(h, "little", signed=True))
+        return keys
+
+    def find(self, digest: str, sig: np.ndarray, file: str, exclude: Optional[str] = None) -> Optional[str]:
+        """
+        Canonical id the chunk duplicates (exact words first, then LSH candidates),
+        or None. Only canonical chunks of other files count: repeated passages of
+        one file (headers, boilerplate) keep their own vectors and positions.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT c.id FROM canon c JOIN members m ON m.id = c.id "
+                                  "WHERE c.sha1 = ? AND c.id != ? AND m.file != ? LIMIT 1",
+                                  (digest, exclude or "", file)).fetchone()
+            if row is not None:
+                return row[0]
+            if self.threshold >= 1.0:
+                return None
+            keys = self._band_keys(sig)
+            cands = self.db.execute(
+                f"SELECT DISTINCT c.id, c.sig FROM bands b JOIN canon c ON c.id = b.id JOIN members m ON m.id = c.id "
+                f"WHERE b.key IN ({','.join('?' * len(keys))}) AND b.id != ? AND m.file != ?",
+                (*keys, exclude or "", file)).fetchall()
+        best, best_sim = None, self.threshold
+        for cid, blob in cands:
+            sim = float(np.mean(np.frombuffer(blob, dtype=np.uint32) == sig))
+            if sim >= best_sim:
+                best, best_sim = cid, sim
+        return best
+
+    def role(self, vid: str) -> Optional[Tuple[str, Optional[str]]]:
+        """(canonical id, sha1 when vid is itself canonical) for an indexed chunk, else None."""
+        with self.lock:
+            row = self.db.execute("SELECT m.canon, c.sha1 FROM members m LEFT JOIN canon c ON c.id = m.id "
+                                  "WHERE m.id = ?", (vid,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def add_canonical(self, vid: str, file: str, chunk: int, digest: str, sig: np.ndarray):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO canon (id, sha1, sig) VALUES (?, ?, ?)", (vid, digest, sig.tobytes()))
+            self.db.executemany("INSERT OR IGNORE INTO bands (key, id) VALUES (?, ?)",
+                                [(k, vid) for k in self._band_keys(sig)])
+            self.db.execute("INSERT OR REPLACE INTO members (id, canon, file, chunk) VALUES (?, ?, ?, ?)",
+                            (vid, vid, file, chunk))
+            self.db.commit()
+
+    def add_member(self, vid: str, file: str, chunk: int, canon: str):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO members (id, canon, file, chunk) VALUES (?, ?, ?, ?)",
+                            (vid, canon, file, chunk))
+            self.db.commit()
+
+    def remove(self, vid: str) -> Tuple[Optional[str], Optional[Tuple[str, str, int]]]:
+        """
+        Forget one chunk. Returns (kind, successor): kind is "member", "canonical"
+        or None (unknown id); successor is (id, file, chunk) of a remaining member
+        of a removed canonical chunk, which must then be promote()d.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT canon FROM members WHERE id = ?", (vid,)).fetchone()
+            if row is None:
+                return None, None
+            self.db.execute("DELETE FROM members WHERE id = ?", (vid,))
+            if row[0] != vid:
+                self.db.commit()
+                return "member", None
+            succ = self.db.execute("SELECT id, file, chunk FROM members WHERE canon = ? LIMIT 1", (vid,)).fetchone()
+            if succ is None:
+                self.db.execute("DELETE FROM canon WHERE id = ?", (vid,))
+                self.db.execute("DELETE FROM bands WHERE id = ?", (vid,))
+            self.db.commit()
+            return "canonical", (tuple(succ) if succ else None)
+
+    def promote(self, old: str, new: str):
+        """The vector of canonical chunk `old` now lives under member `new`."""
+        with self.lock:
+            self.db.execute("UPDATE canon SET id = ? WHERE id = ?", (new, old))
+            self.db.execute("UPDATE bands SET id = ? WHERE id = ?", (new, old))
+            self.db.execute("UPDATE members SET canon = ? WHERE canon = ?", (new, old))
+            self.db.commit()
+
+    def files(self, ids: Sequence[str]) -> Dict[str, List[str]]:
+        """Canonical id -> files of all its members, for the ids that have more than one file."""
+        out: Dict[str, List[str]] = {}
+        uniq = list(dict.fromkeys(ids))
+        if not uniq:
+            return out
+        with self.lock:
+            rows = self.db.execute(f"SELECT canon, file FROM members WHERE canon IN ({','.join('?' * len(uniq))}) "
+                                   f"ORDER BY canon, file", uniq).fetchall()
+        for canon, file in rows:
+            files = out.setdefault(canon, [])
+            if not files or files[-1] != file:
+                files.append(file)
+        return {k: v for k, v in out.items() if len(v) > 1}
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            canonical = self.db.execute("SELECT COUNT(*) FROM canon").fetchone()[0]
+            chunks = self.db.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+        return {"chunks": chunks, "vectors": canonical, "duplicates": chunks - canonical}
+
+    def clear(self):
+        with self.lock:
+            for table in ("canon", "bands", "members"):
+                self.db.execute(f"DELETE FROM {table}")
+            self.db.commit()
@@ -0,0 +1,166 @@
+import os
+import time
+import queue
+import random
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ----------------------- token estimate -----------------------
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English/French prose; only used to size batches
+    return len(text) // 4 + 1
+
+# ----------------------- retry -----------------------
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+def is_retryable(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS or type(e).__name__ in RETRYABLE_ERRORS
+
+def retry_after(e: Exception) -> float:
+    # honour Retry-After when the provider sends one
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+def with_backoff(fn: Callable, max_retries: int = 6, base: float = 1.0, cap: float = 60.0, label: str = "EMBED"):
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            delay = max(retry_after(e), min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0))
+            print(f"[{label}] {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+# ----------------------- scheduler -----------------------
+
+class EmbeddingScheduler:
+    """
+    Packs (key, text) items from any number of documents into batches bounded by
+    estimated tokens and item count, embeds up to `concurrency` batches at once
+    with rate-limit-aware backoff, and yields (key, vector) as batches complete.
+    Items are pulled lazily, so at most `concurrency` batches are buffered.
+    """
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]],
+                 max_tokens: int = None, max_items: int = None, concurrency: int = None):
+        self.embed_fn = embed_fn
+        self.max_tokens = max_tokens or int(os.getenv("EMBED_BATCH_TOKENS", 100000))
+        self.max_items = max_items or int(os.getenv("EMBED_BATCH_ITEMS", 512))
+        self.concurrency = concurrency or int(os.getenv("EMBED_CONCURRENCY", 4))
+        self.max_retries = int(os.getenv("EMBED_MAX_RETRIES", 6))
+
+    def batches(self, items: Iterable[Tuple[Any, str]]) -> Iterator[List[Tuple[Any, str]]]:
+        batch, tokens = [], 0
+        for key, text in items:
+            t = estimate_tokens(text)
+            if batch and (tokens + t > self.max_tokens or len(batch) >= self.max_items):
+                yield batch
+                batch, tokens = [], 0
+            batch.append((key, text))
+            tokens += t
+        if batch:
+            yield batch
+
+    def _embed(self, batch: List[Tuple[Any, str]]) -> List[Tuple[Any, List[float]]]:
+        vectors = with_backoff(lambda: self.embed_fn([text for _, text in batch]), self.max_retries)
+        return [(key, vec) for (key, _), vec in zip(batch, vectors)]
+
+    def run_batches(self, items: Iterable[Tuple[Any, str]]) -> Iterator[List[Tuple[Any, List[float]]]]:
+        """The (key, vector) pairs of each embedded batch, in completion order."""
+        batches = self.batches(items)
+        if self.concurrency <= 1:
+            for batch in batches:
+                yield self._embed(batch)
+            return
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for batch in batches:
+                pending.add(pool.submit(self._embed, batch))
+                if len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        yield fut.result()
+            for fut in pending:
+                yield fut.result()
+
+    def run(self, items: Iterable[Tuple[Any, str]]) -> Iterator[Tuple[Any, List[float]]]:
+        for batch in self.run_batches(items):
+            yield from batch
+
+# ----------------------- query micro-batching -----------------------
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-text embeddings (one per /ask) into one
+    embed_fn call: a batching thread takes everything already queued, waits up
+    to max_wait_ms for more while the batch is below max_batch, embeds, and
+    resolves each caller's future. Under load, requests arriving during a
+    forward pass form the next batch; alone, a request only pays max_wait_ms.
+    The thread is started on first use and again after a fork, so an instance
+    created before gunicorn forks its workers works in each of them.
+    """
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]],
+                 max_batch: int = None, max_wait_ms: float = None, on_batch: Callable[[int], None] = None):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch or int(os.getenv("QUERY_BATCH_MAX_SIZE", 32))
+        self.max_wait = (float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 2)) if max_wait_ms is None else max_wait_ms) / 1000.0
+        self.on_batch = on_batch
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue: queue.Queue = None
+
+    def _ensure_thread(self) -> queue.Queue:
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # a queue inherited through fork has no thread behind it
+                    self._queue = queue.Queue()
+                    threading.Thread(target=self._run, args=(self._queue,), name="query-batcher", daemon=True).start()
+                    self._pid = pid
+        return self._queue
+
+    def embed(self, text: str) -> List[float]:
+        fut: Future = Future()
+        self._ensure_thread().put((text, fut))
+        return fut.result()
+
+    def _collect(self, q: queue.Queue) -> List[Tuple[str, Future]]:
+        batch = [q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(q.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, q: queue.Queue):
+        while True:
+            batch = self._collect(q)
+            try:
+                vectors = self.embed_fn([text for text, _ in batch])
+            except BaseException as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            if self.on_batch is not None:
+                self.on_batch(len(batch))
+            for (_, fut), vec in zip(batch, vectors):
+                fut.set_result(vec)
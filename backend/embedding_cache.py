@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import List, Dict, Optional
+
+import numpy as np
+
+# ----------------------- content-addressed embedding cache -----------------------
+
+class EmbeddingCache:
+    """
+    Persistent cache of chunk embeddings keyed by sha256(provider, model, text).
+    Vectors are stored as float32 blobs in SQLite, so a reindex of unchanged
+    documents never calls the embedding API again.
+    """
+    def __init__(self, path: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(provider: str, model: str, text: str) -> str:
+        return hashlib.sha256(f"{provider}\x00{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        uniq = list(dict.fromkeys(keys))
+        with self.lock:
+            # stay below SQLite's host-parameter limit
+            for i in range(0, len(uniq), 500):
+                part = uniq[i:i + 500]
+                marks = ",".join("?" * len(part))
+                for k, blob in self.db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part):
+                    found[k] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        rows = [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
+            self.db.commit()
+
+    def record(self, hits: int, misses: int):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0}
+
+
+def open_embedding_cache() -> Optional[EmbeddingCache]:
+    # EMBED_CACHE_PATH="" disables the cache
+    path = os.getenv("EMBED_CACHE_PATH", "data/index/embed_cache.sqlite")
+    return EmbeddingCache(path) if path else None
@@ -0,0 +1,28 @@
+"""
+gunicorn settings:  gunicorn -c gunicorn.conf.py main:app
+
+With preload_app the master imports main once, loading the embedding model
+before forking (RAGEngine.preload), so WEB_CONCURRENCY workers share the
+weights copy-on-write instead of each loading its own copy. Every worker then
+reopens its connections and warms up in post_fork (main.after_fork).
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+# request threads per worker: /ask mostly waits on Pinecone / OpenAI
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+worker_class = "gthread"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+keepalive = 5
+
+# without preload every worker loads its own model, and each one marks the jobs
+# of the others 'interrupted' when it starts: keep it with more than one worker
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+if preload_app:
+    os.environ["ENGINE_PRELOAD"] = "1"
+
+
+def post_fork(server, worker):
+    import main
+    main.after_fork()
@@ -1,3 +1,4 @@
+import json
 import argparse
 from rag_engine import RAGEngine
 
@@ -5,8 +6,28 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="(Re)build Pinecone index from documents")
     parser.add_argument("--docs_dir", type=str, default="data/raw_documents", help="Directory with PDFs/DOCX/TXT")
     parser.add_argument("--clear", action="store_true", help="Clear namespace before indexing")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for parsing/chunking (default INGEST_WORKERS)")
+    # without a subcommand: index --docs_dir as before
+    sub = parser.add_subparsers(dest="command", metavar="{export,import}")
+    exp = sub.add_parser("export", help="Write the namespace (INDEX_NAMESPACE) to a snapshot directory")
+    exp.add_argument("path", help="Snapshot directory (created)")
+    exp.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                     help="float16 halves the vector block for a tiny loss of precision")
+    imp = sub.add_parser("import", help="Replace the namespace (INDEX_NAMESPACE) with a snapshot, without embedding anything")
+    imp.add_argument("path", help="Snapshot directory written by export")
+    imp.add_argument("--force", action="store_true", help="Accept a snapshot of another embedding model with the same dimension")
     args = parser.parse_args()
 
     engine = RAGEngine()
-    engine.build_index(args.docs_dir, clear=args.clear)
-    print("Indexing complete.")
\ No newline at end of file
+    if args.command == "export":
+        report = engine.export_snapshot(args.path, dtype=args.dtype)
+        print(json.dumps(report, indent=2))
+        print("Export complete.")
+    elif args.command == "import":
+        report = engine.import_snapshot(args.path, force=args.force)
+        print(json.dumps(report, indent=2))
+        print("Import complete.")
+    else:
+        report = engine.build_index(args.docs_dir, clear=args.clear, workers=args.workers)
+        print(json.dumps(report, indent=2))
+        print("Indexing complete.")
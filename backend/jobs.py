@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+# ----------------------- background jobs -----------------------
+
+TERMINAL = ("done", "failed", "cancelled", "interrupted")
+ACTIVE = ("queued", "running", "cancelling")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobManager:
+    """
+    Runs ingestion (reindex / single-file indexing) and large /ask_batch runs
+    outside the HTTP request.
+    Jobs are persisted in SQLite with their status and progress, executed by a
+    small thread pool (JOB_WORKERS, default 1 so jobs touching the same
+    namespace never overlap), and can be cancelled while queued or running.
+    Under several gunicorn workers the table is shared: a job runs in the worker
+    that accepted it, and a cancel received by another worker is passed on
+    through the 'cancelling' status, which the running job polls.
+    Each job records its owner (host:pid) and a heartbeat refreshed every
+    JOB_HEARTBEAT_S; a job is only marked 'interrupted' once its owner is gone
+    (same host, pid dead) or its heartbeat is older than JOB_STALE_S, so a new
+    worker leaves the live jobs of its siblings alone.
+
+    handlers: kind -> fn(params, progress, stop) -> result dict
+    """
+    def __init__(self, handlers: Dict[str, Callable], path: Optional[str] = None, workers: Optional[int] = None):
+        self.handlers = handlers
+        self.path = path or os.getenv("JOBS_DB", "data/index/jobs.sqlite")
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                files_total INTEGER DEFAULT 0,
+                files_done INTEGER DEFAULT 0,
+                chunks_done INTEGER DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                heartbeat REAL
+            )""")
+        cols = {r["name"] for r in self.db.execute("PRAGMA table_info(jobs)")}
+        for col, kind in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if col not in cols:
+                self.db.execute(f"ALTER TABLE jobs ADD COLUMN {col} {kind}")
+        self.db.commit()
+        self.heartbeat_s = float(os.getenv("JOB_HEARTBEAT_S", 10))
+        self.stale_s = float(os.getenv("JOB_STALE_S", 60))
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 1))
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self.stops: Dict[str, threading.Event] = {}
+        self._start()
+
+    def after_fork(self):
+        """In a forked worker: own SQLite connection, lock and thread pool (threads do not survive fork)."""
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self.stops = {}
+        self._start()
+
+    # --------------- ownership ---------------
+    def _start(self):
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}"
+        self.recover()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_s)
+            try:
+                with self.lock:
+                    self.db.execute(f"UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status IN ({','.join('?' * len(ACTIVE))})",
+                                    (time.time(), self.owner, *ACTIVE))
+                    self.db.commit()
+                # a sibling that crashed after startup is noticed here, not at the next restart
+                self.recover()
+            except sqlite3.Error as e:
+                print(f"[JOB] heartbeat failed: {e}")
+
+    def _orphaned(self, owner: Optional[str], heartbeat: Optional[float], now: float) -> bool:
+        if owner == self.owner:
+            return False
+        if heartbeat is None or now - heartbeat > self.stale_s:
+            return True
+        host, _, pid = (owner or "").rpartition(":")
+        return host == self.host and pid.isdigit() and not _pid_alive(int(pid))
+
+    def recover(self) -> int:
+        """Mark 'interrupted' the queued/running jobs whose owner process is gone; returns how many."""
+        now = time.time()
+        with self.lock:
+            rows = self.db.execute(f"SELECT id, owner, heartbeat FROM jobs WHERE status IN ({','.join('?' * len(ACTIVE))})",
+                                   ACTIVE).fetchall()
+            dead = [r["id"] for r in rows if self._orphaned(r["owner"], r["heartbeat"], now)]
+            # re-checked in the UPDATE: the job may have finished meanwhile
+            self.db.executemany(f"UPDATE jobs SET status = 'interrupted', finished_at = ? "
+                                f"WHERE id = ? AND status IN ({','.join('?' * len(ACTIVE))})",
+                                [(now, job_id, *ACTIVE) for job_id in dead])
+            self.db.commit()
+        for job_id in dead:
+            print(f"[JOB] {job_id} interrupted: its worker is gone")
+        return len(dead)
+
+    def _status(self, job_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+
+    def _update(self, job_id: str, **fields):
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+            self.db.commit()
+
+    def submit(self, kind: str, params: Dict) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            now = time.time()
+            self.db.execute("INSERT INTO jobs (id, kind, params, status, created_at, owner, heartbeat) "
+                            "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                            (job_id, kind, json.dumps(params), now, self.owner, now))
+            self.db.commit()
+        self.stops[job_id] = threading.Event()
+        self.pool.submit(self._run, job_id, kind, params)
+        return job_id
+
+    def _run(self, job_id: str, kind: str, params: Dict):
+        stop = self.stops[job_id]
+        if stop.is_set() or self._status(job_id) == "cancelled":
+            self.stops.pop(job_id, None)
+            return
+        self._update(job_id, status="running", started_at=time.time(), heartbeat=time.time())
+        last = [0.0]
+        latest: Dict[str, int] = {}
+
+        def progress(p: Dict):
+            # throttle writes; the final numbers are written when the job ends
+            latest.update({k: int(v) for k, v in p.items() if k in ("files_total", "files_done", "chunks_done")})
+            now = time.monotonic()
+            if now - last[0] >= 0.5:
+                last[0] = now
+                self._update(job_id, **latest)
+                if self._status(job_id) == "cancelling":
+                    stop.set()
+
+        try:
+            result = self.handlers[kind](params, progress, stop) or {}
+            fields = dict(latest)
+            files = result.get("files", {})
+            if files:
+                fields["files_done"] = sum(v for k, v in files.items() if k != "removed")
+            if "stages" in result:
+                fields["chunks_done"] = result["stages"]["upsert"]["items"]
+            status = "cancelled" if stop.is_set() else "done"
+            self._update(job_id, status=status, result=json.dumps(result), finished_at=time.time(), **fields)
+        except Exception as e:
+            print(f"[JOB] {kind} {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            self.stops.pop(job_id, None)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        job = self.get(job_id)
+        if job is None or job["status"] in TERMINAL:
+            return job
+        stop = self.stops.get(job_id)
+        if stop is not None:
+            stop.set()
+        if job["status"] == "queued":
+            self._update(job_id, status="cancelled", finished_at=time.time())
+        elif stop is None:
+            # running in another worker process: it sees this at its next progress update
+            self._update(job_id, status="cancelling")
+        return self.get(job_id)
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        with self.lock:
+            rows = self.db.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row(r) for r in rows]
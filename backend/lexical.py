@@ -0,0 +1,192 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# ----------------------- analyzer -----------------------
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces dans de des du elle en est et il ils je la le les leur lui mais me meme mes
+ne nos notre nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes toi ton tu un une
+vos votre vous y ete etre avoir ont cette cet comme plus
+an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+def analyze(text: str) -> List[str]:
+    """Lowercase, strip accents, split on non-alphanumerics, drop stopwords and single letters."""
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [t for t in _TOKEN.findall(text)
+            if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+# ----------------------- BM25 inverted index -----------------------
+
+class BM25Index:
+    """
+    Inverted index over chunk texts, keyed by vector id, in one SQLite file:
+      terms    - term id, term, document frequency
+      docs     - doc number, vector id, length, term ids (int32 blob, for deletes)
+      postings - (term id, doc number) -> term frequency, clustered by term
+    The vocabulary, document frequencies and document lengths are kept in memory
+    so a query only reads the posting lists of its own terms; BM25 is then
+    computed with NumPy over those arrays.
+    """
+    def __init__(self, path: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.k1 = float(os.getenv("BM25_K1", 1.2))
+        self.b = float(os.getenv("BM25_B", 0.75))
+        # terms found in more than this share of chunks carry almost no weight; skip their postings
+        # (unless the query has nothing else)
+        self.max_df = float(os.getenv("LEXICAL_MAX_DF", 0.5))
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE NOT NULL, df INTEGER NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, len INTEGER NOT NULL, terms BLOB NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS postings (term INTEGER, doc INTEGER, tf INTEGER NOT NULL, "
+                        "PRIMARY KEY (term, doc)) WITHOUT ROWID")
+        self.db.commit()
+        self._load()
+
+    def _load(self):
+        self.vocab: Dict[str, int] = {}
+        df = []
+        for tid, term, n in self.db.execute("SELECT id, term, df FROM terms ORDER BY id"):
+            self.vocab[term] = tid
+            df.extend([0] * (tid + 1 - len(df)))
+            df[tid] = n
+        self.df = np.array(df, dtype=np.int64)
+        docs = self.db.execute("SELECT doc, len FROM docs").fetchall()
+        size = max((doc for doc, _ in docs), default=-1) + 1
+        self.lens = np.zeros(max(size, 1024), dtype=np.float32)
+        for doc, n in docs:
+            self.lens[doc] = n
+        self.next_doc = size
+        self.ndocs = len(docs)
+        self.total_len = int(sum(n for _, n in docs))
+
+    def __len__(self) -> int:
+        return self.ndocs
+
+    def _term_ids(self, terms: Iterable[str]) -> List[int]:
+        new = [t for t in terms if t not in self.vocab]
+        if new:
+            start = len(self.df)
+            self.db.executemany("INSERT INTO terms (id, term, df) VALUES (?, ?, 0)",
+                                [(start + i, t) for i, t in enumerate(new)])
+            for i, t in enumerate(new):
+                self.vocab[t] = start + i
+            self.df = np.concatenate([self.df, np.zeros(len(new), dtype=np.int64)])
+        return [self.vocab[t] for t in terms]
+
+    def _remove(self, ids: Sequence[str]) -> set:
+        touched = set()
+        for i in range(0, len(ids), 500):
+            part = list(ids[i:i + 500])
+            marks = ",".join("?" * len(part))
+            rows = self.db.execute(f"SELECT doc, len, terms FROM docs WHERE id IN ({marks})", part).fetchall()
+            for doc, n, blob in rows:
+                tids = np.frombuffer(blob, dtype=np.int32)
+                self.db.executemany("DELETE FROM postings WHERE term = ? AND doc = ?", [(int(t), doc) for t in tids])
+                self.df[tids] -= 1
+                touched.update(tids.tolist())
+                self.lens[doc] = 0
+                self.ndocs -= 1
+                self.total_len -= n
+            self.db.execute(f"DELETE FROM docs WHERE id IN ({marks})", part)
+        return touched
+
+    def _save_df(self, tids: Iterable[int]):
+        self.db.executemany("UPDATE terms SET df = ? WHERE id = ?", [(int(self.df[t]), t) for t in tids])
+
+    def add(self, items: Sequence[Tuple[str, str]]):
+        """Index (vector id, text) pairs; an id that is already indexed is replaced."""
+        if not items:
+            return
+        with self.lock:
+            touched = self._remove([vid for vid, _ in items])
+            docs, postings = [], []
+            for vid, text in items:
+                counts = Counter(analyze(text))
+                tids = self._term_ids(list(counts))
+                doc = self.next_doc
+                self.next_doc += 1
+                if doc >= len(self.lens):
+                    self.lens = np.concatenate([self.lens, np.zeros(len(self.lens), dtype=np.float32)])
+                n = sum(counts.values())
+                self.lens[doc] = n
+                self.ndocs += 1
+                self.total_len += n
+                self.df[tids] += 1
+                touched.update(tids)
+                docs.append((doc, vid, n, np.asarray(tids, dtype=np.int32).tobytes()))
+                postings.extend((t, doc, c) for t, c in zip(tids, counts.values()))
+            self.db.executemany("INSERT INTO docs (doc, id, len, terms) VALUES (?, ?, ?, ?)", docs)
+            # in key order, so the inserts append to each term's run of the clustered index
+            postings.sort()
+            self.db.executemany("INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)", postings)
+            self._save_df(touched)
+            self.db.commit()
+
+    def remove(self, ids: Sequence[str]):
+        with self.lock:
+            self._save_df(self._remove(ids))
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            for table in ("postings", "docs", "terms"):
+                self.db.execute(f"DELETE FROM {table}")
+            self.db.commit()
+            self._load()
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """[(vector id, BM25 score)] best first."""
+        with self.lock:
+            n = self.ndocs
+            tids = [self.vocab[t] for t in dict.fromkeys(analyze(query)) if t in self.vocab]
+            tids = [t for t in tids if self.df[t] > 0]
+            tids = [t for t in tids if self.df[t] <= self.max_df * n] or tids
+            if not tids or top_k <= 0:
+                return []
+            avgdl = self.total_len / n
+            docs, weights = [], []
+            for t in tids:
+                post = np.array(self.db.execute("SELECT doc, tf FROM postings WHERE term = ?", (t,)).fetchall(),
+                                dtype=np.int64).reshape(-1, 2)
+                df = len(post)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                tf = post[:, 1].astype(np.float32)
+                dl = self.lens[post[:, 0]]
+                docs.append(post[:, 0])
+                weights.append(idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl)))
+            uniq, inv = np.unique(np.concatenate(docs), return_inverse=True)
+            scores = np.bincount(inv, weights=np.concatenate(weights))
+            k = min(top_k, len(uniq))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            best = uniq[top].tolist()
+            marks = ",".join("?" * len(best))
+            ids = dict(self.db.execute(f"SELECT doc, id FROM docs WHERE doc IN ({marks})", best).fetchall())
+            return [(ids[d], float(s)) for d, s in zip(best, scores[top].tolist())]
+
+# ----------------------- fusion -----------------------
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Merge ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, vid in enumerate(ranking, 1):
+            scores[vid] = scores.get(vid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])
@@ -1,26 +1,117 @@
 import os
-from flask import Flask, request, jsonify
+import json
+import time
+import threading
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from pydantic import ValidationError
-from models import AskRequest, AskResponse, ReindexRequest, Source
+from models import AskRequest, AskResponse, AskBatchRequest, AskBatchItem, AskBatchResponse, ReindexRequest, Source
 from rag_engine import RAGEngine
+from jobs import JobManager
+from metrics import REGISTRY, REQUESTS, REQUEST_SECONDS, STREAM_SECONDS
 import werkzeug
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
+# cheap: heavy imports, model loading and the index check happen in warmup(),
+# so the worker answers /livez right away and /readyz once the engine is warm
 engine = RAGEngine()
 
-@app.get("/healthcheck")
-def health():
-    return jsonify({"status": "ok", "index": engine.index_name, "namespace": engine.namespace}), 200
+# ingestion runs in background jobs so /ask stays responsive during a reindex
+jobs = JobManager({
+    "reindex": lambda p, progress, stop: engine.build_index(p["docs_dir"], clear=p["clear"], progress=progress, stop=stop),
+    "index_file": lambda p, progress, stop: engine.index_file(p["path"], base_dir=p["base_dir"], progress=progress, stop=stop),
+    "ask_batch": lambda p, progress, stop: _ask_batch(p["questions"], p["k"], progress=progress, stop=stop).model_dump(),
+})
 
-@app.post("/ask")
-def ask():
+def _start_warmup():
+    threading.Thread(target=engine.warmup, name="engine-warmup", daemon=True).start()
+
+def after_fork():
+    """gunicorn post_fork hook (see gunicorn.conf.py): per-worker connections, then warmup."""
+    engine.after_fork()
+    jobs.after_fork()
+    _start_warmup()
+
+if os.getenv("ENGINE_PRELOAD") == "1":
+    # imported by the gunicorn master (preload_app): load the model here, once, so the
+    # workers share its memory copy-on-write; no thread, socket or SQLite use crosses the fork
+    engine.preload()
+else:
+    _start_warmup()
+
+# ----------------------- metrics -----------------------
+
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+
+@app.after_request
+def _record_request(resp):
+    # route template, not the path: /jobs/<job_id> is one series
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUESTS.inc(route=route, status=resp.status_code)
+    # a stream has not sent anything yet: _timed_stream records it
+    if "t0" in g and not resp.is_streamed:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.t0, route=route)
+    return resp
+
+def _engine_metrics():
+    """Counters kept by the engine itself, read at scrape time."""
+    caches = engine.cache_stats()
+    hits = [({"cache": name}, st["hits"]) for name, st in caches.items() if st]
+    misses = [({"cache": name}, st["misses"]) for name, st in caches.items() if st]
+    ctx = engine.context_builder.stats()
+    return [
+        ("rag_cache_hits_total", "counter", "Cache hits (embeddings, query_embeddings, answers).", hits),
+        ("rag_cache_misses_total", "counter", "Cache misses.", misses),
+        ("rag_context_tokens_total", "counter", "Prompt context tokens before/after the context builder.",
+         [({"kind": kind}, ctx[f"tokens_{kind}"]) for kind in ("in", "out", "saved")]),
+    ]
+
+REGISTRY.add_collector(_engine_metrics)
+
+def _timed_stream(events, route: str):
+    """Latency of a streamed response: first event (rag_http_request_seconds) and whole stream."""
+    t0 = g.t0
+    first = True
     try:
-        payload = AskRequest(**request.get_json(force=True))
-    except ValidationError as e:
-        return jsonify({"error": e.errors()}), 400
+        for ev in events:
+            if first:
+                REQUEST_SECONDS.observe(time.perf_counter() - t0, route=route)
+                first = False
+            yield ev
+    finally:
+        # also when the client disconnects half-way
+        STREAM_SECONDS.observe(time.perf_counter() - t0, route=route)
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text exposition format; per process (one series set per gunicorn worker)
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.get("/livez")
+def livez():
+    # the process serves requests; says nothing about the engine
+    return jsonify({"status": "ok"}), 200
+
+@app.get("/readyz")
+def readyz():
+    if engine.ready.is_set():
+        return jsonify({"status": "ready"}), 200
+    return jsonify({"status": "warming_up", "error": engine.warmup_error}), 503
+
+@app.get("/healthcheck")
+def health():
+    return jsonify({
+        "status": "ok",
+        "ready": engine.ready.is_set(),
+        "index": engine.index_name,
+        "namespace": engine.namespace,
+        "caches": engine.cache_stats(),
+        "context": engine.context_builder.stats(),
+    }), 200
 
-    answer, matches = engine.ask(payload.question, payload.k)
+def _sources(matches):
     sources = []
     for m in matches:
         meta = m.metadata or {}
@@ -28,11 +119,99 @@ def ask():
         s = Source(file=meta.get("file", "unknown"),
                    chunk_id=str(meta.get("chunk_id", "")),
                    score=float(getattr(m, "score", 0.0) or 0.0),
-                   snippet=snippet)
+                   snippet=snippet,
+                   files=meta.get("files", []),
+                   namespace=meta.get("namespace"))
         sources.append(s)
-    resp = AskResponse(answer=answer, sources=sources)
+    return sources
+
+@app.post("/ask")
+def ask():
+    try:
+        payload = AskRequest(**request.get_json(force=True))
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+
+    unknown = engine.unknown_namespaces(payload.namespaces or [])
+    if unknown:
+        return jsonify({"error": f"unknown namespaces: {', '.join(unknown)}"}), 400
+
+    info = {}
+    answer, matches = engine.ask(payload.question, payload.k, info, payload.namespaces)
+    resp = AskResponse(answer=answer, sources=_sources(matches), context=info.get("context"),
+                       timings=info.get("timings") if payload.timings else None, shards=info.get("shards"))
+    return jsonify(resp.model_dump()), 200
+
+# larger batches run as an "ask_batch" job: answered inline, they would outlive the gunicorn timeout
+ASK_BATCH_INLINE_MAX = int(os.getenv("ASK_BATCH_INLINE_MAX", 32))
+
+def _ask_batch(questions, k, progress=None, stop=None) -> AskBatchResponse:
+    results = engine.ask_many(questions, k, progress=progress, stop=stop)
+    items = []
+    for q, r in zip(questions, results):
+        if "error" in r:
+            items.append(AskBatchItem(question=q, error=r["error"]))
+        else:
+            items.append(AskBatchItem(question=q, answer=r["answer"], sources=_sources(r["matches"]), context=r["context"]))
+    return AskBatchResponse(results=items)
+
+@app.post("/ask_batch")
+def ask_batch():
+    try:
+        payload = AskBatchRequest(**request.get_json(force=True))
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+
+    wait = payload.wait if payload.wait is not None else len(payload.questions) <= ASK_BATCH_INLINE_MAX
+    if not wait:
+        job_id = jobs.submit("ask_batch", {"questions": payload.questions, "k": payload.k})
+        return jsonify({"status": "queued", "job_id": job_id, "questions": len(payload.questions)}), 202
+
+    try:
+        resp = _ask_batch(payload.questions, payload.k)
+    except Exception as e:
+        # the batched query embedding failed: nothing could be answered
+        return jsonify({"error": str(e)}), 502
     return jsonify(resp.model_dump()), 200
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask_stream")
+def ask_stream():
+    """
+    Server-Sent Events: one `sources` event, then `token` events as the answer
+    is generated, then `done` with the context token stats, the shard report of
+    a multi-namespace search and, when requested, the stage timings (or `error`).
+    """
+    try:
+        payload = AskRequest(**request.get_json(force=True))
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+    unknown = engine.unknown_namespaces(payload.namespaces or [])
+    if unknown:
+        return jsonify({"error": f"unknown namespaces: {', '.join(unknown)}"}), 400
+
+    def events():
+        try:
+            info = {}
+            matches, tokens = engine.ask_stream(payload.question, payload.k, info, payload.namespaces)
+            yield _sse("sources", [s.model_dump() for s in _sources(matches)])
+            for t in tokens:
+                yield _sse("token", {"t": t})
+            done = {"context": info.get("context")}
+            if "shards" in info:
+                done["shards"] = info["shards"]
+            if payload.timings:
+                done["timings"] = info.get("timings")
+            yield _sse("done", done)
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(_timed_stream(events(), request.url_rule.rule)),
+                    mimetype="text/event-stream", headers=headers)
+
 @app.post("/reindex")
 def reindex():
     # trigger ingestion inside container (e.g. from Streamlit)
@@ -42,8 +221,12 @@ def reindex():
     except ValidationError as e:
         return jsonify({"error": e.errors()}), 400
 
-    engine.build_index(payload.docs_dir, clear=payload.clear)
-    return jsonify({"status": "reindexed", "docs_dir": payload.docs_dir, "cleared": payload.clear}), 200
+    if payload.wait:
+        engine.build_index(payload.docs_dir, clear=payload.clear)
+        return jsonify({"status": "reindexed", "docs_dir": payload.docs_dir, "cleared": payload.clear}), 200
+
+    job_id = jobs.submit("reindex", {"docs_dir": payload.docs_dir, "clear": payload.clear})
+    return jsonify({"status": "queued", "job_id": job_id, "docs_dir": payload.docs_dir, "cleared": payload.clear}), 202
 
 UPLOAD_DIR = "data/user_uploads"   # 👈 dossier dédié aux uploads manuels
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -61,12 +244,22 @@ def upload():
     if not fn.lower().endswith((".pdf", ".docx", ".txt")):
         return jsonify({"error": "Unsupported file type"}), 400
 
+    # same relative name as an indexed raw document: its chunks would replace that document's
+    other = engine.conflicting_dir(UPLOAD_DIR, fn)
+    if other is not None:
+        return jsonify({"error": f"{fn} is already indexed from {other}; rename the file"}), 409
+
     # Create save path, preserving relative structure if needed
     os.makedirs(UPLOAD_DIR, exist_ok=True)
     save_path = os.path.join(UPLOAD_DIR, fn)
     f.save(save_path)
 
-    # Index the file in Pinecone
+    if request.args.get("wait", "").lower() not in ("1", "true", "yes"):
+        job_id = jobs.submit("index_file", {"path": save_path, "base_dir": UPLOAD_DIR})
+        print(f"[UPLOAD] Saved to {save_path}, indexing in job {job_id}")
+        return jsonify({"status": "saved", "path": save_path, "ingested": False, "job_id": job_id}), 202
+
+    # Index the file in the vector store
     try:
         print(f"[UPLOAD] Saved to {save_path}, starting index...")
         engine.index_file(save_path, base_dir=UPLOAD_DIR)
@@ -82,6 +275,25 @@ def upload():
             "error": str(e)
         }), 200
 
+@app.get("/jobs")
+def list_jobs():
+    limit = request.args.get("limit", default=50, type=int)
+    return jsonify({"jobs": jobs.list(limit)}), 200
+
+@app.get("/jobs/<job_id>")
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
+@app.post("/jobs/<job_id>/cancel")
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job), 200
+
 @app.get("/list_user_uploads")
 def list_user_uploads():
     docs = []
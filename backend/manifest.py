@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional, Set
+
+# ----------------------- ingestion manifest -----------------------
+
+def file_sha1(path: str, block: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    What is currently indexed for one namespace, per source directory:
+        {abs_base_dir: {relpath: {"size", "mtime", "sha1", "chunks", "settings"}}}
+    Lets build_index skip unchanged files and know which chunk IDs a file owns
+    (make_vector_id(relpath, 0..chunks-1)) so stale ones can be deleted.
+    "settings" fingerprints the chunking and embedding settings the file was
+    indexed with: a file indexed with other settings is stale even if unchanged.
+    Stored as JSON, rewritten atomically on save().
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data: Dict[str, Dict[str, Dict]] = {}
+        self.dirty = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def _section(self, base_dir: str) -> Dict[str, Dict]:
+        return self.data.setdefault(os.path.abspath(base_dir), {})
+
+    def get(self, base_dir: str, relpath: str) -> Optional[Dict]:
+        with self.lock:
+            return self._section(base_dir).get(relpath)
+
+    def set(self, base_dir: str, relpath: str, size: int, mtime: float, sha1: str, chunks: int, settings: str):
+        with self.lock:
+            self._section(base_dir)[relpath] = {"size": size, "mtime": mtime, "sha1": sha1, "chunks": chunks,
+                                                "settings": settings}
+            self.dirty = True
+
+    def remove(self, base_dir: str, relpath: str):
+        with self.lock:
+            if self._section(base_dir).pop(relpath, None) is not None:
+                self.dirty = True
+
+    def owner(self, base_dir: str, relpath: str) -> Optional[str]:
+        """Another source directory that already indexed `relpath` (vector ids only depend on the relpath)."""
+        base = os.path.abspath(base_dir)
+        with self.lock:
+            return next((d for d, files in self.data.items() if d != base and relpath in files), None)
+
+    def outdated(self, base_dir: str, settings: str) -> int:
+        """Files of base_dir indexed with other settings (or before they were recorded)."""
+        with self.lock:
+            return sum(1 for entry in self._section(base_dir).values() if entry.get("settings") != settings)
+
+    def relpaths(self, base_dir: str) -> Set[str]:
+        with self.lock:
+            return set(self._section(base_dir))
+
+    def clear(self):
+        with self.lock:
+            self.data = {}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self.dirty = False
@@ -0,0 +1,177 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# ----------------------- metric types -----------------------
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+_INF = 'le="+Inf"'
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Counter:
+    """Monotonic counter with labels, thread-safe."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in sorted(self.values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in the Prometheus exposition layout."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple[str, ...], List[float]] = {}  # per bucket counts + [sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            v = self.values.get(key)
+            if v is None:
+                v = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    def samples(self) -> List[str]:
+        out = []
+        with self.lock:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        for key, v in items:
+            acc = 0.0
+            for bound, n in zip(self.buckets, v):
+                acc += n
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {_num(acc)}")
+            out.append(f"{self.name}_bucket{_labels(self.label_names, key, _INF)} {_num(v[-1])}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {repr(round(v[-2], 6))}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {_num(v[-1])}")
+        return out
+
+# ----------------------- registry -----------------------
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+    Collectors are callables returning (name, type, help, [(labels dict, value)])
+    for values kept elsewhere (cache hit counters...), read at scrape time.
+    """
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.collectors: List[Callable[[], List[Tuple]]] = []
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels: Tuple[str, ...], **kw):
+        with self.lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = self.metrics[name] = cls(name, help, labels, **kw)
+            return m
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def add_collector(self, fn: Callable[[], List[Tuple]]):
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        for m in list(self.metrics.values()):
+            lines += [f"# HELP {m.name} {m.help}", f"# TYPE {m.name} {m.kind}", *m.samples()]
+        for fn in self.collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                print(f"[WARN] metrics collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent in each stage of answering and ingestion.", ("stage",))
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "Exceptions raised inside a stage.", ("stage",))
+REQUESTS = REGISTRY.counter("rag_http_requests_total", "HTTP requests by route and status.", ("route", "status"))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_http_request_seconds", "HTTP request latency (time to the first event for streams).", ("route",))
+STREAM_SECONDS = REGISTRY.histogram(
+    "rag_http_stream_seconds", "Total duration of streamed responses, until the last event is sent.", ("route",))
+TOKENS = REGISTRY.counter("rag_llm_tokens_total", "Chat completion tokens, as reported by the provider.", ("type",))
+EMBEDDED = REGISTRY.counter("rag_embedded_texts_total", "Texts sent to the embedding provider.", ("kind",))
+CHUNKS = REGISTRY.counter("rag_chunks_upserted_total", "Chunks written to the vector store.")
+FILES = REGISTRY.counter("rag_ingested_files_total", "Files seen by ingestion runs, by outcome.", ("outcome",))
+DEDUP = REGISTRY.counter("rag_dedup_chunks_total", "Chunks recorded as near-duplicates of an indexed chunk (not embedded).")
+DEDUP_BYTES = REGISTRY.counter("rag_dedup_bytes_saved_total", "Chunk text and vector bytes not stored thanks to dedup.")
+SHARD_FAILURES = REGISTRY.counter(
+    "rag_shard_failures_total", "Namespaces left out of a multi-namespace retrieval.", ("reason",))
+QUERY_BATCH = REGISTRY.histogram(
+    "rag_query_embed_batch_size", "Questions embedded per micro-batched encode call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+# ----------------------- spans -----------------------
+
+@contextmanager
+def span(stage: str, info: Optional[Dict] = None) -> Iterator[None]:
+    """
+    Time a block into rag_stage_seconds{stage}. With `info` (the per-request
+    dict of RAGEngine.ask), the duration is also added to info["timings"][stage]
+    in milliseconds.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage=stage)
+        if info is not None:
+            timings = info.setdefault("timings", {})
+            timings[stage] = round(timings.get(stage, 0.0) + dt * 1000, 3)
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
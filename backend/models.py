@@ -1,20 +1,62 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, Dict, List, Optional
+
+Namespace = Annotated[str, Field(pattern=r"^[A-Za-z0-9_-]{1,64}$")]
 
 class AskRequest(BaseModel):
     question: str = Field(..., description="User natural language question")
     k: int = Field(5, ge=1, le=20, description="Top-k retrieved chunks")
+    timings: bool = Field(False, description="Include the per-stage latency breakdown in the response")
+    namespaces: Optional[List[Namespace]] = Field(default=None, min_length=1, max_length=16,
+                                                  description="Search these namespaces together instead of the default one")
 
 class Source(BaseModel):
     file: str
     chunk_id: str
     score: float
     snippet: str
+    files: List[str] = Field(default_factory=list, description="Every file containing this chunk, when near-duplicates were merged at ingestion")
+    namespace: Optional[str] = Field(default=None, description="Namespace of the chunk, when several were searched")
+
+class ContextStats(BaseModel):
+    chunks: int
+    spans: int
+    merged: int
+    duplicates: int
+    over_budget: int
+    tokens_in: int
+    tokens_out: int
+    tokens_saved: int
+
+class ShardStats(BaseModel):
+    queried: int
+    timed_out: List[str]
+    failed: List[str]
 
 class AskResponse(BaseModel):
     answer: str
     sources: List[Source]
+    context: Optional[ContextStats] = Field(default=None, description="Prompt context accounting, absent for cached answers")
+    timings: Optional[Dict[str, float]] = Field(default=None, description="Milliseconds per stage, when requested")
+    shards: Optional[ShardStats] = Field(default=None, description="Namespaces left out (timeout, error), when several were searched")
+
+class AskBatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=10000, description="Questions answered in one call")
+    k: int = Field(5, ge=1, le=20, description="Top-k retrieved chunks")
+    # None: inline up to ASK_BATCH_INLINE_MAX questions (they must finish within the gunicorn timeout), a job above
+    wait: Optional[bool] = Field(default=None, description="Answer inside the request (true) or as a background job (false)")
+
+class AskBatchItem(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: List[Source] = Field(default_factory=list)
+    context: Optional[ContextStats] = None
+    error: Optional[str] = None
+
+class AskBatchResponse(BaseModel):
+    results: List[AskBatchItem]
 
 class ReindexRequest(BaseModel):
     docs_dir: Optional[str] = Field(default="data/raw_documents")
-    clear: bool = Field(default=False, description="Clear namespace before reindexing")
\ No newline at end of file
+    clear: bool = Field(default=False, description="Clear namespace before reindexing")
+    wait: bool = Field(default=False, description="Run inside the request instead of as a background job")
\ No newline at end of file
@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from embed_scheduler import EmbeddingScheduler
+
+_DONE = object()
+
+# ----------------------- counters -----------------------
+
+class StageStats:
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0      # seconds spent doing the stage's own work
+        self.blocked = 0.0   # seconds waiting on a full downstream queue (backpressure)
+        self.lock = threading.Lock()
+
+    def add(self, items: int = 0, busy: float = 0.0, blocked: float = 0.0):
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.blocked += blocked
+
+    def as_dict(self, wall: float) -> Dict[str, float]:
+        return {
+            "unit": self.unit,
+            "items": self.items,
+            "per_sec": round(self.items / wall, 2) if wall > 0 else 0.0,
+            "busy_s": round(self.busy, 3),
+            "blocked_s": round(self.blocked, 3),
+        }
+
+
+def record_bytes(rec: Dict) -> int:
+    # rough size of one vector in an upsert request body (JSON floats ~12 chars each)
+    return len(rec["id"]) + 12 * len(rec["values"]) + len(json.dumps(rec.get("metadata") or {}, ensure_ascii=False)) + 32
+
+# ----------------------- pipeline -----------------------
+
+class ByteBudget:
+    """
+    Estimated bytes (record_bytes) queued between two stages. A producer waits
+    while its item would take the total past `limit`; an item alone always
+    passes, so one oversized batch cannot stall the pipeline.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, nbytes: int, stop: threading.Event):
+        with self.cond:
+            while self.used and self.used + nbytes > self.limit and not stop.is_set():
+                self.cond.wait(0.1)
+            self.used += nbytes
+
+    def release(self, nbytes: int):
+        with self.cond:
+            self.used -= nbytes
+            self.cond.notify_all()
+
+
+class IngestionPipeline:
+    """
+    parse -> embed -> upsert, each stage on its own thread(s) with bounded queues
+    in between, so pypdf, the embedding API and the vector store work at the same
+    time and a slow stage throttles the ones before it.
+
+      prepared     iterable of (task, sha1, chunks, error) from RAGEngine._prepared
+      make_record  (relpath, chunk_idx, chunk, vector) -> upsert dict
+      upsert       list of upsert dicts -> None
+      file_done    (task, sha1, n_chunks or None if unchanged) -> None, called once
+                   every vector of a file has been upserted
+      progress     optional (files finished, vectors upserted) -> None
+      stop         optional Event; setting it cancels the run between batches
+      skip         optional (relpath, chunk_idx, chunk) -> True when the chunk needs
+                   no vector of its own (a near-duplicate); it still counts as
+                   done for its file
+
+    Upserts are packed by estimated payload bytes (PIPELINE_UPSERT_BYTES) and item
+    count, and up to PIPELINE_UPSERT_CONCURRENCY requests run at once. Embedded
+    batches wait for the upsert stage in a queue bounded by PIPELINE_QUEUE_BYTES
+    of estimated payload, not by a vector count: 3072-dimension vectors are
+    ~100 KB each as Python floats.
+    """
+    def __init__(self, scheduler: EmbeddingScheduler,
+                 make_record: Callable[[str, int, str, List[float]], Dict],
+                 upsert: Callable[[List[Dict]], Any],
+                 file_done: Callable[[Tuple, str, Optional[int]], Any],
+                 progress: Optional[Callable[[int, int], Any]] = None,
+                 stop: Optional[threading.Event] = None,
+                 skip: Optional[Callable[[str, int, str], bool]] = None):
+        self.scheduler = scheduler
+        self.make_record = make_record
+        self.upsert = upsert
+        self.file_done = file_done
+        self.progress = progress
+        self.stop = stop or threading.Event()
+        self.skip = skip
+        self.queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", 8))
+        # chunks per queue item; documents are streamed through the pipeline in segments
+        self.segment_size = int(os.getenv("PIPELINE_SEGMENT_CHUNKS", 256))
+        self.max_batch_bytes = int(os.getenv("PIPELINE_UPSERT_BYTES", 1_800_000))
+        self.max_batch_items = int(os.getenv("PIPELINE_UPSERT_ITEMS", 1000))
+        self.upsert_concurrency = int(os.getenv("PIPELINE_UPSERT_CONCURRENCY", 4))
+        # default: two rounds of full upsert requests, so the upsert stage never starves
+        self.queue_bytes = int(os.getenv("PIPELINE_QUEUE_BYTES", 2 * self.upsert_concurrency * self.max_batch_bytes))
+
+        self.stats = {
+            "parse": StageStats("parse", "files"),
+            "embed": StageStats("embed", "chunks"),
+            "upsert": StageStats("upsert", "vectors"),
+        }
+        self.counts = {"unchanged": 0, "indexed": 0, "failed": 0}
+        self.wall = 0.0
+        self._docs: Dict[str, list] = {}  # relpath -> [task, sha1, n_chunks, remaining]
+        self._docs_lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+
+    # ---- queue helpers: never block forever, so a failing stage can stop the others ----
+    def _put(self, q: queue.Queue, item, stage: StageStats):
+        t0 = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.add(blocked=time.perf_counter() - t0)
+
+    def _get(self, q: queue.Queue):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _count(self, outcome: str):
+        with self._docs_lock:
+            self.counts[outcome] += 1
+        self._report_progress()
+
+    def _report_progress(self):
+        if self.progress is not None:
+            self.progress(sum(self.counts.values()), self.stats["upsert"].items)
+
+    def _fail(self, e: BaseException):
+        if self._error is None:
+            self._error = e
+        self.stop.set()
+
+    # ---- stages ----
+    def _parse_stage(self, prepared: Iterable[Tuple], out: queue.Queue):
+        st = self.stats["parse"]
+        try:
+            it = iter(prepared)
+            while not self.stop.is_set():
+                t0 = time.perf_counter()
+                item = next(it, _DONE)
+                st.add(busy=time.perf_counter() - t0)
+                if item is _DONE:
+                    break
+                task, digest, chunks, err = item
+                st.add(items=1)
+                if err is not None:
+                    print(f"[WARN] Skipping {task[1]}: {err}")
+                    self._count("failed")
+                    continue
+                if chunks is None:
+                    # unchanged content: nothing to embed
+                    self.file_done(task, digest, None)
+                    self._count("unchanged")
+                    continue
+                self._feed(task, digest, chunks, out, st)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(out, _DONE, st)
+
+    def _feed(self, task: Tuple, digest: str, chunks: Iterable[str], out: queue.Queue, st: StageStats):
+        """
+        Push one document's chunks downstream in segments. `chunks` may be a lazy
+        generator (streaming parse), so the total is only known at the end.
+        """
+        relpath = task[1]
+        doc = [task, digest, None, 0, False]  # task, sha1, total chunks, upserted, failed
+        with self._docs_lock:
+            self._docs[relpath] = doc
+        it, n = iter(chunks), 0
+        while not self.stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                seg = [c for _, c in zip(range(self.segment_size), it)]
+            except Exception as e:
+                st.add(busy=time.perf_counter() - t0)
+                print(f"[WARN] Skipping {relpath}: {e}")
+                with self._docs_lock:
+                    doc[4] = True
+                self._count("failed")
+                return
+            st.add(busy=time.perf_counter() - t0)
+            if not seg:
+                break
+            self._put(out, (relpath, n, seg), st)
+            n += len(seg)
+        if self.stop.is_set():
+            return
+        with self._docs_lock:
+            doc[2] = n
+            finished = doc[3] == n
+        if finished:
+            self._finish(relpath)
+
+    def _finish(self, relpath: str):
+        with self._docs_lock:
+            doc = self._docs.pop(relpath)
+        self.file_done(doc[0], doc[1], doc[2])
+        self._count("indexed")
+
+    def _embed_stage(self, inp: queue.Queue, out: queue.Queue, budget: ByteBudget):
+        """Queue items: (list of (key, upsert dict or None for a skipped chunk), estimated bytes)."""
+        st = self.stats["embed"]
+        texts: Dict[Tuple[str, int], str] = {}
+        idle = [0.0]  # time the scheduler spent waiting for parsed documents
+
+        def items():
+            while True:
+                t0 = time.perf_counter()
+                doc = self._get(inp)
+                idle[0] += time.perf_counter() - t0
+                if doc is _DONE:
+                    return
+                relpath, start, chunks = doc
+                skipped = []
+                for i, chunk in enumerate(chunks, start):
+                    if self.skip is not None and self.skip(relpath, i, chunk):
+                        skipped.append(((relpath, i), None))
+                        continue
+                    texts[(relpath, i)] = chunk
+                    yield (relpath, i), chunk
+                if skipped:
+                    self._put(out, (skipped, 0), st)
+
+        try:
+            t0, idle0 = time.perf_counter(), idle[0]
+            for batch in self.scheduler.run_batches(items()):
+                recs = [((relpath, i), self.make_record(relpath, i, texts.pop((relpath, i)), emb))
+                        for (relpath, i), emb in batch]
+                nbytes = sum(record_bytes(rec) for _, rec in recs)
+                st.add(items=len(recs), busy=time.perf_counter() - t0 - (idle[0] - idle0))
+                t1 = time.perf_counter()
+                budget.acquire(nbytes, self.stop)
+                st.add(blocked=time.perf_counter() - t1)
+                self._put(out, (recs, nbytes), st)
+                t0, idle0 = time.perf_counter(), idle[0]
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(out, _DONE, st)
+
+    def _upsert_batch(self, batch: List[Tuple[Tuple[str, int], Dict]]) -> List[Tuple[str, int]]:
+        t0 = time.perf_counter()
+        self.upsert([rec for _, rec in batch])
+        self.stats["upsert"].add(items=len(batch), busy=time.perf_counter() - t0)
+        return [key for key, _ in batch]
+
+    def _upserted(self, keys: List[Tuple[str, int]]):
+        self._report_progress()
+        for relpath, _ in keys:
+            with self._docs_lock:
+                doc = self._docs[relpath]
+                doc[3] += 1
+                # a file whose parse failed half-way is never recorded, so the next run retries it
+                finished = doc[2] is not None and doc[3] == doc[2] and not doc[4]
+            if finished:
+                self._finish(relpath)
+
+    def _upsert_stage(self, inp: queue.Queue, budget: ByteBudget):
+        with ThreadPoolExecutor(max_workers=self.upsert_concurrency) as pool:
+            pending = set()
+
+            def submit(batch):
+                nonlocal pending
+                pending.add(pool.submit(self._upsert_batch, batch))
+                # backpressure: never more than upsert_concurrency requests in flight
+                while len(pending) >= self.upsert_concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        self._upserted(fut.result())
+
+            batch, size = [], 0
+            while True:
+                item = self._get(inp)
+                if item is _DONE:
+                    break
+                entries, queued = item
+                budget.release(queued)
+                for key, rec in entries:
+                    if rec is None:
+                        # skipped chunk: nothing to upsert
+                        self._upserted([key])
+                        continue
+                    nbytes = record_bytes(rec)
+                    if batch and (size + nbytes > self.max_batch_bytes or len(batch) >= self.max_batch_items):
+                        submit(batch)
+                        batch, size = [], 0
+                    batch.append((key, rec))
+                    size += nbytes
+            if batch and not self.stop.is_set():
+                submit(batch)
+            for fut in pending:
+                self._upserted(fut.result())
+
+    def run(self, prepared: Iterable[Tuple]) -> Dict:
+        docs_q: queue.Queue = queue.Queue(maxsize=self.queue_size)  # segments of parsed chunks
+        vecs_q: queue.Queue = queue.Queue(maxsize=self.queue_size)  # embedded batches, bounded in bytes by budget
+        budget = ByteBudget(self.queue_bytes)
+        t0 = time.perf_counter()
+        parse = threading.Thread(target=self._parse_stage, args=(prepared, docs_q), name="ingest-parse", daemon=True)
+        embed = threading.Thread(target=self._embed_stage, args=(docs_q, vecs_q, budget), name="ingest-embed", daemon=True)
+        parse.start()
+        embed.start()
+        try:
+            self._upsert_stage(vecs_q, budget)
+        except BaseException as e:
+            self._fail(e)
+        parse.join()
+        embed.join()
+        self.wall = time.perf_counter() - t0
+        if self._error is not None:
+            raise self._error
+        return self.report()
+
+    def report(self) -> Dict:
+        return {
+            "cancelled": self.stop.is_set(),
+            "wall_s": round(self.wall, 3),
+            "files": dict(self.counts),
+            "stages": {name: st.as_dict(self.wall) for name, st in self.stats.items()},
+        }
@@ -0,0 +1,126 @@
+import os
+import json
+from typing import Optional
+
+import numpy as np
+
+# ----------------------- quantized first pass -----------------------
+
+MODES = ("none", "int8", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def quantization_mode(namespace: str) -> str:
+    """
+    LOCAL_QUANTIZATION is either one mode for every namespace ("int8") or
+    per-namespace pairs with an optional "*" default ("archive=binary,*=int8").
+    """
+    spec = os.getenv("LOCAL_QUANTIZATION", "none").strip()
+    if "=" in spec:
+        pairs = dict(p.strip().split("=", 1) for p in spec.split(",") if "=" in p)
+        spec = pairs.get(namespace, pairs.get("*", "none"))
+    mode = spec.strip().lower() or "none"
+    if mode not in MODES:
+        raise ValueError(f"LOCAL_QUANTIZATION mode must be one of {MODES}, got {mode!r}")
+    return mode
+
+
+class QuantizedCodes:
+    """
+    Compressed copy of a _LocalNamespace's rows, scanned instead of the float32
+    matrix on the first pass of a search:
+      int8   - codes.i8 (capacity x dim) + scales.f32: x ~ code * scale, dim + 4 bytes/vector
+      binary - codes.bits (capacity x dim/8): sign bits, dim / 8 bytes/vector
+      quant.json - mode the codes were built with
+    The codes are memory-mapped like vectors.f32 but are 4x/32x smaller, so they
+    stay in RAM when the float32 vectors no longer do; only the top_k * oversample
+    best candidates are then rescored against the float32 rows on disk.
+    This saves memory, not time: decoding and rescoring make a query slower than
+    the exact float32 scan as long as vectors.f32 fits in RAM.
+    """
+    def __init__(self, path: str, dim: int, capacity: int, mode: str):
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"unknown quantization mode: {mode}")
+        self.path = path
+        self.dim = dim
+        self.mode = mode
+        # candidates rescored per result; sign bits lose more, so binary needs a wider net
+        self.oversample = int(os.getenv("QUANT_OVERSAMPLE") or (4 if mode == "int8" else 16))
+        # rows decoded per step of a scan; small enough for the float32 temporaries to stay in cache
+        self.block = int(os.getenv("QUANT_BLOCK_ROWS", 1024))
+        self.width = dim if mode == "int8" else (dim + 7) // 8
+        self.codes_path = os.path.join(path, "codes.i8" if mode == "int8" else "codes.bits")
+        self.scales_path = os.path.join(path, "scales.f32")
+        self.state_path = os.path.join(path, "quant.json")
+
+        self.built = False
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.built = json.load(f).get("mode") == mode
+        self.capacity = 0
+        self.codes = None
+        self.scales = None
+        self.resize(capacity)
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.width + (4 if self.mode == "int8" else 0)
+
+    @staticmethod
+    def _map(path: str, dtype, width: int, capacity: int) -> np.memmap:
+        itemsize = np.dtype(dtype).itemsize * width
+        if not os.path.exists(path) or os.path.getsize(path) < capacity * itemsize:
+            with open(path, "ab") as f:
+                f.truncate(capacity * itemsize)
+        rows = os.path.getsize(path) // itemsize
+        shape = (rows, width) if width > 1 else (rows,)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def resize(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        if self.codes is not None:
+            self.flush()
+        self.codes = self._map(self.codes_path, np.int8 if self.mode == "int8" else np.uint8, self.width, capacity)
+        if self.mode == "int8":
+            self.scales = self._map(self.scales_path, np.float32, 1, capacity)
+        self.capacity = len(self.codes)
+
+    def flush(self):
+        self.codes.flush()
+        if self.scales is not None:
+            self.scales.flush()
+
+    def add(self, rows, mat: np.ndarray):
+        """Encode L2-normalized float32 rows."""
+        if self.mode == "int8":
+            scale = np.maximum(np.abs(mat).max(axis=1), 1e-12) / 127.0
+            self.codes[rows] = np.rint(mat / scale[:, None]).astype(np.int8)
+            self.scales[rows] = scale
+        else:
+            self.codes[rows] = np.packbits(mat > 0, axis=1)
+
+    def build(self, vectors: np.ndarray, size: int):
+        """Encode the first `size` rows (namespace created before quantization was enabled)."""
+        for i in range(0, size, self.block):
+            self.add(slice(i, min(i + self.block, size)), np.asarray(vectors[i:i + self.block][:size - i]))
+        self.flush()
+        with open(self.state_path, "w") as f:
+            json.dump({"mode": self.mode, "dim": self.dim}, f)
+        self.built = True
+
+    def scores(self, q: np.ndarray, rows: Optional[np.ndarray] = None, n: int = 0) -> np.ndarray:
+        """Approximate scores of `rows`, or of rows [0, n) when rows is None."""
+        total = n if rows is None else len(rows)
+        out = np.empty(total, dtype=np.float32)
+        if self.mode == "binary":
+            qbits = np.packbits(q > 0)
+        for i in range(0, total, self.block):
+            sel = slice(i, min(i + self.block, total)) if rows is None else rows[i:i + self.block]
+            if self.mode == "int8":
+                out[i:i + self.block] = (self.codes[sel].astype(np.float32) @ q) * self.scales[sel]
+            else:
+                # matching sign bits; ranks like cosine for unit vectors
+                ham = _POPCOUNT[np.bitwise_xor(self.codes[sel], qbits)].sum(axis=1, dtype=np.int32)
+                out[i:i + self.block] = self.dim - 2 * ham
+        return out
@@ -1,26 +1,47 @@
 import os
 import re
+import time
 import uuid
-from typing import List, Dict, Iterable, Tuple
+from typing import Callable, List, Dict, Iterable, Iterator, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import fcntl
+import multiprocessing
+import threading
 import unicodedata
 import hashlib
+import heapq
+from itertools import islice
+from collections import deque
+from contextlib import contextmanager
 
-from pinecone import Pinecone, ServerlessSpec
-from sentence_transformers import SentenceTransformer
-from openai import OpenAI
+# sentence_transformers (torch), openai, pypdf and docx are imported on first use:
+# importing them costs seconds, and a worker must answer /livez before that
 
-from pypdf import PdfReader
-import docx
+from vector_store import Match, make_vector_store
+from embedding_cache import open_embedding_cache
+from manifest import Manifest, file_sha1
+from embed_scheduler import EmbeddingScheduler, MicroBatcher, with_backoff
+from pipeline import IngestionPipeline
+from caches import QueryEmbeddingCache, AnswerCache
+from chunking import iter_token_chunks, token_counter
+from lexical import BM25Index, reciprocal_rank_fusion
+from chunk_store import ChunkStore
+from context import ContextBuilder
+from dedup import DedupIndex
+from snapshot import Snapshot, SnapshotWriter, bulk_upsert, restore_store
+from metrics import span, observe, EMBEDDED, TOKENS, CHUNKS, FILES, QUERY_BATCH, DEDUP, DEDUP_BYTES, SHARD_FAILURES
 
 # ----------------------- helpers -----------------------
 
 def read_text_from_file(path: str) -> str:
     p = path.lower()
     if p.endswith(".pdf"):
+        from pypdf import PdfReader
         reader = PdfReader(path)
         pages = [page.extract_text() or "" for page in reader.pages]
         return "\n".join(pages)
     if p.endswith(".docx"):
+        import docx
         d = docx.Document(path)
         return "\n".join([p.text for p in d.paragraphs])
     if p.endswith(".txt"):
@@ -28,6 +49,78 @@ def read_text_from_file(path: str) -> str:
             return f.read()
     return ""
 
+def iter_text_from_file(path: str, block_size: int = 1 << 20) -> Iterator[str]:
+    """
+    Streaming counterpart of read_text_from_file: yields PDF pages, DOCX
+    paragraphs or TXT blocks one at a time. Blocks are cut on whitespace, so no
+    word is split between two yielded pieces.
+    """
+    p = path.lower()
+    if p.endswith(".pdf"):
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+    elif p.endswith(".docx"):
+        import docx
+        d = docx.Document(path)
+        for para in d.paragraphs:
+            yield para.text
+    elif p.endswith(".txt"):
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            carry = ""
+            for block in iter(lambda: f.read(block_size), ""):
+                block = carry + block
+                # keep a trailing partial word for the next block
+                cut = len(block)
+                while cut > 0 and not block[cut - 1].isspace():
+                    cut -= 1
+                if cut == 0:
+                    carry = block
+                    continue
+                carry = block[cut:]
+                yield block[:cut]
+            if carry:
+                yield carry
+
+def iter_words(pieces: Iterable[str]) -> Iterator[str]:
+    # same tokens as clean_text(text).split(): both split on any unicode whitespace
+    for piece in pieces:
+        yield from piece.split()
+
+def iter_chunks(words: Iterable[str], chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
+    """
+    Sliding-window version of chunk_words: same chunks, but only one window of
+    words is held in memory at a time.
+    """
+    if chunk_size <= 0:
+        return
+    step = max(1, chunk_size - overlap)
+    window = deque()
+    skip = 0
+
+    def advance():
+        nonlocal skip
+        if step >= len(window):
+            skip = step - len(window)
+            window.clear()
+        else:
+            for _ in range(step):
+                window.popleft()
+
+    for w in words:
+        if skip:
+            skip -= 1
+            continue
+        window.append(w)
+        if len(window) == chunk_size:
+            yield " ".join(window)
+            advance()
+    # tail windows: chunk_words starts a chunk at every multiple of step below len(words)
+    while window:
+        yield " ".join(window)
+        advance()
+
 def clean_text(text: str) -> str:
     # basic whitespace normalization
     text = re.sub(r"\s+", " ", text)
@@ -69,6 +162,99 @@ def chunk_words(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str
             chunks.append(chunk)
     return chunks
 
+def _observe_parse(parse_s: float, chunk_s: float):
+    observe("parse", parse_s)
+    observe("chunk", chunk_s)
+
+def timed_chunks(pieces: Iterable[str], make_chunks: Callable[[Iterable[str]], Iterable[str]],
+                 record: Callable[[float, float], None] = _observe_parse) -> Iterator[str]:
+    """
+    Yield make_chunks(pieces) and, once exhausted, call record(parse seconds,
+    chunk seconds): time spent pulling pieces out of the parser vs. the rest.
+    Time spent by the consumer between chunks is not counted.
+    """
+    parse = 0.0
+
+    def timed_pieces():
+        nonlocal parse
+        it = iter(pieces)
+        while True:
+            t0 = time.perf_counter()
+            piece = next(it, None)
+            parse += time.perf_counter() - t0
+            if piece is None:
+                return
+            yield piece
+
+    total = 0.0
+    it = iter(make_chunks(timed_pieces()))
+    while True:
+        t0 = time.perf_counter()
+        chunk = next(it, None)
+        total += time.perf_counter() - t0
+        if chunk is None:
+            break
+        yield chunk
+    record(parse, total - parse)
+
+def prepare_document(path: str, old_sha1: Optional[str], chunk_size: int, overlap: int,
+                     lazy: bool = False, chunker: str = "words",
+                     record: Callable[[float, float], None] = _observe_parse) -> Tuple[str, Optional[Iterable[str]]]:
+    """
+    CPU-bound part of ingestion (hash, parse, clean, chunk), run in worker processes.
+    Returns (sha1, chunks); chunks is None when the content hash equals old_sha1.
+    With lazy=True chunks is a generator, so a document is never fully in memory.
+    chunker "words" counts chunk_size/overlap in words, "tokens" in tokenizer tokens.
+    Parse and chunk times go to record() once all chunks are produced.
+    """
+    digest = file_sha1(path)
+    if digest == old_sha1:
+        return digest, None
+    if chunker == "tokens":
+        make_chunks = lambda pieces: iter_token_chunks(pieces, chunk_size, overlap)
+    else:
+        make_chunks = lambda pieces: iter_chunks(iter_words(pieces), chunk_size, overlap)
+    chunks = timed_chunks(iter_text_from_file(path), make_chunks, record)
+    return digest, (chunks if lazy else list(chunks))
+
+def prepare_document_timed(*args, **kwargs) -> Tuple[str, Optional[List[str]], Tuple[float, float]]:
+    """prepare_document for worker processes: (sha1, chunks, (parse s, chunk s)), recorded by the parent."""
+    timings = [0.0, 0.0]
+
+    def record(parse_s: float, chunk_s: float):
+        timings[:] = [parse_s, chunk_s]
+
+    digest, chunks = prepare_document(*args, record=record, **kwargs)
+    return digest, chunks, tuple(timings)
+
+# ----------------------- HTTP clients -----------------------
+
+_openai_lock = threading.Lock()
+_openai_client = (None, None)  # (pid, client)
+
+def openai_client():
+    """
+    One OpenAI client per process, shared by embeddings and chat: its httpx pool
+    (HTTP_POOL_SIZE connections, kept alive HTTP_KEEPALIVE_S) is reused by every
+    request thread instead of reconnecting. A client inherited through fork is
+    never reused, its sockets belong to the parent.
+    """
+    global _openai_client
+    pid, client = _openai_client
+    if pid == os.getpid():
+        return client
+    with _openai_lock:
+        pid, client = _openai_client
+        if pid != os.getpid():
+            import httpx
+            from openai import OpenAI, DefaultHttpxClient
+            size = int(os.getenv("HTTP_POOL_SIZE", 32))
+            limits = httpx.Limits(max_connections=size, max_keepalive_connections=size,
+                                  keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_S", 60)))
+            client = OpenAI(http_client=DefaultHttpxClient(limits=limits))
+            _openai_client = (os.getpid(), client)
+        return client
+
 # ----------------------- embeddings providers -----------------------
 
 class EmbeddingProvider:
@@ -78,6 +264,16 @@ class EmbeddingProvider:
         self.openai_embed_model = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-large")
         self._sbert = None
         self._openai = None
+        self._lock = threading.Lock()
+        self.cache = open_embedding_cache()
+        # concurrent /ask questions share one SBERT forward pass (QUERY_BATCH_MAX_SIZE <= 1: off)
+        self.query_batcher = None
+        if self.provider == "sbert" and int(os.getenv("QUERY_BATCH_MAX_SIZE", 32)) > 1:
+            self.query_batcher = MicroBatcher(self.embed, on_batch=lambda n: QUERY_BATCH.observe(n))
+
+    @property
+    def model_name(self) -> str:
+        return self.sbert_model_name if self.provider == "sbert" else self.openai_embed_model
 
     @property
     def dim(self) -> int:
@@ -87,12 +283,37 @@ class EmbeddingProvider:
             return 3072
         return 1536 
     def _ensure_sbert(self):
+        # request threads, the warmup thread and the query batcher may all get here first
         if self._sbert is None:
-            self._sbert = SentenceTransformer(self.sbert_model_name)
+            with self._lock:
+                if self._sbert is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._sbert = SentenceTransformer(self.sbert_model_name)
 
     def _ensure_openai(self):
         if self._openai is None:
-            self._openai = OpenAI()
+            self._openai = openai_client()
+
+    def warmup(self, load_only: bool = False):
+        """
+        Load the model / client now instead of on the first request. load_only
+        (gunicorn master before fork): load the SBERT weights but run no forward
+        pass and open no connection, neither is safe to inherit through fork.
+        """
+        if self.provider == "sbert":
+            self._ensure_sbert()
+            if not load_only:
+                self._sbert.encode(["warmup"], normalize_embeddings=True)
+        elif load_only:
+            import openai  # noqa: F401
+        else:
+            self._ensure_openai()
+
+    def after_fork(self):
+        # the SBERT model stays, shared copy-on-write with the other workers
+        self._openai = None
+        self._lock = threading.Lock()
+        self.cache = open_embedding_cache()
 
     def embed(self, texts: List[str]) -> List[List[float]]:
         if self.provider == "sbert":
@@ -103,6 +324,34 @@ class EmbeddingProvider:
         resp = self._openai.embeddings.create(model=self.openai_embed_model, input=texts)
         return [d.embedding for d in resp.data]
 
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_batcher is not None:
+            return self.query_batcher.embed(text)
+        return self.embed([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Like embed(), but goes through the on-disk cache: only texts never
+        embedded before with this provider/model are sent to the provider.
+        """
+        if self.cache is None:
+            with span("embed"):
+                vectors = self.embed(texts)
+            EMBEDDED.inc(len(texts), kind="document")
+            return vectors
+        keys = [self.cache.key(self.provider, self.model_name, t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        if missing:
+            key_text = dict(zip(keys, texts))
+            with span("embed"):
+                fresh = dict(zip(missing, self.embed([key_text[k] for k in missing])))
+            EMBEDDED.inc(len(missing), kind="document")
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        self.cache.record(hits=len(texts) - len(missing), misses=len(missing))
+        return [found[k] for k in keys]
+
 # ----------------------- LLM providers -----------------------
 
 class LLMProvider:
@@ -113,30 +362,84 @@ class LLMProvider:
 
     def _ensure_openai(self):
         if self._openai is None:
-            self._openai = OpenAI()
+            self._openai = openai_client()
 
-    def answer(self, question: str, contexts: List[str]) -> str:
+    def warmup(self, load_only: bool = False):
+        if self.provider == "openai":
+            if load_only:
+                import openai  # noqa: F401
+            else:
+                self._ensure_openai()
+
+    def after_fork(self):
+        self._openai = None
+
+    @staticmethod
+    def _count_tokens(usage):
+        if usage is not None:
+            TOKENS.inc(usage.prompt_tokens or 0, type="prompt")
+            TOKENS.inc(usage.completion_tokens or 0, type="completion")
+
+    def _messages(self, question: str, contexts: List[str]) -> List[Dict]:
         # simple, deterministic prompt
         system = (
             "You are a helpful assistant. Answer using ONLY the provided context. "
             "Cite file excerpts when relevant. If unsure, say you don't know."
         )
         context_blob = "\n\n---\n".join(contexts)
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"Context:\n{context_blob}\n\nQuestion: {question}\nAnswer:"},
+        ]
+
+    def answer(self, question: str, contexts: List[str]) -> str:
         if self.provider == "openai":
             self._ensure_openai()
             resp = self._openai.chat.completions.create(
                 model=self.model,
                 temperature=0.2,
-                messages=[
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": f"Context:\n{context_blob}\n\nQuestion: {question}\nAnswer:"},
-                ],
+                messages=self._messages(question, contexts),
             )
+            self._count_tokens(getattr(resp, "usage", None))
             return resp.choices[0].message.content.strip()
         # fallback: extractive
         return "\n\n".join(contexts[:1])
 
-# ----------------------- Pinecone RAG engine -----------------------
+    def answer_stream(self, question: str, contexts: List[str]) -> Iterator[str]:
+        """Same as answer(), but yields the completion token by token as it is generated."""
+        if self.provider == "openai":
+            self._ensure_openai()
+            stream = self._openai.chat.completions.create(
+                model=self.model,
+                temperature=0.2,
+                messages=self._messages(question, contexts),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                # the last chunk carries the usage and no choices
+                self._count_tokens(getattr(chunk, "usage", None))
+            return
+        # fallback: extractive
+        yield "\n\n".join(contexts[:1])
+
+# ----------------------- RAG engine -----------------------
+
+class Shard:
+    """
+    What retrieval reads for one namespace besides its vectors: chunk texts,
+    BM25 index and dedup members. `generation` is the namespace's generation
+    file as of opening (see RAGEngine._shard).
+    """
+    def __init__(self, namespace: str, chunks: ChunkStore, lexical: Optional[BM25Index] = None,
+                 dedup: Optional[DedupIndex] = None, generation: Tuple = ()):
+        self.namespace = namespace
+        self.chunks = chunks
+        self.lexical = lexical
+        self.dedup = dedup
+        self.generation = generation
 
 class RAGEngine:
     def __init__(self):
@@ -144,37 +447,210 @@ class RAGEngine:
         self.namespace = os.getenv("INDEX_NAMESPACE", "default")
         self.chunk_size = int(os.getenv("CHUNK_SIZE", 500))
         self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", 50))
+        # unit of CHUNK_SIZE/CHUNK_OVERLAP: "words" or "tokens" (tiktoken, TOKENIZER_ENCODING)
+        self.chunker = os.getenv("CHUNKER", "words").lower()
+        if self.chunker not in ("words", "tokens"):
+            raise ValueError(f"CHUNKER must be 'words' or 'tokens', got {self.chunker!r}")
         self.top_k = int(os.getenv("TOP_K", 5))
+        # dense (vectors only), hybrid (vectors + BM25, reciprocal rank fusion) or lexical (BM25 only)
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "dense").lower()
+        if self.retrieval_mode not in ("dense", "hybrid", "lexical"):
+            raise ValueError(f"RETRIEVAL_MODE must be 'dense', 'hybrid' or 'lexical', got {self.retrieval_mode!r}")
+        # hits taken from each retriever before fusion, and the RRF damping constant
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", 50))
+        self.rrf_k = int(os.getenv("RRF_K", 60))
+        # ask_many: concurrent vector queries / concurrent chat completions
+        self.batch_query_concurrency = int(os.getenv("ASK_BATCH_QUERY_CONCURRENCY", 8))
+        self.batch_llm_concurrency = int(os.getenv("ASK_BATCH_LLM_CONCURRENCY", 4))
+        # chat completion retries on rate limits / 5xx, and the longest wait between two
+        self.llm_max_retries = int(os.getenv("LLM_MAX_RETRIES", 3))
+        self.llm_backoff_cap = float(os.getenv("LLM_BACKOFF_CAP_S", 20))
+        # processes used to parse/chunk documents during build_index (1 = in-process)
+        self.ingest_workers = int(os.getenv("INGEST_WORKERS", 1))
 
         # providers
         self.embedder = EmbeddingProvider()
         self.llm = LLMProvider()
+        # cross-document, token-budgeted embedding batches; a local SBERT model gains nothing from parallel calls
+        self.scheduler = EmbeddingScheduler(
+            self.embedder.embed_documents,
+            concurrency=1 if self.embedder.provider == "sbert" else None,
+        )
+        self.ingest_stats: Dict = {}
+        # /ask caches, dropped whenever the namespace changes
+        self.query_cache = QueryEmbeddingCache()
+        self.answer_cache = AnswerCache()
+        # merges overlapping chunks, drops near-duplicates, packs into CONTEXT_TOKEN_BUDGET
+        self.context_builder = ContextBuilder()
+        # set by warmup() once models, clients and the vector store are loaded
+        self.ready = threading.Event()
+        self.warmup_error: Optional[str] = None
 
-        # pinecone
-        api_key = os.getenv("PINECONE_API_KEY")
-        if not api_key:
-            raise RuntimeError("PINECONE_API_KEY not set")
-        self.pc = Pinecone(api_key=api_key)
-
-        self.index_name = os.getenv("PINECONE_INDEX", "upfund-rag")
-        cloud = os.getenv("PINECONE_CLOUD", "aws")
-        region = os.getenv("PINECONE_REGION", "us-east-1")
-
-        # ensure index exists with correct dimension
-        existing = {idx.name for idx in self.pc.list_indexes()}
-        if self.index_name not in existing:
-            self.pc.create_index(
-                name=self.index_name,
-                dimension=self.embedder.dim,
-                metric="cosine",
-                spec=ServerlessSpec(cloud=cloud, region=region),
-            )
-        self.index = self.pc.Index(self.index_name)
+        # chunks and vectors depend on these: files indexed with other settings are re-chunked
+        encoding = os.getenv("TOKENIZER_ENCODING", "cl100k_base") if self.chunker == "tokens" else ""
+        settings = (self.chunker, encoding, self.chunk_size, self.chunk_overlap, self.embedder.provider, self.embedder.model_name)
+        self.index_settings = hashlib.sha1("|".join(map(str, settings)).encode("utf-8")).hexdigest()[:16]
+
+        # vector store (VECTOR_STORE=pinecone|local)
+        self.index = make_vector_store(self.embedder.dim)
+        self.index_name = self.index.name
+
+        # what is indexed per source file, for incremental reindex
+        self.manifest = Manifest(self._ns_file("manifest", self.namespace))
+        # several worker processes may serve one namespace: ingestion takes the lock file, and
+        # replaces the generation file after every change so the others reload (see _sync)
+        os.makedirs(os.path.dirname(self.manifest.path) or ".", exist_ok=True)
+        self.lock_path = self._ns_file("lock", self.namespace)
+        self.generation_path = self._ns_file("generation", self.namespace)
+        self.generation = self._read_generation()
+        self._sync_lock = threading.Lock()
+
+        # chunk texts live here, vectors only carry {"file", "chunk_id"}
+        self.chunks = ChunkStore(self._ns_file("chunks", self.namespace))
+
+        # BM25 inverted index over chunk texts, maintained alongside the vectors when retrieval uses it
+        self.lexical = None
+        if self.retrieval_mode != "dense":
+            self.lexical = BM25Index(self._ns_file("lexical", self.namespace))
+
+        # opt-in (DEDUP=1): near-duplicate chunks of different files share one vector
+        self.dedup = None
+        if os.getenv("DEDUP", "0") == "1":
+            self.dedup = DedupIndex(self._ns_file("dedup", self.namespace))
+
+        # other namespaces queried by retrieve(namespaces=...): opened on first use
+        self.shard_timeout = float(os.getenv("SHARD_TIMEOUT_MS", 2000)) / 1000
+        self.shard_concurrency = int(os.getenv("SHARD_CONCURRENCY", 16))
+        self._shards: Dict[str, Shard] = {}
+        self._shards_lock = threading.Lock()
+        self._shard_pool: Optional[ThreadPoolExecutor] = None
+
+    # where each per-namespace file lives: (env var, default dir, extension)
+    NS_FILES = {
+        "manifest": ("MANIFEST_DIR", "data/index/manifests", "json"),
+        "lock": ("MANIFEST_DIR", "data/index/manifests", "lock"),
+        "generation": ("MANIFEST_DIR", "data/index/manifests", "generation"),
+        "chunks": ("CHUNK_STORE_DIR", "data/index/chunks", "sqlite"),
+        "lexical": ("LEXICAL_INDEX_DIR", "data/index/lexical", "sqlite"),
+        "dedup": ("DEDUP_INDEX_DIR", "data/index/dedup", "sqlite"),
+    }
+
+    def _ns_file(self, kind: str, namespace: str) -> str:
+        env, default, ext = self.NS_FILES[kind]
+        return os.path.join(os.getenv(env, default), f"{self.index_name}.{namespace}.{ext}")
+
+    # --------------- lifecycle ---------------
+    def warmup(self):
+        """
+        Pay now what the first request would: tokenizer, embedding model (or
+        client), LLM client, vector store (Pinecone index check, local namespace
+        mapping). Retries with backoff from WARMUP_RETRY_S (capped at 60s) until
+        it succeeds, then sets self.ready. Meant for a background thread.
+        """
+        delay = float(os.getenv("WARMUP_RETRY_S", 5))
+        while True:
+            t0 = time.perf_counter()
+            try:
+                with span("warmup"):
+                    token_counter()
+                    self.embedder.warmup()
+                    self.llm.warmup()
+                    self.index.warmup(self.namespace)
+            except Exception as e:
+                self.warmup_error = f"{type(e).__name__}: {e}"
+                print(f"[WARN] warmup failed ({self.warmup_error}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+            self.warmup_error = None
+            print(f"[WARMUP] engine ready in {time.perf_counter() - t0:.1f}s")
+            self.ready.set()
+            return
+
+    def preload(self):
+        """
+        Gunicorn master, before forking the workers: import the heavy modules and
+        load the SBERT weights once so every worker shares them copy-on-write.
+        No connection is opened and no forward pass run; each worker finishes
+        with after_fork() then warmup().
+        """
+        t0 = time.perf_counter()
+        try:
+            import pypdf, docx  # noqa: F401
+            token_counter()
+            self.embedder.warmup(load_only=True)
+            self.llm.warmup(load_only=True)
+            print(f"[WARMUP] preloaded in {time.perf_counter() - t0:.1f}s")
+        except Exception as e:
+            # the workers' warmup will retry
+            print(f"[WARN] preload failed: {type(e).__name__}: {e}")
+
+    def after_fork(self):
+        """
+        In a freshly forked worker: SQLite connections, HTTP pools and threads
+        do not survive fork, so everything holding one is reopened.
+        """
+        self.embedder.after_fork()
+        self.llm.after_fork()
+        self.index.after_fork()
+        self.chunks = ChunkStore(self.chunks.path)
+        if self.lexical is not None:
+            self.lexical = BM25Index(self.lexical.path)
+        if self.dedup is not None:
+            self.dedup = DedupIndex(self.dedup.path)
+        self._sync_lock = threading.Lock()
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        self._shard_pool = None
+        self.ready = threading.Event()
+
+    def _read_generation(self, path: Optional[str] = None) -> Tuple:
+        try:
+            st = os.stat(path or self.generation_path)
+            return st.st_ino, st.st_mtime_ns
+        except FileNotFoundError:
+            return ()
+
+    def _changed(self):
+        """The namespace changed: drop the /ask caches here and tell the other workers."""
+        self.invalidate_caches()
+        tmp = f"{self.generation_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp, self.generation_path)  # new inode: a change even within the mtime resolution
+        self.generation = self._read_generation()
+
+    def _sync(self):
+        """Reload what is cached in memory when another worker process changed the namespace."""
+        gen = self._read_generation()
+        if gen == self.generation:
+            return
+        with self._sync_lock:
+            if gen == self.generation:
+                return
+            self.invalidate_caches()
+            self.manifest = Manifest(self.manifest.path)
+            if self.lexical is not None:
+                self.lexical = BM25Index(self.lexical.path)
+            self.index.refresh(self.namespace)
+            self.generation = gen
+
+    @contextmanager
+    def _exclusive(self):
+        """One ingestion at a time per namespace, across worker processes (JOB_WORKERS is per process)."""
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._sync()
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
     # --------------- ingestion ---------------
-    def _yield_docs(self, docs_dir: str) -> Iterable[Tuple[str, str]]:
+
+    def _iter_files(self, docs_dir: str) -> Iterable[Tuple[str, str]]:
         """
-        Recursively walk docs_dir, yield (relpath, cleaned_text) for real PDF/DOCX/TXT files.
+        Recursively walk docs_dir, yield (path, relpath) for real PDF/DOCX/TXT files.
         Skips lock/temp files like ~$*.docx and empty files.
         """
         base = os.path.abspath(docs_dir)
@@ -190,41 +666,351 @@ class RAGEngine:
                 # skip empty files
                 if os.path.getsize(path) < 10:  # bytes
                     continue
-                relpath = os.path.relpath(path, base)
-                try:
-                    text = read_text_from_file(path)
-                except Exception as e:
-                    print(f"[WARN] Skipping {relpath}: {e}")
-                    continue
-                if text:
-                    yield (relpath, clean_text(text))
+                yield path, os.path.relpath(path, base)
 
+    def _yield_docs(self, docs_dir: str) -> Iterable[Tuple[str, str]]:
+        """
+        Yield (relpath, cleaned_text) for every indexable file under docs_dir.
+        """
+        for path, relpath in self._iter_files(docs_dir):
+            try:
+                text = read_text_from_file(path)
+            except Exception as e:
+                print(f"[WARN] Skipping {relpath}: {e}")
+                continue
+            if text:
+                yield (relpath, clean_text(text))
 
     def clear_namespace(self):
         # delete all vectors in namespace
         self.index.delete(delete_all=True, namespace=self.namespace)
+        self.manifest.clear()
+        self.manifest.save()
+        self.chunks.clear()
+        if self.lexical is not None:
+            self.lexical.clear()
+        if self.dedup is not None:
+            self.dedup.clear()
+        self._changed()
 
-    def build_index(self, docs_dir: str, clear: bool = False):
+    def invalidate_caches(self):
+        self.query_cache.clear()
+        self.answer_cache.clear()
+
+    def cache_stats(self) -> Dict:
+        cache = self.embedder.cache
+        return {
+            "embeddings": cache.stats() if cache is not None else None,
+            "query_embeddings": self.query_cache.stats(),
+            "answers": self.answer_cache.stats(),
+        }
+
+    def _delete_chunks(self, relpath: str, start: int, stop: int):
+        # chunk ids only depend on (relpath, chunk index), so stale ones can be rebuilt without the text
+        ids = [make_vector_id(relpath, i, "") for i in range(start, stop)]
+        if self.dedup is not None:
+            with self.dedup.lock:
+                ids = self._release(ids)
+        self._delete_vectors(ids)
+
+    def _delete_vectors(self, ids: List[str]):
+        if not ids:
+            return
+        for i in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[i:i+1000], namespace=self.namespace)
+        self.chunks.delete(ids)
+        if self.lexical is not None:
+            self.lexical.remove(ids)
+        # deletes happen mid-run (shrunk files, dedup): the other workers reload now, not at the end
+        self._changed()
+
+    def _release(self, ids: List[str]) -> List[str]:
+        """
+        Forget chunks in the dedup index and return the ids whose vector must go.
+        Duplicates have no vector; the vector of a canonical chunk that still has
+        duplicates in other files moves to one of them (_promote).
+        """
+        gone = []
+        for vid in ids:
+            kind, successor = self.dedup.remove(vid)
+            if kind == "member":
+                continue
+            if successor is not None and self._promote(vid, *successor):
+                continue
+            gone.append(vid)
+        return gone
+
+    def _promote(self, old: str, new: str, file: str, chunk: int) -> bool:
+        """Re-key canonical vector `old` as member `new` (same text; the embedding comes from the cache when on)."""
+        text = self.chunks.get_many([old]).get(old)
+        if text is None:
+            return False
+        emb = self.embedder.embed_documents([text])[0]
+        self._upsert([self._make_record(file, chunk, text, emb)])
+        self.dedup.promote(old, new)
+        self._delete_vectors([old])
+        return True
+
+    def _dedup(self, relpath: str, i: int, chunk: str, saved: Dict) -> bool:
+        """
+        Pipeline `skip` hook, before a chunk is embedded. True: the chunk near-
+        duplicates an indexed one and is only recorded as another source of that
+        vector. False: embed and upsert it as a canonical chunk.
+        """
+        vid = make_vector_id(relpath, i, chunk)
+        digest, sig = self.dedup.signature(chunk)
+        with self.dedup.lock:
+            role = self.dedup.role(vid)
+            if role is not None and role[1] == digest:
+                # canonical and unchanged: upserted again in place
+                return False
+            # the id may already have a vector: a canonical chunk whose text
+            # changed, or a chunk indexed before dedup was turned on
+            had_vector = bool(self._release([vid])) if role is not None else None
+            canon = self.dedup.find(digest, sig, relpath, exclude=vid)
+            if canon is None:
+                self.dedup.add_canonical(vid, relpath, i, digest, sig)
+                return False
+            self.dedup.add_member(vid, relpath, i, canon)
+            if had_vector or (had_vector is None and self.chunks.get_many([vid])):
+                self._delete_vectors([vid])
+        nbytes = len(chunk.encode("utf-8")) + 4 * self.embedder.dim
+        saved["chunks"] += 1
+        saved["bytes"] += nbytes
+        DEDUP.inc()
+        DEDUP_BYTES.inc(nbytes)
+        return True
+
+    def _prepared(self, tasks: Iterable[Tuple], workers: int) -> Iterable[Tuple]:
+        """
+        Run prepare_document for each (path, relpath, st, old) task and yield
+        (task, sha1, chunks, error) as results arrive. In-process, chunks is a
+        lazy generator; with workers > 1 the work is fanned out to a process
+        pool with at most 2*workers files in flight, so results stream out
+        without buffering the whole corpus.
+        """
+        def args(task):
+            path, _, _, old = task
+            return path, (old["sha1"] if old else None), self.chunk_size, self.chunk_overlap
+
+        if workers <= 1:
+            for task in tasks:
+                try:
+                    digest, chunks = prepare_document(*args(task), lazy=True, chunker=self.chunker)
+                    yield task, digest, chunks, None
+                except Exception as e:
+                    yield task, None, None, e
+            return
+
+        # not fork: this runs on a job thread of a multi-threaded worker, and a forked child would
+        # inherit locks held by other threads (SQLite, HTTP pools, torch); the children only import the parsers
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver")) as pool:
+            pending = {}
+            tasks = iter(tasks)
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < 2 * workers:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    pending[pool.submit(prepare_document_timed, *args(task), chunker=self.chunker)] = task
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    task = pending.pop(fut)
+                    try:
+                        digest, chunks, timings = fut.result()
+                        if chunks is not None:
+                            _observe_parse(*timings)
+                        yield task, digest, chunks, None
+                    except Exception as e:
+                        yield task, None, None, e
+
+    def conflicting_dir(self, base_dir: str, relpath: str) -> Optional[str]:
+        """
+        The other source directory already holding `relpath` in this namespace, if
+        any. Vector ids and chunk metadata are keyed by relpath only, so the same
+        relative name from two directories (raw documents and uploads) would
+        overwrite and delete each other's chunks: such a file is not indexed.
+        """
+        self._sync()
+        return self.manifest.owner(base_dir, relpath)
+
+    def _claim(self, base_dir: str, files: List[Tuple[str, str]]) -> Tuple[List[Tuple[str, str]], int]:
+        """(files this directory may index, number refused because another directory owns their relpath)."""
+        kept = []
+        for path, relpath in files:
+            other = self.manifest.owner(base_dir, relpath)
+            if other is not None:
+                print(f"[WARN] Skipping {relpath}: already indexed from {other}")
+                continue
+            kept.append((path, relpath))
+        return kept, len(files) - len(kept)
+
+    def _stale(self, base_dir: str, files: Iterable[Tuple[str, str]], rebuild: bool = False) -> Iterable[Tuple]:
+        """
+        Yield (path, relpath, stat, manifest entry) for files whose size/mtime changed.
+        rebuild=True yields every file and forgets its hash, so all are re-chunked;
+        so does a file indexed with other chunking/embedding settings.
+        """
+        for path, relpath in files:
+            st = os.stat(path)
+            old = self.manifest.get(base_dir, relpath)
+            if old and (rebuild or old.get("settings") != self.index_settings):
+                old = dict(old, sha1=None)
+            elif old and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+                continue
+            yield path, relpath, st, old
+
+    def _file_done(self, base_dir: str, task: Tuple, digest: str, n_chunks: Optional[int]):
+        """Drop a processed file's orphaned chunk ids and record it in the manifest."""
+        _, relpath, st, old = task
+        if n_chunks is None:
+            # touched but identical: just remember the new mtime
+            self.manifest.set(base_dir, relpath, st.st_size, st.st_mtime, digest, old["chunks"], self.index_settings)
+            return
+        # the document shrank: drop chunk ids past its new end
+        old_chunks = old["chunks"] if old else 0
+        if old_chunks > n_chunks:
+            self._delete_chunks(relpath, n_chunks, old_chunks)
+        self.manifest.set(base_dir, relpath, st.st_size, st.st_mtime, digest, n_chunks, self.index_settings)
+        self.manifest.save()
+
+    def _make_record(self, relpath: str, i: int, chunk: str, emb: List[float]) -> Dict:
+        # "text" goes to the chunk store in _upsert, not to the vector store
+        meta = {"file": relpath, "chunk_id": str(i)}
+        return {"id": make_vector_id(relpath, i, chunk), "values": emb, "metadata": meta, "text": chunk}
+
+    def _upsert(self, batch: List[Dict]):
+        texts = [(rec["id"], rec["text"]) for rec in batch]
+        with span("upsert"):
+            # texts first: a vector that can be retrieved always has its text
+            self.chunks.put_many(texts)
+            self.index.upsert(vectors=[{k: v for k, v in rec.items() if k != "text"} for rec in batch],
+                              namespace=self.namespace)
+            if self.lexical is not None:
+                self.lexical.add(texts)
+        CHUNKS.inc(len(batch))
+
+    def _ingest(self, base_dir: str, prepared: Iterable[Tuple],
+                progress: Optional[Callable[[int, int], None]] = None,
+                stop: Optional[threading.Event] = None) -> Dict:
+        """
+        Run prepared files through the parse -> embed -> upsert pipeline.
+        A file is only recorded in the manifest once all of its vectors are upserted.
+        """
+        saved = {"chunks": 0, "bytes": 0}
+        pipeline = IngestionPipeline(
+            self.scheduler,
+            make_record=self._make_record,
+            upsert=self._upsert,
+            file_done=lambda task, digest, n: self._file_done(base_dir, task, digest, n),
+            progress=progress,
+            stop=stop,
+            skip=(lambda relpath, i, chunk: self._dedup(relpath, i, chunk, saved)) if self.dedup is not None else None,
+        )
+        try:
+            report = pipeline.run(prepared)
+        except BaseException:
+            self._changed()
+            raise
+        finally:
+            self.manifest.save()
+        if report["files"]["indexed"]:
+            self._changed()
+        for outcome, n in report["files"].items():
+            FILES.inc(n, outcome=outcome)
+        if self.dedup is not None:
+            # each duplicate is one text not sent to the embedding provider and one vector + text not stored
+            report["dedup"] = {"duplicates": saved["chunks"], "embeddings_saved": saved["chunks"],
+                               "bytes_saved": saved["bytes"]}
+        self.ingest_stats = report
+        return report
+
+    def build_index(self, docs_dir: str, clear: bool = False, workers: Optional[int] = None,
+                    progress: Optional[Callable[[Dict], None]] = None,
+                    stop: Optional[threading.Event] = None) -> Dict:
+        """
+        Incremental by default: files whose size/mtime (or content hash) match the
+        manifest are skipped, changed files are re-chunked and their orphaned chunk
+        ids deleted, and vectors of files that disappeared from docs_dir are removed.
+        Parsing runs on `workers` processes (default INGEST_WORKERS) and overlaps
+        with embedding and upserting (see IngestionPipeline).
+        Returns the pipeline report (file counts, per-stage throughput).
+        `progress` receives {"files_total", "files_done", "chunks_done"} as work
+        completes; setting `stop` cancels the run (deleted files are then left alone).
+        """
+        with self._exclusive():
+            return self._build_index(docs_dir, clear, workers, progress, stop)
+
+    def _build_index(self, docs_dir: str, clear: bool, workers: Optional[int],
+                     progress: Optional[Callable[[Dict], None]],
+                     stop: Optional[threading.Event]) -> Dict:
         if clear:
             self.clear_namespace()
-        to_upsert = []
-        for relpath, text in self._yield_docs(docs_dir):
-            chunks = chunk_words(text, self.chunk_size, self.chunk_overlap)
-            if not chunks:
-                continue
-            embeddings = self.embedder.embed(chunks)
-            for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-                vid = make_vector_id(relpath, i, chunk)
-               # vid = make_vector_id(relpath, i) 
-                meta = {"file": relpath, "chunk_id": str(i), "text": chunk}
-                to_upsert.append({"id": vid, "values": emb, "metadata": meta})
-            # upsert in batches for memory safety
-            for i in range(0, len(to_upsert), 100):
-                batch = to_upsert[i:i+100]
-                self.index.upsert(vectors=batch, namespace=self.namespace)
-            to_upsert.clear()
-
-    def index_file(self, abs_path: str, base_dir: str = "data/raw_documents"):
+        cache = self.embedder.cache
+        hits0, misses0 = (cache.hits, cache.misses) if cache is not None else (0, 0)
+        found = list(self._iter_files(docs_dir))
+        files, conflicts = self._claim(docs_dir, found)
+        # vectors indexed before the BM25 or dedup index existed: re-chunk everything once (embeddings come from the cache)
+        empty = [name for name, idx in (("lexical", self.lexical), ("dedup", self.dedup)) if idx is not None and len(idx) == 0]
+        rebuild = bool(empty) and bool(self.manifest.relpaths(docs_dir))
+        if rebuild:
+            print(f"[INDEX] {' and '.join(empty)} index is empty, re-chunking all files")
+        else:
+            outdated = self.manifest.outdated(docs_dir, self.index_settings)
+            if outdated:
+                print(f"[INDEX] {outdated} files indexed with other chunking/embedding settings, re-chunking them")
+        stale = list(self._stale(docs_dir, files, rebuild))
+        skipped = len(files) - len(stale)
+
+        def on_progress(files_done: int, chunks_done: int):
+            if progress is not None:
+                progress({"files_total": len(files), "files_done": skipped + files_done, "chunks_done": chunks_done})
+
+        on_progress(0, 0)
+        report = self._ingest(docs_dir, self._prepared(stale, workers or self.ingest_workers), on_progress, stop)
+        counts = report["files"]
+        counts["unchanged"] += skipped
+        counts["failed"] += conflicts
+        counts["removed"] = 0
+
+        seen = {relpath for _, relpath in found}
+        gone = set() if report["cancelled"] else self.manifest.relpaths(docs_dir) - seen
+        for relpath in gone:
+            old = self.manifest.get(docs_dir, relpath)
+            # recorded under two directories before conflicts were refused: the chunks are the other one's now
+            if self.manifest.owner(docs_dir, relpath) is None:
+                self._delete_chunks(relpath, 0, old["chunks"])
+            self.manifest.remove(docs_dir, relpath)
+            counts["removed"] += 1
+        self.manifest.save()
+        if counts["removed"]:
+            self._changed()
+        FILES.inc(skipped, outcome="unchanged")
+        FILES.inc(counts["removed"], outcome="removed")
+
+        print(f"[INDEX] {counts['indexed']} indexed, {counts['unchanged']} unchanged, "
+              f"{counts['removed']} removed, {counts['failed']} failed")
+        for name, st in report["stages"].items():
+            print(f"[INDEX] {name}: {st['items']} {st['unit']} ({st['per_sec']:.1f}/s, "
+                  f"busy {st['busy_s']:.1f}s, blocked {st['blocked_s']:.1f}s)")
+        if cache is not None:
+            hits, misses = cache.hits - hits0, cache.misses - misses0
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            print(f"[INDEX] embedding cache: {hits} hits / {misses} misses ({rate:.0%})")
+            report["embed_cache"] = {"hits": hits, "misses": misses, "hit_rate": rate}
+        if "dedup" in report:
+            d = report["dedup"]
+            print(f"[INDEX] dedup: {d['duplicates']} near-duplicate chunks not embedded, "
+                  f"{d['bytes_saved'] / 1e6:.2f} MB saved")
+        return report
+
+    def index_file(self, abs_path: str, base_dir: str = "data/raw_documents",
+                   progress: Optional[Callable[[Dict], None]] = None,
+                   stop: Optional[threading.Event] = None):
         base = os.path.abspath(base_dir)
         abs_path = os.path.abspath(abs_path)
         assert abs_path.startswith(base), "file must be inside base_dir"
@@ -241,50 +1027,370 @@ class RAGEngine:
         if not os.path.exists(abs_path) or os.path.getsize(abs_path) < 10:
             return
 
-        try:
-            text = read_text_from_file(abs_path)
-        except Exception as e:
-            print(f"[WARN] Skipping {relpath}: {e}")
-            return
-        if not text:
-            return
-
-        #chunks = chunk_by_tokens(text, max_tokens=500, overlap=80)  # ou chunk_words(...)
-        chunks = chunk_words(text, self.chunk_size, self.chunk_overlap)
-        if not chunks:
-            return
-        embeddings = self.embedder.embed(chunks)
+        def on_progress(files_done: int, chunks_done: int):
+            if progress is not None:
+                progress({"files_total": 1, "files_done": files_done, "chunks_done": chunks_done})
 
-        to_upsert = []
-        for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-            vid = make_vector_id(relpath, i, chunk)
-            meta = {"file": relpath, "chunk_id": str(i), "text": chunk}
-            to_upsert.append({"id": vid, "values": emb, "metadata": meta})
+        with self._exclusive():
+            files, conflicts = self._claim(base_dir, [(abs_path, relpath)])
+            report = self._ingest(base_dir, self._prepared(self._stale(base_dir, files), 1), on_progress, stop)
+            report["files"]["failed"] += conflicts
+            return report
 
-        for i in range(0, len(to_upsert), 100):
-            batch = to_upsert[i:i+100]
-            self.index.upsert(vectors=batch, namespace=self.namespace)
+    # --------------- snapshots ---------------
+    def export_snapshot(self, path: str, dtype: str = "float32") -> Dict:
+        """
+        Write the namespace to the directory `path` (see snapshot.SnapshotWriter):
+        vectors as one float32 or float16 block, their ids and metadata, the chunk,
+        BM25 and dedup stores and the ingestion manifest. Runs under the ingestion
+        lock, so no reindex changes the namespace half-way.
+        """
+        t0 = time.perf_counter()
+        with self._exclusive():
+            writer = SnapshotWriter(path, self.embedder.dim, dtype)
+            for matches in self.index.scan(self.namespace):
+                writer.add(matches)
+            writer.add_store("chunks", self.chunks.path)
+            if self.lexical is not None:
+                writer.add_store("lexical", self.lexical.path)
+            if self.dedup is not None:
+                writer.add_store("dedup", self.dedup.path)
+            # source directories relative to the working directory (the app root, where docs_dir
+            # arguments are resolved), so the restored manifest matches on another host path
+            writer.add_json("files", {"root": os.getcwd(), "sections": {
+                os.path.relpath(base): files for base, files in self.manifest.data.items()}})
+            manifest = writer.close(
+                index=self.index_name, namespace=self.namespace,
+                embeddings={"provider": self.embedder.provider, "model": self.embedder.model_name, "dim": self.embedder.dim},
+            )
+        wall = time.perf_counter() - t0
+        print(f"[SNAPSHOT] exported {writer.count} vectors ({dtype}) to {path} in {wall:.1f}s")
+        return {"path": path, "vectors": writer.count, "wall_s": round(wall, 3), "manifest": manifest}
 
+    def import_snapshot(self, path: str, force: bool = False) -> Dict:
+        """
+        Replace the namespace with a snapshot of export_snapshot(): vectors are
+        bulk-upserted (snapshot.bulk_upsert), stores and manifest copied back.
+        Nothing is parsed or embedded. The snapshot must come from the same
+        embedding model (`force`: any model of the same dimension).
+        """
+        snap = Snapshot(path)
+        emb = snap.manifest.get("embeddings", {})
+        if snap.dim != self.embedder.dim:
+            raise ValueError(f"snapshot vectors have {snap.dim} dimensions, the index {self.embedder.dim}")
+        if emb.get("model") != self.embedder.model_name and not force:
+            raise ValueError(f"snapshot made with {emb.get('model')}, queries are embedded with "
+                             f"{self.embedder.model_name} (force to import anyway)")
+        t0 = time.perf_counter()
+        with self._exclusive():
+            self.clear_namespace()
+            stats = bulk_upsert(lambda batch: self.index.upsert(batch, namespace=self.namespace), snap.records())
+            CHUNKS.inc(stats["vectors"])
+            for name, store in (("chunks", self.chunks), ("lexical", self.lexical), ("dedup", self.dedup)):
+                src = snap.store(name)
+                if store is None:
+                    continue
+                if src is None:
+                    # filled again by re-chunking every file on the next reindex
+                    print(f"[WARN] snapshot has no {name} store")
+                    continue
+                restore_store(src, store.path)
+            # reopened: the BM25 statistics are held in memory, dedup checks its settings
+            if self.lexical is not None:
+                self.lexical = BM25Index(self.lexical.path)
+            if self.dedup is not None:
+                self.dedup = DedupIndex(self.dedup.path)
+            files = snap.json("files")
+            if files is not None:
+                self.manifest.data = {os.path.abspath(rel): section for rel, section in files["sections"].items()}
+                self.manifest.dirty = True
+                self.manifest.save()
+            self._changed()
+        wall = time.perf_counter() - t0
+        print(f"[SNAPSHOT] imported {stats['vectors']} vectors in {stats['requests']} upserts, "
+              f"{wall:.1f}s ({stats['vectors'] / wall if wall else 0:.0f} vectors/s)")
+        return {"path": path, **stats, "wall_s": round(wall, 3), "source": {
+            k: snap.manifest.get(k) for k in ("index", "namespace", "embeddings", "created")}}
 
     # --------------- retrieval + generation ---------------
-    def retrieve(self, question: str, k: int) -> List[Dict]:
-        q_emb = self.embedder.embed([question])[0]
-        res = self.index.query(
-            vector=q_emb,
-            top_k=k,
-            include_metadata=True,
-            namespace=self.namespace
-        )
+    def embed_query(self, question: str, info: Optional[Dict] = None) -> List[float]:
+        q_emb = self.query_cache.get_embedding(question)
+        if q_emb is None:
+            with span("embed_query", info):
+                q_emb = self.embedder.embed_query(question)
+            EMBEDDED.inc(kind="query")
+            self.query_cache.put_embedding(question, q_emb)
+        return q_emb
+
+    def retrieve(self, question: str, k: int, q_emb: Optional[List[float]] = None,
+                 info: Optional[Dict] = None, namespaces: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Top-k chunks of this engine's namespace, or the global top-k over
+        `namespaces` (see _gather); matches from another namespace carry it in
+        their metadata.
+        """
+        self._sync()
+        if not namespaces or list(namespaces) == [self.namespace]:
+            return self._with_texts(self._retrieve(question, k, q_emb, info), info)
+        return self._gather(question, k, q_emb, info, list(dict.fromkeys(namespaces)))
+
+    def _gather(self, question: str, k: int, q_emb: Optional[List[float]], info: Optional[Dict],
+                namespaces: List[str]) -> List:
+        """
+        Scatter-gather: every namespace is queried at once on the shard pool for
+        its own top-k (texts included), and the sorted lists are heap-merged into
+        the global top-k by score. A namespace that fails or has not answered
+        within SHARD_TIMEOUT_MS is left out, and listed in info["shards"],
+        rather than holding up the answer.
+        """
+        shards = [self._shard(ns) for ns in namespaces]
+        if q_emb is None and self.retrieval_mode != "lexical":
+            q_emb = self.embed_query(question, info)
+
+        def one(shard: Shard) -> List:
+            matches = self._with_texts(self._retrieve(question, k, q_emb, shard=shard), shard=shard)
+            for m in matches:
+                m.metadata["namespace"] = shard.namespace
+            return sorted(matches, key=lambda m: -(m.score or 0.0))
+
+        with self._shards_lock:
+            if self._shard_pool is None:
+                self._shard_pool = ThreadPoolExecutor(max_workers=self.shard_concurrency, thread_name_prefix="shard")
+            pool = self._shard_pool
+        with span("scatter_gather", info):
+            futures = {pool.submit(one, shard): shard.namespace for shard in shards}
+            done, pending = wait(futures, timeout=self.shard_timeout)
+        report = {"queried": len(futures), "timed_out": sorted(futures[f] for f in pending), "failed": []}
+        SHARD_FAILURES.inc(len(pending), reason="timeout")
+        results = []
+        for fut in done:
+            try:
+                results.append(fut.result())
+            except Exception as e:
+                print(f"[WARN] namespace {futures[fut]} failed: {type(e).__name__}: {e}")
+                report["failed"].append(futures[fut])
+                SHARD_FAILURES.inc(reason="error")
+        if info is not None:
+            info["shards"] = report
+        return list(islice(heapq.merge(*results, key=lambda m: -(m.score or 0.0)), k))
+
+    def unknown_namespaces(self, namespaces: Iterable[str]) -> List[str]:
+        """Namespaces never indexed here (no manifest), so retrieve() would refuse them."""
+        return [ns for ns in namespaces
+                if ns != self.namespace and not os.path.exists(self._ns_file("manifest", ns))]
+
+    def _shard(self, namespace: Optional[str] = None) -> Shard:
+        """
+        Retrieval state of `namespace` (default: this engine's). Other namespaces
+        are opened on first use and reloaded, like _sync, when their generation
+        file moved.
+        """
+        if namespace is None or namespace == self.namespace:
+            return Shard(self.namespace, self.chunks, self.lexical, self.dedup, self.generation)
+        gen = self._read_generation(self._ns_file("generation", namespace))
+        with self._shards_lock:
+            shard = self._shards.get(namespace)
+            if shard is None:
+                if self.unknown_namespaces([namespace]):
+                    raise KeyError(f"unknown namespace: {namespace}")
+                shard = Shard(
+                    namespace,
+                    ChunkStore(self._ns_file("chunks", namespace)),
+                    BM25Index(self._ns_file("lexical", namespace)) if self.lexical is not None else None,
+                    DedupIndex(self._ns_file("dedup", namespace)) if self.dedup is not None else None,
+                    gen,
+                )
+                self._shards[namespace] = shard
+            elif shard.generation != gen:
+                # cached answers may quote its old chunks
+                self.invalidate_caches()
+                if shard.lexical is not None:
+                    shard.lexical = BM25Index(shard.lexical.path)
+                self.index.refresh(namespace)
+                shard.generation = gen
+        return shard
+
+    def _retrieve(self, question: str, k: int, q_emb: Optional[List[float]] = None,
+                  info: Optional[Dict] = None, shard: Optional[Shard] = None) -> List:
+        shard = shard or self._shard()
+        if self.retrieval_mode == "lexical":
+            return self._fuse([], self._search_lexical(shard, question, k, info), k, info, shard.namespace)
+        if q_emb is None:
+            q_emb = self.embed_query(question, info)
+        with span("vector_query", info):
+            res = self.index.query(
+                vector=q_emb,
+                top_k=k if self.retrieval_mode == "dense" else max(k, self.hybrid_candidates),
+                include_metadata=True,
+                namespace=shard.namespace
+            )
         matches = getattr(res, "matches", [])
-        return matches
+        if self.retrieval_mode == "dense":
+            return matches
+        lexical = self._search_lexical(shard, question, max(k, self.hybrid_candidates), info)
+        return self._fuse(matches, lexical, k, info, shard.namespace)
+
+    def _search_lexical(self, shard: Shard, question: str, k: int, info: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        with span("lexical_search", info):
+            return shard.lexical.search(question, k)
 
-    def ask(self, question: str, k: int) -> Tuple[str, List[Dict]]:
-        matches = self.retrieve(question, k)
-        contexts = []
+    def _fuse(self, dense: List, lexical: List[Tuple[str, float]], k: int,
+              info: Optional[Dict] = None, namespace: Optional[str] = None) -> List[Match]:
+        """
+        Reciprocal rank fusion of dense matches and BM25 hits; the score of a
+        returned match is its fused score. Chunks only found by BM25 have their
+        metadata fetched from the vector store.
+        """
+        fused = reciprocal_rank_fusion([[m.id for m in dense], [vid for vid, _ in lexical]], self.rrf_k)[:k]
+        known = {m.id: m.metadata for m in dense}
+        missing = [vid for vid, _ in fused if vid not in known]
+        if missing:
+            with span("fetch", info):
+                fetched = self.index.fetch(missing, namespace=namespace or self.namespace)
+            known.update({vid: m.metadata for vid, m in fetched.items()})
+        return [Match(id=vid, score=score, metadata=known[vid]) for vid, score in fused if vid in known]
+
+    def _with_texts(self, matches: List, info: Optional[Dict] = None, shard: Optional[Shard] = None) -> List:
+        """
+        Put each match's chunk text into its metadata, with one chunk store lookup,
+        and under "files" every file sharing the chunk when dedup merged several.
+        """
+        shard = shard or self._shard()
+        with span("chunk_texts", info):
+            texts = shard.chunks.get_many([m.id for m in matches])
+            # near-duplicate chunks of other files share the vector: cite them all
+            files = shard.dedup.files([m.id for m in matches]) if shard.dedup is not None else {}
         for m in matches:
-            meta = m.metadata or {}
-            text = meta.get("text", "")
-            file = meta.get("file", "unknown")  # contient le chemin relatif
-            contexts.append(f"[File: {file}]\n{text}")
-        answer = self.llm.answer(question, contexts)
-        return answer, matches
+            if m.metadata is None:
+                m.metadata = {}
+            # vectors indexed before the chunk store still carry their text in metadata
+            if m.id in texts:
+                m.metadata["text"] = texts[m.id]
+            if m.id in files:
+                m.metadata["files"] = files[m.id]
+        return matches
+
+    @staticmethod
+    def _cache_ids(matches: List) -> Tuple[str, ...]:
+        # answer cache key; vector ids only depend on relpath, so the same id can exist in two namespaces
+        return tuple(f"{m.metadata['namespace']}/{m.id}" if "namespace" in (m.metadata or {}) else m.id
+                     for m in matches)
+
+    def _contexts(self, matches: List[Dict], info: Optional[Dict] = None) -> List[str]:
+        # "[File: relpath]\ntext" blocks; info["context"] receives the token accounting
+        with span("context", info):
+            contexts, stats = self.context_builder.build(matches)
+        if info is not None:
+            info["context"] = stats
+        return contexts
+
+    def ask(self, question: str, k: int, info: Optional[Dict] = None,
+            namespaces: Optional[List[str]] = None) -> Tuple[str, List[Dict]]:
+        """
+        `info`, when given, is filled with per-request details: context token
+        stats and "timings", milliseconds per stage (embed_query, vector_query,
+        chunk_texts, context, llm... and the whole "ask"), plus "shards" when
+        several `namespaces` are searched.
+        """
+        with span("ask", info):
+            q_emb = self.embed_query(question, info)
+            matches = self.retrieve(question, k, q_emb, info, namespaces)
+            ids = self._cache_ids(matches)
+            cached = self.answer_cache.get(question, q_emb, ids, k)
+            if cached is not None:
+                return cached, matches
+            contexts = self._contexts(matches, info)
+            with span("llm", info):
+                answer = self.llm.answer(question, contexts)
+            self.answer_cache.put(question, q_emb, ids, k, answer)
+            return answer, matches
+
+    def ask_stream(self, question: str, k: int, info: Optional[Dict] = None,
+                   namespaces: Optional[List[str]] = None) -> Tuple[List[Dict], Iterator[str]]:
+        """
+        Retrieve first, then return (matches, token iterator) so callers can send
+        the sources before generation starts. The full answer is cached once the
+        iterator is exhausted.
+        """
+        q_emb = self.embed_query(question, info)
+        matches = self.retrieve(question, k, q_emb, info, namespaces)
+        ids = self._cache_ids(matches)
+        cached = self.answer_cache.get(question, q_emb, ids, k)
+        if cached is not None:
+            return matches, iter([cached])
+        contexts = self._contexts(matches, info)
+
+        def tokens():
+            parts = []
+            with span("llm", info):
+                t0 = time.perf_counter()
+                for t in self.llm.answer_stream(question, contexts):
+                    if not parts:
+                        first = time.perf_counter() - t0
+                        observe("llm_first_token", first)
+                        if info is not None:
+                            info.setdefault("timings", {})["llm_first_token"] = round(first * 1000, 3)
+                    parts.append(t)
+                    yield t
+            self.answer_cache.put(question, q_emb, ids, k, "".join(parts).strip())
+
+        return matches, tokens()
+
+    def ask_many(self, questions: List[str], k: int,
+                 progress: Optional[Callable[[Dict], None]] = None,
+                 stop: Optional[threading.Event] = None) -> List[Dict]:
+        """
+        Answer many questions at once: all query embeddings in batched calls, vector
+        queries fanned out on a thread pool, chat completions bounded by
+        ASK_BATCH_LLM_CONCURRENCY. Returns one dict per question, in order:
+        {"answer", "matches", "context"} or {"error"}. As a job, `progress` gets
+        the questions answered so far (files_total / files_done) and questions not
+        started when `stop` is set come back as {"error": "cancelled"}.
+        """
+        embs: List[Optional[List[float]]] = [self.query_cache.get_embedding(q) for q in questions]
+        missing = list(dict.fromkeys(q for q, e in zip(questions, embs) if e is None))
+        fresh = {}
+        for i in range(0, len(missing), self.scheduler.max_items):
+            part = missing[i:i + self.scheduler.max_items]
+            with span("embed_query"):
+                vectors = with_backoff(lambda: self.embedder.embed(part), self.scheduler.max_retries)
+            EMBEDDED.inc(len(part), kind="query")
+            for q, emb in zip(part, vectors):
+                self.query_cache.put_embedding(q, emb)
+                fresh[q] = emb
+        embs = [e if e is not None else fresh[q] for q, e in zip(questions, embs)]
+
+        llm_slots = threading.Semaphore(self.batch_llm_concurrency)
+        done_lock, done = threading.Lock(), [0]
+
+        def report():
+            if progress is not None:
+                with done_lock:
+                    done[0] += 1
+                    progress({"files_total": len(questions), "files_done": done[0]})
+
+        def one(i: int) -> Dict:
+            question, q_emb = questions[i], embs[i]
+            if stop is not None and stop.is_set():
+                return {"error": "cancelled"}
+            try:
+                matches = self.retrieve(question, k, q_emb)
+                ids = self._cache_ids(matches)
+                answer = self.answer_cache.get(question, q_emb, ids, k)
+                info: Dict = {}
+                if answer is None:
+                    contexts = self._contexts(matches, info)
+                    with llm_slots, span("llm"):
+                        answer = with_backoff(lambda: self.llm.answer(question, contexts),
+                                              self.llm_max_retries, cap=self.llm_backoff_cap, label="LLM")
+                    self.answer_cache.put(question, q_emb, ids, k, answer)
+                return {"answer": answer, "matches": matches, "context": info.get("context")}
+            except Exception as e:
+                return {"error": str(e)}
+            finally:
+                report()
+
+        if progress is not None:
+            progress({"files_total": len(questions), "files_done": 0})
+        with ThreadPoolExecutor(max_workers=max(1, min(self.batch_query_concurrency, len(questions)))) as pool:
+            return list(pool.map(one, range(len(questions))))
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import sqlite3
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from pipeline import record_bytes
+from vector_store import Match
+
+# ----------------------- snapshot format -----------------------
+
+FORMAT = 1
+DTYPES = {"float32": np.float32, "float16": np.float16}
+
+class SnapshotWriter:
+    """
+    One namespace as a directory of flat files:
+      vectors.f32|f16 - all vectors, one contiguous row-major block (count x dim), no header
+      ids.jsonl       - vector id of each row, in the same order
+      metadata.jsonl  - vector metadata of each row
+      <name>.sqlite   - consistent copies of the chunk, BM25 and dedup stores
+      files.json      - the ingestion manifest (incremental reindex), source
+                        directories relative to the exporting working directory
+      manifest.json   - format, embedding model and dimension, dtype, row count;
+                        written last, so an interrupted export is not a snapshot
+    """
+    def __init__(self, path: str, dim: int, dtype: str = "float32"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+        if os.path.exists(os.path.join(path, "manifest.json")):
+            raise FileExistsError(f"{path} already holds a snapshot")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.count = 0
+        self.vectors_file = "vectors." + ("f16" if dtype == "float16" else "f32")
+        self._vectors = open(os.path.join(path, self.vectors_file), "wb")
+        self._ids = open(os.path.join(path, "ids.jsonl"), "w", encoding="utf-8")
+        self._metadata = open(os.path.join(path, "metadata.jsonl"), "w", encoding="utf-8")
+        self.stores: List[str] = []
+
+    def add(self, matches: List[Match]):
+        if not matches:
+            return
+        block = np.asarray([m.values for m in matches], dtype=DTYPES[self.dtype])
+        if block.shape[1] != self.dim:
+            raise ValueError(f"vector dimension {block.shape[1]} does not match index dimension {self.dim}")
+        self._vectors.write(block.tobytes())
+        self._ids.writelines(json.dumps(m.id, ensure_ascii=False) + "\n" for m in matches)
+        self._metadata.writelines(json.dumps(m.metadata or {}, ensure_ascii=False) + "\n" for m in matches)
+        self.count += len(matches)
+
+    def add_store(self, name: str, db_path: str):
+        """Online copy of a SQLite store (sqlite3 backup API), readers and WAL included."""
+        if not os.path.exists(db_path):
+            return
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(os.path.join(self.path, f"{name}.sqlite"))
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        self.stores.append(name)
+
+    def add_json(self, name: str, data):
+        with open(os.path.join(self.path, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def close(self, **info) -> Dict:
+        for f in (self._vectors, self._ids, self._metadata):
+            f.close()
+        manifest = {
+            "format": FORMAT,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            **info,
+            "vectors": {"file": self.vectors_file, "dtype": self.dtype, "dim": self.dim, "count": self.count},
+            "stores": self.stores,
+        }
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+        return manifest
+
+
+class Snapshot:
+    """A snapshot written by SnapshotWriter; the vector block is memory-mapped, not loaded."""
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{path} is not a snapshot (no manifest.json)") from None
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"unsupported snapshot format: {self.manifest.get('format')}")
+        v = self.manifest["vectors"]
+        self.dim, self.count = v["dim"], v["count"]
+        dtype = DTYPES[v["dtype"]]
+        vec_path = os.path.join(path, v["file"])
+        expected = self.count * self.dim * np.dtype(dtype).itemsize
+        if os.path.getsize(vec_path) != expected:
+            raise ValueError(f"{v['file']} is {os.path.getsize(vec_path)} bytes, expected {expected}")
+        self.vectors = np.memmap(vec_path, dtype=dtype, mode="r", shape=(self.count, self.dim)) if self.count else None
+
+    def records(self, batch: int = 1000) -> Iterator[Dict]:
+        """Upsert dicts, float32 values, read sequentially `batch` rows at a time."""
+        with open(os.path.join(self.path, "ids.jsonl"), encoding="utf-8") as ids, \
+                open(os.path.join(self.path, "metadata.jsonl"), encoding="utf-8") as metas:
+            for start in range(0, self.count, batch):
+                block = np.asarray(self.vectors[start:start + batch], dtype=np.float32)
+                for row in block:
+                    yield {"id": json.loads(next(ids)), "values": row.tolist(), "metadata": json.loads(next(metas))}
+
+    def store(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, f"{name}.sqlite") if name in self.manifest.get("stores", []) else None
+
+    def json(self, name: str):
+        p = os.path.join(self.path, f"{name}.json")
+        if not os.path.exists(p):
+            return None
+        with open(p, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def restore_store(src_path: str, db_path: str):
+    """Overwrite the SQLite store at db_path with a snapshot copy, in place (open connections see it)."""
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(db_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+# ----------------------- bulk load -----------------------
+
+def bulk_upsert(upsert: Callable[[List[Dict]], object], records: Iterable[Dict],
+                progress: Optional[Callable[[int], None]] = None) -> Dict:
+    """
+    Upsert `records` packed like the ingestion pipeline does (PIPELINE_UPSERT_BYTES
+    of estimated payload, PIPELINE_UPSERT_ITEMS vectors), with up to
+    PIPELINE_UPSERT_CONCURRENCY requests in flight. Records are read lazily, so
+    memory stays at a few batches whatever the snapshot size.
+    """
+    max_bytes = int(os.getenv("PIPELINE_UPSERT_BYTES", 1_800_000))
+    max_items = int(os.getenv("PIPELINE_UPSERT_ITEMS", 1000))
+    concurrency = int(os.getenv("PIPELINE_UPSERT_CONCURRENCY", 4))
+    stats = {"vectors": 0, "requests": 0, "bytes": 0}
+
+    def send(batch: List[Dict]) -> int:
+        upsert(batch)
+        return len(batch)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+
+        def drain(limit: int):
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    stats["vectors"] += fut.result()
+                    if progress is not None:
+                        progress(stats["vectors"])
+
+        batch, size = [], 0
+        for rec in records:
+            nbytes = record_bytes(rec)
+            if batch and (size + nbytes > max_bytes or len(batch) >= max_items):
+                pending.add(pool.submit(send, batch))
+                stats["requests"] += 1
+                drain(concurrency - 1)
+                batch, size = [], 0
+            batch.append(rec)
+            size += nbytes
+            stats["bytes"] += nbytes
+        if batch:
+            pending.add(pool.submit(send, batch))
+            stats["requests"] += 1
+        drain(0)
+    return stats
@@ -0,0 +1,457 @@
+import os
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Iterator, List, Dict, Optional
+
+import numpy as np
+
+from ann import IVFIndex
+from quant import QuantizedCodes, quantization_mode
+
+# ----------------------- results -----------------------
+
+@dataclass
+class Match:
+    # same attribute names as Pinecone's ScoredVector so callers don't care which backend answered
+    id: str
+    score: float
+    metadata: Optional[Dict] = None
+    values: Optional[List[float]] = None
+
+@dataclass
+class QueryResult:
+    matches: List[Match] = field(default_factory=list)
+
+# ----------------------- interface -----------------------
+
+class VectorStore:
+    """
+    Minimal subset of the Pinecone Index API used by RAGEngine.
+    Backends: PineconeStore (remote) and LocalVectorStore (NumPy, memory-mapped).
+    """
+    name: str = ""
+
+    def upsert(self, vectors: List[Dict], namespace: str = "default"):
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool = True,
+              include_values: bool = False, namespace: str = "default") -> QueryResult:
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = "default"):
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], namespace: str = "default") -> Dict[str, Match]:
+        """id -> Match (score 0, with metadata) for the ids that exist."""
+        raise NotImplementedError
+
+    def scan(self, namespace: str = "default", batch: int = 1000) -> Iterator[List[Match]]:
+        """Every vector of `namespace`, values and metadata included, `batch` at a time."""
+        raise NotImplementedError
+
+    def warmup(self, namespace: str = "default"):
+        """Connect / load `namespace` now rather than on the first request."""
+
+    def refresh(self, namespace: str = "default"):
+        """Another process changed `namespace`: drop what is cached of it in memory."""
+
+    def after_fork(self):
+        """In a forked worker: connections, pools and locks of the parent are not usable."""
+
+# ----------------------- pinecone -----------------------
+
+class PineconeStore(VectorStore):
+    """
+    The pinecone client is imported and the index checked (list_indexes, created
+    if missing) on first use or in warmup(), not in __init__: a slow control
+    plane must not block the API from starting.
+    """
+    def __init__(self, dim: int):
+        self.api_key = os.getenv("PINECONE_API_KEY")
+        if not self.api_key:
+            raise RuntimeError("PINECONE_API_KEY not set")
+        self.dim = dim
+        self.name = os.getenv("PINECONE_INDEX", "upfund-rag")
+        self.cloud = os.getenv("PINECONE_CLOUD", "aws")
+        self.region = os.getenv("PINECONE_REGION", "us-east-1")
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    from pinecone import Pinecone, ServerlessSpec
+                    pc = Pinecone(api_key=self.api_key)
+                    # ensure index exists with correct dimension
+                    existing = {idx.name for idx in pc.list_indexes()}
+                    if self.name not in existing:
+                        pc.create_index(
+                            name=self.name,
+                            dimension=self.dim,
+                            metric="cosine",
+                            spec=ServerlessSpec(cloud=self.cloud, region=self.region),
+                        )
+                    # urllib3 pool with keep-alive, sized for the request threads of a worker
+                    pc.openapi_config.connection_pool_maxsize = int(os.getenv("HTTP_POOL_SIZE", 32))
+                    self._index = pc.Index(self.name)
+        return self._index
+
+    def warmup(self, namespace: str = "default"):
+        self.index
+
+    def after_fork(self):
+        # reconnect lazily in the child; the parent's sockets stay the parent's
+        self._index = None
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[Dict], namespace: str = "default"):
+        return self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool = True,
+              include_values: bool = False, namespace: str = "default"):
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata,
+                                include_values=include_values, namespace=namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = "default"):
+        if delete_all:
+            return self.index.delete(delete_all=True, namespace=namespace)
+        if ids:
+            return self.index.delete(ids=ids, namespace=namespace)
+
+    def fetch(self, ids: List[str], namespace: str = "default") -> Dict[str, Match]:
+        out = {}
+        for i in range(0, len(ids), 1000):
+            res = self.index.fetch(ids=ids[i:i + 1000], namespace=namespace)
+            for vid, v in (res.vectors or {}).items():
+                out[vid] = Match(id=vid, score=0.0, metadata=getattr(v, "metadata", None))
+        return out
+
+    def scan(self, namespace: str = "default", batch: int = 1000) -> Iterator[List[Match]]:
+        # list() pages ids (serverless indexes only), fetch() returns their values
+        ids: List[str] = []
+        pages = self.index.list(namespace=namespace)
+        while True:
+            page = next(pages, None)
+            if page:
+                ids.extend(page)
+            if ids and (page is None or len(ids) >= batch):
+                res = self.index.fetch(ids=ids[:batch], namespace=namespace)
+                vectors = res.vectors or {}
+                yield [Match(id=vid, score=0.0, metadata=getattr(vectors[vid], "metadata", None),
+                             values=list(vectors[vid].values)) for vid in ids[:batch] if vid in vectors]
+                ids = ids[batch:]
+            if page is None and not ids:
+                return
+
+# ----------------------- local (NumPy + mmap) -----------------------
+
+class _LocalNamespace:
+    """
+    One namespace on disk:
+      vectors.f32  - float32 matrix (capacity x dim), memory-mapped, rows are L2-normalized
+      rows.sqlite  - row number -> vector id + JSON metadata
+    Rows freed by delete() are reused by later upserts.
+    With LOCAL_INDEX_TYPE=ivf an IVFIndex narrows the scan to a few inverted lists.
+    With LOCAL_QUANTIZATION=int8|binary the scan runs over QuantizedCodes and only
+    the best candidates are rescored against vectors.f32.
+    """
+    MIN_CAPACITY = 1024
+
+    def __init__(self, path: str, dim: int):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(path, "rows.sqlite"), check_same_thread=False)
+        # read by every worker while ingestion writes: WAL readers never wait on the writer
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.execute("CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, metadata TEXT)")
+        self.db.commit()
+
+        self.ids: Dict[str, int] = {}
+        for row, vid in self.db.execute("SELECT row, id FROM rows"):
+            self.ids[vid] = row
+        self.size = max(self.ids.values()) + 1 if self.ids else 0  # rows in use, including holes
+
+        self.vec_path = os.path.join(path, "vectors.f32")
+        self.capacity = 0
+        self.vectors = None
+        self._open(max(self.MIN_CAPACITY, self.size))
+
+        self.live = np.zeros(self.capacity, dtype=bool)
+        if self.ids:
+            self.live[list(self.ids.values())] = True
+        self.free = sorted(set(range(self.size)) - set(self.ids.values()), reverse=True)
+
+        self.index_type = os.getenv("LOCAL_INDEX_TYPE", "flat").lower()
+        self.ann = IVFIndex(path, dim, self.capacity) if self.index_type == "ivf" else None
+
+        # the namespace name is the directory name
+        self.quant_mode = quantization_mode(os.path.basename(os.path.normpath(path)))
+        self.quant = None
+        if self.quant_mode != "none":
+            self.quant = QuantizedCodes(path, dim, self.capacity, self.quant_mode)
+            if not self.quant.built:
+                self.quant.build(self.vectors, self.size)
+        elif os.path.exists(os.path.join(path, "quant.json")):
+            # codes are not maintained without quantization: rebuild them if it is turned back on
+            os.remove(os.path.join(path, "quant.json"))
+
+    def _open(self, capacity: int):
+        nbytes = capacity * self.dim * 4
+        if not os.path.exists(self.vec_path) or os.path.getsize(self.vec_path) < nbytes:
+            with open(self.vec_path, "ab") as f:
+                f.truncate(nbytes)
+        self.capacity = os.path.getsize(self.vec_path) // (self.dim * 4)
+        self.vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _grow(self, needed: int):
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.vectors.flush()
+        del self.vectors
+        self._open(capacity)
+        live = np.zeros(self.capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+        if self.ann is not None:
+            self.ann.resize(self.capacity)
+        if self.quant is not None:
+            self.quant.resize(self.capacity)
+
+    def _alloc(self) -> int:
+        if self.free:
+            return self.free.pop()
+        self._grow(self.size + 1)
+        self.size += 1
+        return self.size - 1
+
+    def upsert(self, vectors: List[Dict]):
+        if not vectors:
+            return
+        mat = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if mat.shape[1] != self.dim:
+            raise ValueError(f"vector dimension {mat.shape[1]} does not match index dimension {self.dim}")
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        mat /= np.maximum(norms, 1e-12)
+        training = None
+        with self.lock:
+            rows = []
+            for v in vectors:
+                row = self.ids.get(v["id"])
+                if row is None:
+                    row = self._alloc()
+                    self.ids[v["id"]] = row
+                rows.append(row)
+            self.vectors[rows] = mat
+            self.live[rows] = True
+            self.vectors.flush()
+            if self.quant is not None:
+                self.quant.add(rows, mat)
+                self.quant.flush()
+            if self.ann is not None:
+                self.ann.add(rows, mat)
+                training = self.ann.begin_training(self.live[:self.size])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, metadata) VALUES (?, ?, ?)",
+                [(row, v["id"], json.dumps(v.get("metadata") or {})) for row, v in zip(rows, vectors)],
+            )
+            self.db.commit()
+        if training is not None:
+            self._train(*training)
+
+    def _train(self, epoch: int, live_rows: np.ndarray):
+        # k-means over up to nlist * 256 rows takes seconds: queries and other upserts go on
+        # meanwhile (with the previous lists, or exact search before the first training)
+        vectors = self.vectors  # _grow() may reopen the file meanwhile; this map stays valid
+        try:
+            centroids, lists = self.ann.fit(vectors, live_rows)
+        except BaseException:
+            with self.lock:
+                self.ann.abort_training()
+            raise
+        with self.lock:
+            self.ann.install(epoch, centroids, live_rows, lists, self.vectors, self.live[:self.size])
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False):
+        with self.lock:
+            if delete_all:
+                self.db.execute("DELETE FROM rows")
+                self.db.commit()
+                self.ids.clear()
+                self.live[:] = False
+                self.size = 0
+                self.free = []
+                if self.ann is not None:
+                    self.ann.reset()
+                return
+            rows = [self.ids.pop(vid) for vid in ids or [] if vid in self.ids]
+            if not rows:
+                return
+            self.live[rows] = False
+            self.free.extend(rows)
+            self.free.sort(reverse=True)
+            self.db.executemany("DELETE FROM rows WHERE row = ?", [(r,) for r in rows])
+            self.db.commit()
+
+    def fetch(self, ids: List[str]) -> Dict[str, Match]:
+        with self.lock:
+            rows = [self.ids[i] for i in ids if i in self.ids]
+            if not rows:
+                return {}
+            # another process may have deleted a row, or reused it for another id, since ids was loaded
+            wanted = set(ids)
+            return {vid: Match(id=vid, score=0.0, metadata=json.loads(meta) if meta else None)
+                    for vid, meta in self._rows_meta(rows).values() if vid in wanted}
+
+    def scan(self, batch: int) -> Iterator[List[Match]]:
+        with self.lock:
+            rows = sorted(self.ids.values())
+        # ascending rows read vectors.f32 sequentially; rows deleted since are skipped
+        for i in range(0, len(rows), batch):
+            with self.lock:
+                info = self._rows_meta(rows[i:i + batch])
+                part = [r for r in rows[i:i + batch] if r in info]
+                values = np.array(self.vectors[part])
+            yield [Match(id=info[r][0], score=0.0, metadata=json.loads(info[r][1]) if info[r][1] else None,
+                         values=v) for r, v in zip(part, values)]
+
+    def _rows_meta(self, rows: List[int]) -> Dict[int, tuple]:
+        marks = ",".join("?" * len(rows))
+        cur = self.db.execute(f"SELECT row, id, metadata FROM rows WHERE row IN ({marks})", rows)
+        return {row: (vid, meta) for row, vid, meta in cur}
+
+    def _score(self, q: np.ndarray, nprobe: Optional[int] = None, top_k: Optional[int] = None):
+        """Return (rows, scores) of the live candidates for q."""
+        n = self.size
+        if self.quant is not None and top_k:
+            return self._rescore(q, nprobe, top_k)
+        if self.ann is not None and self.ann.trained:
+            rows = self.ann.candidates(q, nprobe)
+            rows = rows[self.live[rows]]
+            return rows, self.vectors[rows] @ q
+        # exact cosine: rows are unit length, so one matrix-vector product scores the whole namespace
+        scores = self.vectors[:n] @ q
+        live = self.live[:n]
+        scores[~live] = -np.inf
+        return np.arange(n), scores
+
+    def _rescore(self, q: np.ndarray, nprobe: Optional[int], top_k: int):
+        """First pass on the quantized codes, exact float32 scores for the best top_k * oversample."""
+        if self.ann is not None and self.ann.trained:
+            rows = self.ann.candidates(q, nprobe)
+            rows = rows[self.live[rows]]
+            approx = self.quant.scores(q, rows=rows)
+        else:
+            rows = np.arange(self.size)
+            approx = self.quant.scores(q, n=self.size)
+            approx[~self.live[:self.size]] = -np.inf
+        m = min(top_k * self.quant.oversample, len(rows))
+        if m <= 0:
+            return rows[:0], approx[:0]
+        pick = np.argpartition(-approx, m - 1)[:m]
+        pick = pick[np.isfinite(approx[pick])]
+        # ascending row order reads vectors.f32 sequentially
+        rows = np.sort(rows[pick])
+        return rows, self.vectors[rows] @ q
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool, include_values: bool,
+              nprobe: Optional[int] = None) -> List[Match]:
+        q = np.asarray(vector, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        with self.lock:
+            cand, scores = self._score(q, nprobe, top_k)
+            k = min(top_k, len(cand), len(self.ids))
+            if k <= 0:
+                return []
+            # a few spare candidates: rows deleted by another process are skipped below
+            m = min(2 * k, len(cand))
+            top = np.argpartition(-scores, m - 1)[:m]
+            top = top[np.argsort(-scores[top])]
+            top = top[np.isfinite(scores[top])]
+            rows = cand[top].tolist()
+            info = self._rows_meta(rows)
+            matches = []
+            for row, score in zip(rows, scores[top].tolist()):
+                if len(matches) == k:
+                    break
+                if row not in info:
+                    # deleted in rows.sqlite by another process; ids/live catch up on refresh()
+                    continue
+                vid, meta = info[row]
+                matches.append(Match(
+                    id=vid,
+                    score=float(score),
+                    metadata=json.loads(meta) if include_metadata and meta else None,
+                    values=self.vectors[row].tolist() if include_values else None,
+                ))
+            return matches
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process cosine search. Each namespace lives in LOCAL_INDEX_DIR/<index>/<namespace>/.
+    LOCAL_INDEX_TYPE=flat (exact, default) or ivf (approximate, see ann.IVFIndex).
+    """
+    def __init__(self, dim: int):
+        self.name = os.getenv("LOCAL_INDEX_NAME", "upfund-rag")
+        self.root = os.path.join(os.getenv("LOCAL_INDEX_DIR", "data/index"), self.name)
+        self.dim = dim
+        self._namespaces: Dict[str, _LocalNamespace] = {}
+        self._lock = threading.Lock()
+
+    def _ns(self, namespace: str) -> _LocalNamespace:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                ns = _LocalNamespace(os.path.join(self.root, namespace), self.dim)
+                self._namespaces[namespace] = ns
+            return ns
+
+    def upsert(self, vectors: List[Dict], namespace: str = "default"):
+        self._ns(namespace).upsert(vectors)
+
+    def query(self, vector: List[float], top_k: int, include_metadata: bool = True,
+              include_values: bool = False, namespace: str = "default") -> QueryResult:
+        return QueryResult(matches=self._ns(namespace).query(vector, top_k, include_metadata, include_values))
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False, namespace: str = "default"):
+        self._ns(namespace).delete(ids=ids, delete_all=delete_all)
+
+    def fetch(self, ids: List[str], namespace: str = "default") -> Dict[str, Match]:
+        return self._ns(namespace).fetch(ids)
+
+    def scan(self, namespace: str = "default", batch: int = 1000) -> Iterator[List[Match]]:
+        return self._ns(namespace).scan(batch)
+
+    def warmup(self, namespace: str = "default"):
+        # maps the vectors, loads the IVF lists and builds missing quantized codes
+        self._ns(namespace)
+
+    def refresh(self, namespace: str = "default"):
+        # reopened from disk on next use
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+
+    def after_fork(self):
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+# ----------------------- factory -----------------------
+
+def make_vector_store(dim: int) -> VectorStore:
+    backend = os.getenv("VECTOR_STORE", "pinecone").lower()
+    if backend == "local":
+        return LocalVectorStore(dim)
+    if backend == "pinecone":
+        return PineconeStore(dim)
+    raise RuntimeError(f"Unknown VECTOR_STORE: {backend}")
@@ -1,14 +1,16 @@
-import os, html, uuid, requests, streamlit as st
+import os, html, json, uuid, requests, streamlit as st
 import streamlit.components.v1 as components
 from datetime import datetime
 
 # ----------------- Config backend -----------------
 BACKEND_URL      = os.getenv("BACKEND_URL", "http://localhost:8000")
 ASK_URL          = f"{BACKEND_URL}/ask"
+ASK_STREAM_URL   = f"{BACKEND_URL}/ask_stream"
 REINDEX_URL      = f"{BACKEND_URL}/reindex"
 DOCS_UPLOAD_URL  = f"{BACKEND_URL}/upload"
 LIST_UPLOADS_URL = f"{BACKEND_URL}/list_user_uploads"
 HEALTH_URL       = f"{BACKEND_URL}/healthcheck"
+JOBS_URL         = f"{BACKEND_URL}/jobs"
 
 # ----------------- Page setup -----------------
 st.set_page_config(page_title="Upfund", page_icon="🧠", layout="wide")
@@ -79,6 +81,7 @@ if "current_chat_id" not in st.session_state:
     st.session_state.chats[cid] = {"title":"New chat","created_at": datetime.now(),"messages":[]}
 if "awaiting" not in st.session_state: st.session_state.awaiting = None
 if "last_render_count" not in st.session_state: st.session_state.last_render_count = 0  # pour autoscroll
+if "jobs" not in st.session_state: st.session_state.jobs = []  # ids des jobs d’ingestion suivis
 
 # ----------------- Helpers -----------------
 def human_size(n:int)->str:
@@ -119,6 +122,78 @@ def fetch_user_uploads():
         pass
     return []
 
+def track_job(resp):
+    try:
+        job_id = resp.json().get("job_id")
+    except Exception:
+        job_id = None
+    if job_id and job_id not in st.session_state.jobs:
+        st.session_state.jobs.append(job_id)
+
+@st.fragment(run_every=2)
+def jobs_panel():
+    """Progression des jobs d’ingestion (rafraîchie toutes les 2 s sans recharger la page)."""
+    if not st.session_state.jobs:
+        return
+    st.markdown("### ⏳ Jobs")
+    still_running = []
+    for job_id in st.session_state.jobs:
+        try:
+            job = requests.get(f"{JOBS_URL}/{job_id}", timeout=5).json()
+        except Exception as e:
+            st.caption(f"{job_id[:8]}: {e}")
+            still_running.append(job_id)
+            continue
+        label = "Reindex" if job.get("kind") == "reindex" else os.path.basename(job.get("params", {}).get("path", ""))
+        total, done = job.get("files_total") or 0, job.get("files_done") or 0
+        status = job.get("status")
+        text = f"{label} — {status} · {done}/{total} fichiers · {job.get('chunks_done', 0)} chunks"
+        if status in ("queued", "running", "cancelling"):
+            still_running.append(job_id)
+            st.progress(min(1.0, done / total) if total else 0.0, text=text)
+            if st.button("Annuler", key=f"cancel_{job_id}"):
+                requests.post(f"{JOBS_URL}/{job_id}/cancel", timeout=5)
+        elif status == "done":
+            st.success(text)
+        elif status == "cancelled":
+            st.warning(text)
+        else:
+            st.error(f"{text} {job.get('error') or ''}")
+    if not still_running and st.button("Effacer", key="clear_jobs"):
+        st.session_state.jobs = []
+        st.rerun()
+
+def iter_sse(resp):
+    """Parse a text/event-stream response into (event, data) pairs."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+def render_sources(sources):
+    for s in sources:
+        fname = html.escape(str(s.get("file","")))
+        if s.get("namespace"):
+            fname = f'{html.escape(s["namespace"])} / {fname}'
+        sc = float(s.get("score") or 0.0)
+        snip = html.escape(s.get("snippet",""))
+        # passage présent à l’identique (ou presque) dans plusieurs fichiers
+        others = [html.escape(f) for f in s.get("files") or [] if f != s.get("file")]
+        also = f'<div class="source-file">aussi dans : {", ".join(others)}</div>' if others else ""
+        st.markdown(
+            f'<div class="source-card"><div class="source-file">{fname} • score {sc:.4f}</div>{also}'
+            f'<div class="source-pre">{snip}</div></div>',
+            unsafe_allow_html=True
+        )
+
 def autoscroll():
     """Scroll en bas sans perdre la position : ne s’exécute que si
        le nombre de blocs rendus a augmenté (nouveau message)."""
@@ -150,8 +225,9 @@ with st.sidebar:
                 st.error(f"{e}")
     with c2:
         if st.button("Reindex all"):
-            r = requests.post(REINDEX_URL, json={"clear": False})
-            st.success("Reindexed") if r.ok else st.error(r.text)
+            r = requests.post(REINDEX_URL, json={"clear": False}, timeout=10)
+            if r.ok: track_job(r)
+            else: st.error(r.text)
 
     st.markdown("---")
     up_files = st.file_uploader("Ajouter (pdf/docx/txt)", type=["pdf","docx","txt"], accept_multiple_files=True, key="uploader")
@@ -164,15 +240,19 @@ with st.sidebar:
             for i,f in enumerate(up_files):
                 try:
                     resp = requests.post(DOCS_UPLOAD_URL, files={"file": (f.name, f.getvalue())}, timeout=60)
-                    if resp.ok: ok+=1
+                    if resp.ok:
+                        ok+=1
+                        track_job(resp)
                     else: st.error(f"{f.name}: {resp.text}")
                 except Exception as e:
                     st.error(f"{f.name}: {e}")
                 prog.progress(int((i+1)/len(up_files)*100))
             prog.empty()
-            if ok: st.success(f"{ok}/{len(up_files)} uploadés & indexés ✔")
+            if ok: st.success(f"{ok}/{len(up_files)} uploadés, indexation en cours ✔")
             st.rerun()
 
+    jobs_panel()
+
     # Liste uniquement des uploads manuels
     st.markdown("### 📁 Uploads")
     docs = fetch_user_uploads()
@@ -234,15 +314,7 @@ for m in msgs:
         unsafe_allow_html=True
     )
     if m.get("sources"):
-        for s in m["sources"]:
-            fname = html.escape(str(s.get("file","")))
-            sc = float(s.get("score") or 0.0)
-            snip = html.escape(s.get("snippet",""))
-            st.markdown(
-                f'<div class="source-card"><div class="source-file">{fname} • score {sc:.4f}</div>'
-                f'<div class="source-pre">{snip}</div></div>',
-                unsafe_allow_html=True
-            )
+        render_sources(m["sources"])
 
 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -278,20 +350,31 @@ st.markdown('</div>', unsafe_allow_html=True)
 # ----------------- Appel backend APRÈS rendu (pour garder l’ancrage) -----------------
 if st.session_state.awaiting:
     payload = st.session_state.awaiting
-    with st.spinner("Réflexion en cours…"):
-        try:
-            r = requests.post(ASK_URL, json={"question": payload["question"], "k": payload["k"]}, timeout=60)
+    # réponse en streaming (SSE) : les tokens s’affichent au fil de l’eau
+    bubble = st.empty()
+    bubble.markdown('<div class="chat-row assistant"><div class="chat-bubble assistant">…</div></div>',
+                    unsafe_allow_html=True)
+    answer, sources = "", []
+    try:
+        with requests.post(ASK_STREAM_URL, json={"question": payload["question"], "k": payload["k"]},
+                           stream=True, timeout=(10, 120)) as r:
             if r.ok:
-                data = r.json()
-                cur["messages"].append({
-                    "role":"assistant",
-                    "content": data.get("answer",""),
-                    "sources": data.get("sources",[])
-                })
+                for event, data in iter_sse(r):
+                    if event == "sources":
+                        sources = data
+                    elif event == "token":
+                        answer += data.get("t", "")
+                        bubble.markdown(
+                            f'<div class="chat-row assistant"><div class="chat-bubble assistant">{html.escape(answer)}▌</div></div>',
+                            unsafe_allow_html=True
+                        )
+                    elif event == "error":
+                        raise RuntimeError(data.get("error"))
+                cur["messages"].append({"role":"assistant","content": answer.strip(),"sources": sources})
             else:
                 cur["messages"].append({"role":"assistant","content": f"❌ Erreur: {r.status_code} — {r.text}"})
-        except Exception as e:
-            cur["messages"].append({"role":"assistant","content": f"❌ Connexion impossible: {e}"})
+    except Exception as e:
+        cur["messages"].append({"role":"assistant","content": f"❌ Connexion impossible: {e}"})
     st.session_state.chats[st.session_state.current_chat_id] = cur
     st.session_state.awaiting = None
     # autoscroll quand la réponse arrive